@@ -0,0 +1,270 @@
+"""
+Typeahead suggestions (brands, categories and product names) from an
+in-process prefix index.
+
+Every suggestion is indexed under each of its word starts, so "max" finds
+"Air Max 90". The normalized texts live in one string, and the index is a
+sorted array of offsets into it: a prefix lookup is a binary search for the
+range of keys starting with the query. Suggestions are numbered best first
+(brands, then categories, then products; each by number of products or
+ratings), so the best matches of a range are its smallest suggestion numbers.
+The answers for one- and two-character prefixes, whose ranges are the
+largest, are computed when the index is built.
+
+Each process builds its own index from the database on first use, inside
+that request, and rebuilds it when the catalog version moves. Nothing is
+built at import time, so no thread or connection outlives a pre-fork. A
+stale index keeps answering while the new one is built in a background
+thread, so later requests never wait for the database; the only per-request
+I/O is the catalog version read from the cache. AUTOCOMPLETE_MAX_BYTES caps
+the index size: when the catalog does not fit, the lowest-ranked products
+are left out (see benchmark_autocomplete).
+"""
+import logging
+import sys
+import threading
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+
+from .cache import get_catalog_version
+from .models import Category, Product
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 20
+MAX_QUERY_LENGTH = 100
+# Prefixes up to this length have their suggestions computed at build time.
+PRECOMPUTED_PREFIX_LENGTH = 2
+SUGGESTION_TYPES = ('brand', 'category', 'product')
+BRAND, CATEGORY, PRODUCT = range(len(SUGGESTION_TYPES))
+SEPARATOR = '\0'
+# Estimated bytes per suggestion besides its text: its display offset, type
+# and id, and one offset plus one suggestion number per indexed word start.
+SUGGESTION_OVERHEAD = 8 + 1 + 8
+KEY_OVERHEAD = 8 + 4
+
+
+def normalize(text):
+    return ' '.join(tokenize(text))
+
+
+def catalog_suggestions():
+    """
+    Yield (type, display text, id, weight) for every brand and category with
+    available products and every available product, best first within each
+    type.
+    """
+    brands = {}
+    for brand, products in Product.objects.filter(is_available=True).exclude(brand='').values_list('brand').annotate(
+        products=Count('pk')
+    ).order_by('-products', 'brand'):
+        brands.setdefault(normalize(brand), (brand, products))
+    for brand, products in brands.values():
+        yield BRAND, brand, None, products
+
+    for pk, name, products in Category.objects.annotate(
+        available_products=Count('products', filter=Q(products__is_available=True))
+    ).filter(available_products__gt=0).order_by('-available_products', 'name').values_list(
+        'pk', 'name', 'available_products'
+    ):
+        yield CATEGORY, name, pk, products
+
+    for pk, name, ratings in Product.objects.filter(is_available=True).order_by('-rating_count', '-id').values_list(
+        'pk', 'name', 'rating_count'
+    ).iterator(chunk_size=5000):
+        yield PRODUCT, name, pk, ratings
+
+
+class AutocompleteIndex:
+    """
+    Prefix index over `suggestions` ((type, display text, id, weight) in rank
+    order), holding at most `max_bytes` of estimated data.
+    """
+
+    def __init__(self, suggestions, version=None, max_bytes=None):
+        self.version = version
+        self.truncated = False
+        displays, kinds, ids, texts = [], array('b'), array('q'), []
+        size = 0
+        for kind, display, object_id, _ in suggestions:
+            text = normalize(display)
+            if not text:
+                continue
+            words = text.count(' ') + 1
+            size += 2 * len(text) + len(display) + SUGGESTION_OVERHEAD + words * KEY_OVERHEAD
+            if max_bytes is not None and size > max_bytes:
+                self.truncated = True
+                break
+            displays.append(display)
+            kinds.append(kind)
+            ids.append(object_id or 0)
+            texts.append(text)
+
+        self.displays = SEPARATOR.join(displays) + SEPARATOR
+        self.display_starts = np.r_[0, np.cumsum([len(display) + 1 for display in displays], dtype=np.int64)]
+        self.kinds = np.frombuffer(kinds, dtype=np.int8)
+        self.ids = np.frombuffer(ids, dtype=np.int64)
+        self.text = SEPARATOR.join(texts) + SEPARATOR
+
+        starts, suggestion_numbers = array('q'), array('i')
+        offset = 0
+        for number, text in enumerate(texts):
+            starts.append(offset)
+            suggestion_numbers.append(number)
+            position = text.find(' ')
+            while position != -1:
+                starts.append(offset + position + 1)
+                suggestion_numbers.append(number)
+                position = text.find(' ', position + 1)
+            offset += len(text) + 1
+        text = self.text
+        order = sorted(range(len(starts)), key=lambda key: text[starts[key]:text.find(SEPARATOR, starts[key])])
+        self.key_starts = np.frombuffer(starts, dtype=np.int64)[order]
+        self.key_suggestions = np.frombuffer(suggestion_numbers, dtype=np.int32)[order]
+        self.precomputed = self._precompute()
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by the index structures.
+        """
+        arrays = (self.display_starts, self.kinds, self.ids, self.key_starts, self.key_suggestions)
+        return (
+            sys.getsizeof(self.displays) + sys.getsizeof(self.text) + sum(values.nbytes for values in arrays)
+            + sum(sys.getsizeof(prefix) + best.nbytes for prefix, best in self.precomputed.items())
+        )
+
+    def _prefix_range(self, prefix):
+        """
+        [lo, hi) of the sorted keys that start with `prefix`.
+        """
+        text, starts, length = self.text, self.key_starts, len(prefix)
+        lo, hi = 0, len(starts)
+        while lo < hi:
+            middle = (lo + hi) // 2
+            start = starts[middle]
+            if text[start:start + length] < prefix:
+                lo = middle + 1
+            else:
+                hi = middle
+        first, hi = lo, len(starts)
+        while lo < hi:
+            middle = (lo + hi) // 2
+            start = starts[middle]
+            if text[start:start + length] <= prefix:
+                lo = middle + 1
+            else:
+                hi = middle
+        return first, lo
+
+    def _best(self, lo, hi, limit):
+        """
+        The `limit` best distinct suggestion numbers of keys [lo, hi).
+        """
+        numbers = self.key_suggestions[lo:hi]
+        # A suggestion rarely has two words starting with the same prefix, so
+        # a few times `limit` smallest numbers nearly always hold `limit`
+        # distinct ones.
+        candidates = limit * 4
+        if len(numbers) > candidates:
+            best = np.unique(np.partition(numbers, candidates - 1)[:candidates])
+            if len(best) >= limit:
+                return best[:limit]
+        return np.unique(numbers)[:limit]
+
+    def _precompute(self):
+        precomputed = {}
+        text, starts = self.text, self.key_starts.tolist()
+        for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+            run_prefix, run_start = None, 0
+            for position, start in enumerate(starts + [None]):
+                prefix = text[start:start + length] if start is not None else None
+                if prefix == run_prefix:
+                    continue
+                if run_prefix is not None and SEPARATOR not in run_prefix:
+                    precomputed[run_prefix] = self._best(run_start, position, AUTOCOMPLETE_MAX_LIMIT)
+                run_prefix, run_start = prefix, position
+        return precomputed
+
+    def suggest(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """
+        Up to `limit` suggestions for the typed `query`, as dicts of type,
+        text and id (category or product id; None for brands).
+        """
+        prefix = normalize(query[:MAX_QUERY_LENGTH])
+        if not prefix or not len(self):
+            return []
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            numbers = self.precomputed.get(prefix, self.key_suggestions[:0])[:limit]
+        else:
+            numbers = self._best(*self._prefix_range(prefix), limit)
+        suggestions = []
+        for number in numbers.tolist():
+            kind = int(self.kinds[number])
+            suggestions.append({
+                'type': SUGGESTION_TYPES[kind],
+                'text': self.displays[self.display_starts[number]:self.display_starts[number + 1] - 1],
+                'id': int(self.ids[number]) if kind != BRAND else None,
+            })
+        return suggestions
+
+
+def build_autocomplete_index(version=None):
+    return AutocompleteIndex(
+        catalog_suggestions(), version=version, max_bytes=settings.AUTOCOMPLETE_MAX_BYTES,
+    )
+
+
+_lock = threading.Lock()
+_state = {'index': None, 'refreshing': False}
+
+
+def _refresh(version):
+    try:
+        _state['index'] = build_autocomplete_index(version)
+    except Exception:
+        logger.exception('Autocomplete index refresh failed')
+    finally:
+        _state['refreshing'] = False
+        connection.close()
+
+
+def refresh_in_background(version=None):
+    """
+    Rebuild the index in a background thread, unless a rebuild is running.
+    """
+    with _lock:
+        if _state['refreshing']:
+            return
+        _state['refreshing'] = True
+    version = version if version is not None else get_catalog_version()
+    threading.Thread(target=_refresh, args=(version,), name='autocomplete-refresh', daemon=True).start()
+
+
+def get_autocomplete_index():
+    """
+    This process's index. Built on the spot the first time (or on every
+    version change when AUTOCOMPLETE_BACKGROUND_REFRESH is off); otherwise a
+    version change starts a background rebuild and the current index is
+    returned meanwhile.
+    """
+    version = get_catalog_version()
+    index = _state['index']
+    if index is not None and index.version == version:
+        return index
+    if index is None or not settings.AUTOCOMPLETE_BACKGROUND_REFRESH:
+        with _lock:
+            if _state['index'] is None or _state['index'].version != version:
+                _state['index'] = build_autocomplete_index(version)
+            return _state['index']
+    refresh_in_background(version)
+    return index
@@ -0,0 +1,142 @@
+"""
+Versioned response cache for the catalog read endpoints.
+
+Cached responses are keyed on the request path, its normalized query string
+and a catalog version counter. Any Product, Category or Tag write bumps the
+counter, which orphans every cached response at once instead of tracking
+which keys a change affects; the orphans simply expire.
+
+Rating submissions update the product aggregates with queryset updates and
+do not bump the version: a burst of reviews would otherwise empty the cache,
+so cached ratings may lag by up to CATALOG_CACHE_TIMEOUT. Stock changes from
+orders and cancellations (Prouducts.inventory) do not bump it either, or
+every checkout would empty the cache: they move the products' updated_at,
+which renews their detail responses (keyed on the ETag), while cached lists
+and facets may show the old stock for up to CATALOG_CACHE_TIMEOUT.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import Product
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_HITS_KEY = 'catalog:metrics:hits'
+CATALOG_MISSES_KEY = 'catalog:metrics:misses'
+
+
+def _initial_version():
+    # Start from the clock so a counter lost to eviction never restarts at a
+    # version whose responses may still be cached.
+    return time.time_ns() // 1000
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, _initial_version())
+    return version
+
+
+def _incr_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, _initial_version(), timeout=None)
+
+
+def bump_catalog_version():
+    """
+    Invalidate all cached catalog responses. The counter is bumped right away
+    and again once the transaction commits, so a request that reads
+    pre-commit data in between cannot leave it cached under the new version.
+    """
+    _incr_version()
+    transaction.on_commit(_incr_version)
+
+
+def invalidate_products(product_ids):
+    """
+    Mark products as changed after a write to a related row (e.g. an image):
+    moves their updated_at, and with it their ETag, and bumps the version.
+    """
+    Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+    bump_catalog_version()
+
+
+def _incr_metric(key):
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 1, timeout=None)
+
+
+def catalog_cache_stats():
+    hits = cache.get(CATALOG_HITS_KEY, 0)
+    misses = cache.get(CATALOG_MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'version': cache.get(CATALOG_VERSION_KEY),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total * 100, 2) if total else 0,
+    }
+
+
+def request_fingerprint(request):
+    """
+    Digest of the request path and its query parameters in sorted order.
+    """
+    query = sorted(
+        (name, value)
+        for name in request.query_params
+        for value in request.query_params.getlist(name)
+    )
+    return hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+
+
+def catalog_cache_key(request, version=None, etag=''):
+    key = f'catalog:{version or get_catalog_version()}:{request_fingerprint(request)}'
+    return f'{key}:{etag}' if etag else key
+
+
+def cached_catalog_value(name, compute):
+    """
+    Cache a derived catalog value (e.g. facet counts) on the current version.
+    """
+    return cache.get_or_set(
+        f'catalog:{get_catalog_version()}:{name}', compute, settings.CATALOG_CACHE_TIMEOUT
+    )
+
+
+class CatalogCacheMixin:
+    """
+    Serve GET responses from the cache until the catalog version changes.
+    Adds an X-Cache: HIT/MISS header and counts hits and misses. When an
+    ETag was computed for the request (see ConditionalGetMixin) it is part of
+    the key, so the cached body always matches the validator sent with it.
+    """
+    cache_timeout = None
+
+    def get(self, request, *args, **kwargs):
+        key = catalog_cache_key(request, etag=getattr(self, 'response_etag', ''))
+        data = cache.get(key)
+        if data is not None:
+            _incr_metric(CATALOG_HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        _incr_metric(CATALOG_MISSES_KEY)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.cache_timeout or settings.CATALOG_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,108 @@
+"""
+Conditional GET support (ETag / Last-Modified) for read endpoints.
+
+Views return their validators from a cheap query on `updated_at` before any
+serialization happens. When the client's If-None-Match or If-Modified-Since
+matches, the view answers 304 without building the body.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import cached_catalog_value, request_fingerprint
+
+
+def make_etag(*parts):
+    """
+    Strong ETag for a representation identified by `parts`.
+    """
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def object_validators(request, queryset):
+    """
+    (etag, last_modified) of the single object in `queryset` from one
+    values('updated_at') lookup, or None when it does not exist.
+    """
+    row = queryset.values('pk', 'updated_at').first()
+    if row is None:
+        return None
+    return make_etag(row['pk'], row['updated_at'].isoformat(), request_fingerprint(request)), row['updated_at']
+
+
+def list_validators(request, queryset):
+    """
+    (etag, last_modified) of a list endpoint from max(updated_at) and count.
+    """
+    stats = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('pk'))
+    last_modified = stats['last_modified']
+    etag = make_etag(
+        stats['count'], last_modified.isoformat() if last_modified else '', request_fingerprint(request)
+    )
+    return etag, last_modified
+
+
+def catalog_list_validators(request, queryset):
+    """
+    list_validators cached on the catalog version, so repeat requests for an
+    unchanged catalog do not scan the product table.
+    """
+    return cached_catalog_value(
+        f'validators:{request_fingerprint(request)}', lambda: list_validators(request, queryset)
+    )
+
+
+class ConditionalGetMixin:
+    """
+    Add ETag and Last-Modified headers to GET responses and answer 304 when
+    the request's validators match. Views implement get_validators(); plain
+    APIViews wrap their own GET body with conditional_response().
+    """
+
+    def get_validators(self):
+        """
+        Return (etag, last_modified) for the current request, or None to skip
+        conditional handling (e.g. when the object does not exist).
+        """
+        raise NotImplementedError
+
+    def personalize_validators(self, etag, last_modified):
+        """
+        Adjust the validators for per-user parts added to the response after
+        it is read from the cache. Returns (etag, last_modified).
+        """
+        return etag, last_modified
+
+    def conditional_response(self, request, respond):
+        """
+        Return a 304 when the client's copy is current, otherwise `respond()`
+        with the validators attached.
+        """
+        validators = self.get_validators()
+        if validators is None:
+            return respond()
+
+        etag, last_modified = validators
+        # The shared part of the validator; CatalogCacheMixin keys on it.
+        self.response_etag = etag
+        etag, last_modified = self.personalize_validators(etag, last_modified)
+        headers = {'ETag': etag}
+        timestamp = None
+        if last_modified is not None:
+            timestamp = int(last_modified.timestamp())
+            headers['Last-Modified'] = http_date(timestamp)
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = respond()
+            if response.status_code != 200:
+                return response
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def get(self, request, *args, **kwargs):
+        parent_get = super().get
+        return self.conditional_response(request, lambda: parent_get(request, *args, **kwargs))
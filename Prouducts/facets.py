@@ -0,0 +1,196 @@
+"""
+Precomputed catalog facet counts.
+
+Every available product contributes one to each of its facet values (brand,
+category, tags, price band, sizes and colors). Product signals apply the
+difference between a product's old and new values as +1/-1 updates on
+ProductFacet, so reading the counts is a single small query instead of one
+GROUP BY per facet. `rebuild_facets` recomputes the table from scratch.
+
+Sizes and colors only count while in stock, as the catalog filters match
+them (see ProductFilter): a size while its variant has stock, read from the
+`sizes` mirror of the variants, and the listed colors while the product has
+any. Orders and cancellations move stock without saving products, so
+Prouducts.inventory applies the size and color changes itself through
+apply_stock_facet_changes().
+"""
+from collections import Counter
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Category, Product, ProductFacet, Tag
+
+# (label, lower bound inclusive, upper bound exclusive or None)
+PRICE_BANDS = (
+    ('0-500', Decimal('0'), Decimal('500')),
+    ('500-1000', Decimal('500'), Decimal('1000')),
+    ('1000-2000', Decimal('1000'), Decimal('2000')),
+    ('2000-5000', Decimal('2000'), Decimal('5000')),
+    ('5000+', Decimal('5000'), None),
+)
+
+FACET_SOURCE_FIELDS = ('brand', 'category_id', 'price', 'sizes', 'colors', 'stock_quantity', 'is_available')
+
+
+def price_band(price):
+    price = Decimal(price)
+    for label, low, high in PRICE_BANDS:
+        if price >= low and (high is None or price < high):
+            return label
+    return None
+
+
+def _json_keys(value):
+    if isinstance(value, dict):
+        return value.keys()
+    if isinstance(value, (list, tuple)):
+        return value
+    return ()
+
+
+def _in_stock(count):
+    try:
+        return int(count) > 0
+    except (TypeError, ValueError):
+        return False
+
+
+def stock_facet_values(fields):
+    """
+    The in-stock ('size', ...) and ('color', ...) pairs of a product with
+    `fields` (as for facet_values).
+    """
+    if not fields['is_available']:
+        return set()
+    values = set()
+    if isinstance(fields['sizes'], dict):
+        values.update(('size', str(size)) for size, count in fields['sizes'].items() if _in_stock(count))
+    if (fields['stock_quantity'] or 0) > 0:
+        values.update(('color', str(color)) for color in _json_keys(fields['colors']))
+    return values
+
+
+def facet_values(fields, tag_ids):
+    """
+    Return the set of (facet, value) pairs a product with `fields` (the
+    FACET_SOURCE_FIELDS of a Product, as a dict) and `tag_ids` counts towards.
+    """
+    if not fields['is_available']:
+        return set()
+    values = {
+        ('brand', fields['brand']),
+        ('category', str(fields['category_id'])),
+    }
+    band = price_band(fields['price'])
+    if band:
+        values.add(('price', band))
+    values.update(('tag', str(tag_id)) for tag_id in tag_ids)
+    values.update(stock_facet_values(fields))
+    return values
+
+
+def product_fields(product):
+    return {field: getattr(product, field) for field in FACET_SOURCE_FIELDS}
+
+
+def stored_product_fields(product_id):
+    return Product.objects.filter(pk=product_id).values(*FACET_SOURCE_FIELDS).first()
+
+
+def _facet_filter(pairs):
+    return reduce(or_, (Q(facet=facet, value=value) for facet, value in pairs))
+
+
+def adjust_facet_counts(deltas):
+    """
+    Apply a {(facet, value): delta} mapping with one UPDATE per distinct delta.
+    """
+    deltas = {pair: delta for pair, delta in deltas.items() if delta}
+    added = [pair for pair, delta in deltas.items() if delta > 0]
+    if added:
+        ProductFacet.objects.bulk_create(
+            [ProductFacet(facet=facet, value=value) for facet, value in added],
+            ignore_conflicts=True,
+        )
+    by_delta = {}
+    for pair, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(pair)
+    for delta, pairs in by_delta.items():
+        ProductFacet.objects.filter(_facet_filter(pairs)).update(count=F('count') + delta)
+
+
+def apply_facet_changes(previous, current):
+    """
+    Move counts from the `previous` facet values of a product to `current`.
+    """
+    deltas = Counter(current - previous)
+    deltas.subtract(previous - current)
+    adjust_facet_counts(deltas)
+
+
+def apply_stock_facet_changes(previous, current):
+    """
+    Move size and color counts of products whose stock changed, from
+    {product id: fields} before and after the change.
+    """
+    deltas = Counter()
+    for product_id, fields in current.items():
+        before = stock_facet_values(previous[product_id]) if product_id in previous else set()
+        after = stock_facet_values(fields)
+        deltas.update(after - before)
+        deltas.subtract(before - after)
+    adjust_facet_counts(deltas)
+
+
+def tag_link_deltas(links, sign):
+    """
+    Facet deltas for adding (sign=1) or removing (sign=-1) product-tag links,
+    given as (product_is_available, tag_id) pairs.
+    """
+    deltas = Counter()
+    for is_available, tag_id in links:
+        if is_available:
+            deltas[('tag', str(tag_id))] += sign
+    return deltas
+
+
+@transaction.atomic
+def rebuild_facets():
+    counts = Counter()
+    tag_ids = {}
+    for product_id, tag_id in Product.tags.through.objects.values_list('product_id', 'tag_id'):
+        tag_ids.setdefault(product_id, []).append(tag_id)
+    products = Product.objects.filter(is_available=True).values('id', *FACET_SOURCE_FIELDS)
+    for fields in products.iterator(chunk_size=2000):
+        counts.update(facet_values(fields, tag_ids.get(fields['id'], ())))
+    ProductFacet.objects.all().delete()
+    ProductFacet.objects.bulk_create(
+        [ProductFacet(facet=facet, value=value, count=count) for (facet, value), count in counts.items()],
+        batch_size=1000,
+    )
+    return len(counts)
+
+
+def facet_counts():
+    """
+    Facet counts for the storefront, most common values first. Category and
+    tag values are ids and carry their display name as `label`.
+    """
+    facets = {facet: [] for facet, _ in ProductFacet.FACET_CHOICES}
+    rows = ProductFacet.objects.filter(count__gt=0).order_by('facet', '-count', 'value')
+    for facet, value, count in rows.values_list('facet', 'value', 'count'):
+        facets[facet].append({'value': value, 'count': count})
+
+    labels = {
+        'category': Category.objects.in_bulk([int(v['value']) for v in facets['category']]),
+        'tag': Tag.objects.in_bulk([int(v['value']) for v in facets['tag']]),
+    }
+    for facet, objects in labels.items():
+        for entry in facets[facet]:
+            obj = objects.get(int(entry['value']))
+            entry['label'] = obj.name if obj else None
+    return facets
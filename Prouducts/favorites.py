@@ -0,0 +1,69 @@
+"""
+Favorite status for product grids.
+
+Catalog responses are cached once for everyone (see cache.py), so the
+per-user `is_favorite` flag of HomeProductSerializer is serialized as False
+and filled in afterwards by FavoriteStatusMixin: one values_list() query on
+Favorite(user, product) for the ids of the page, whether the page came from
+the cache or not.
+"""
+from django.db.models import Count, Max
+from django.utils.cache import patch_vary_headers
+
+from .conditional import make_etag
+from .models import Favorite
+
+# Most product ids accepted by the batch favorite-status endpoint.
+FAVORITE_STATUS_MAX_IDS = 100
+
+
+def favorite_product_ids(user, product_ids):
+    """
+    The subset of `product_ids` that `user` has favorited, from one query.
+    """
+    return set(
+        Favorite.objects.filter(user=user, product_id__in=product_ids).values_list('product_id', flat=True)
+    )
+
+
+def favorites_fingerprint(user):
+    """
+    (count, latest created_at) of the user's favorites: changes whenever a
+    favorite is added or removed.
+    """
+    stats = Favorite.objects.filter(user=user).aggregate(count=Count('pk'), last_added=Max('created_at'))
+    return stats['count'], stats['last_added'].isoformat() if stats['last_added'] else ''
+
+
+def mark_favorites(user, data):
+    """
+    Set `is_favorite` on the serialized products of a list response, plain
+    or paginated. Products serialized without the flag are left alone.
+    """
+    items = data.get('results', []) if isinstance(data, dict) else data
+    items = [item for item in items if 'is_favorite' in item]
+    if not items:
+        return
+    favorites = favorite_product_ids(user, [item['id'] for item in items])
+    for item in items:
+        item['is_favorite'] = item['id'] in favorites
+
+
+class FavoriteStatusMixin:
+    """
+    Fill in `is_favorite` for the signed-in user on top of cached product
+    lists. With ConditionalGetMixin the user's favorites become part of the
+    ETag; Last-Modified is dropped because removals leave no timestamp.
+    """
+
+    def personalize_validators(self, etag, last_modified):
+        if not self.request.user.is_authenticated:
+            return etag, last_modified
+        return make_etag(etag, *favorites_fingerprint(self.request.user)), None
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200 and request.user.is_authenticated:
+            mark_favorites(request.user, response.data)
+        patch_vary_headers(response, ('Authorization',))
+        return response
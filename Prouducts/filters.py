@@ -0,0 +1,49 @@
+from django.db.models import Exists, OuterRef, Q
+from django_filters import rest_framework as filters
+
+from .facets import PRICE_BANDS
+from .models import Product, ProductVariant
+
+
+def _in_stock_variants(**lookups):
+    return Exists(ProductVariant.objects.filter(product=OuterRef('pk'), stock__gt=0, **lookups))
+
+
+class ProductFilter(filters.FilterSet):
+    brand = filters.CharFilter(field_name='brand', lookup_expr='iexact')
+    category = filters.NumberFilter(field_name='category_id')
+    tag = filters.NumberFilter(field_name='tags__id')
+    min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
+    min_effective_price = filters.NumberFilter(field_name='effective_price', lookup_expr='gte')
+    max_effective_price = filters.NumberFilter(field_name='effective_price', lookup_expr='lte')
+    price_band = filters.ChoiceFilter(
+        choices=[(label, label) for label, _, _ in PRICE_BANDS],
+        method='filter_price_band',
+    )
+    size = filters.CharFilter(method='filter_size')
+    color = filters.CharFilter(method='filter_color')
+
+    class Meta:
+        model = Product
+        fields = [
+            'brand', 'category', 'tag', 'min_price', 'max_price', 'min_effective_price', 'max_effective_price',
+            'price_band', 'size', 'color',
+        ]
+
+    def filter_price_band(self, queryset, name, value):
+        for label, low, high in PRICE_BANDS:
+            if label == value:
+                queryset = queryset.filter(price__gte=low)
+                return queryset.filter(price__lt=high) if high is not None else queryset
+        return queryset
+
+    def filter_size(self, queryset, name, value):
+        return queryset.filter(_in_stock_variants(size=value))
+
+    def filter_color(self, queryset, name, value):
+        # Products tracking stock per size list their colors without a
+        # per-color count; those match while the product has stock.
+        return queryset.filter(
+            _in_stock_variants(color=value) | Q(colors__has_key=value, stock_quantity__gt=0)
+        )
@@ -0,0 +1,108 @@
+"""
+Resized renditions of product images.
+
+Every ProductImage gets thumbnail, card and zoom widths in WebP and JPEG,
+stored next to the original (products/shoe.jpg -> products/shoe_card.webp).
+ProductImage.derivatives records them as:
+
+    {'source': 'products/shoe.jpg',
+     'sizes': {'card': {'width': 400, 'height': 300,
+                        'webp': 'products/shoe_card.webp',
+                        'jpeg': 'products/shoe_card.jpg'}, ...}}
+
+`source` tells whether the renditions belong to the current upload, so
+processing an image twice is a no-op. Generation runs on the Celery worker
+pool (Prouducts.tasks); `generate_image_derivatives` backfills in bulk.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .cache import invalidate_products
+from .models import ProductImage
+
+# Largest first: each size is scaled down from the previous one.
+DERIVATIVE_WIDTHS = (
+    ('zoom', 1200),
+    ('card', 400),
+    ('thumbnail', 150),
+)
+DERIVATIVE_FORMATS = (
+    ('webp', 'webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'jpg', 'JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+)
+
+
+def needs_derivatives(product_image):
+    return bool(product_image.image) and product_image.derivatives.get('source') != product_image.image.name
+
+
+def _encode(image, pil_format, options):
+    buffer = BytesIO()
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def _delete_files(storage, derivatives):
+    for rendition in derivatives.get('sizes', {}).values():
+        for key, _, _, _ in DERIVATIVE_FORMATS:
+            if rendition.get(key):
+                storage.delete(rendition[key])
+
+
+def build_derivatives(product_image):
+    """
+    Render and store every size/format of `product_image` and return the
+    `derivatives` mapping. Images are never scaled up.
+    """
+    field = product_image.image
+    storage = field.storage
+    with field.open('rb') as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    stem = os.path.splitext(field.name)[0]
+    sizes = {}
+    for name, width in DERIVATIVE_WIDTHS:
+        if image.width > width:
+            image = image.resize((width, max(round(image.height * width / image.width), 1)), Image.LANCZOS)
+        rendition = {'width': image.width, 'height': image.height}
+        for key, extension, pil_format, options in DERIVATIVE_FORMATS:
+            rendition[key] = storage.save(f'{stem}_{name}.{extension}', _encode(image, pil_format, options))
+        sizes[name] = rendition
+    return {'source': field.name, 'sizes': sizes}
+
+
+def process_product_image(image_id, force=False):
+    """
+    Generate the derivatives of one ProductImage unless they are current.
+    Returns True when renditions were written.
+    """
+    product_image = ProductImage.objects.filter(pk=image_id).first()
+    if product_image is None or not (force or needs_derivatives(product_image)):
+        return False
+    previous = product_image.derivatives
+    derivatives = build_derivatives(product_image)
+    updated = ProductImage.objects.filter(pk=image_id, image=product_image.image.name).update(derivatives=derivatives)
+    if not updated:
+        # The image was replaced or deleted meanwhile; drop what we rendered.
+        _delete_files(product_image.image.storage, derivatives)
+        return False
+    _delete_files(product_image.image.storage, previous)
+    invalidate_products([product_image.product_id])
+    return True
+
+
+def srcset(derivatives, key, url):
+    """
+    `srcset` attribute value for one format, e.g. "a_thumbnail.webp 150w, ...".
+    """
+    renditions = sorted(derivatives.get('sizes', {}).values(), key=lambda rendition: rendition['width'])
+    return ', '.join(f"{url(rendition[key])} {rendition['width']}w" for rendition in renditions if rendition.get(key))
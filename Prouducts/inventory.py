@@ -0,0 +1,259 @@
+"""
+Per-size/per-color inventory.
+
+ProductVariant rows hold the stock. The legacy JSON fields stay as the write
+format of the dashboard and as a read-only mirror for clients:
+
+* saving a Product turns its `sizes` JSON (or `colors` when there are no
+  sizes) into variant rows, and `stock_quantity` becomes their total;
+* stock changes on variants (orders, cancellations) are written back into
+  the JSON and `stock_quantity` by refresh_product_stock().
+
+Products without sizes or colors, or whose `sizes` is a plain list without
+counts, have no variants and keep a free-standing `stock_quantity`.
+
+reserve_stock() and restock() move the stock of a whole order with one
+conditional UPDATE per table (stock = stock - CASE id WHEN ... END WHERE
+stock >= the same CASE), so an order either gets all its lines or none and
+stock never goes below zero. Both first lock the order's product rows in id
+order; as every stock change takes that lock first, concurrent orders over
+the same products queue up instead of deadlocking. They also move the size
+and color facets of the products whose stock runs out or comes back.
+"""
+from django.db import transaction
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Value, When
+from django.utils import timezone
+
+from .facets import FACET_SOURCE_FIELDS, apply_stock_facet_changes
+from .models import Product, ProductVariant
+
+
+def _stock(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def variant_stock_from_json(sizes, colors):
+    """
+    {(size, color): stock} described by a product's `sizes`/`colors` JSON.
+    Stock is tracked per size when sizes are given, per color otherwise.
+    Sizes listed without counts describe no variants.
+    """
+    if sizes and isinstance(sizes, dict):
+        return {(str(size), ''): _stock(stock) for size, stock in sizes.items()}
+    if sizes:
+        return {}
+    if colors and isinstance(colors, dict):
+        return {('', str(color)): _stock(stock) for color, stock in colors.items()}
+    return {}
+
+
+def derived_stock_quantity(sizes, colors):
+    """
+    Total stock of the variants described by the JSON, or None when the
+    product has no variants.
+    """
+    stock = variant_stock_from_json(sizes, colors)
+    return sum(stock.values()) if stock else None
+
+
+def sync_variants(products):
+    """
+    Make the variant rows of `products` match their `sizes`/`colors` JSON.
+    """
+    stock = {product.pk: variant_stock_from_json(product.sizes, product.colors) for product in products}
+    existing = ProductVariant.objects.filter(product_id__in=stock).values_list('pk', 'product_id', 'size', 'color')
+    stale = [pk for pk, product_id, size, color in existing if (size, color) not in stock[product_id]]
+    if stale:
+        ProductVariant.objects.filter(pk__in=stale).delete()
+    ProductVariant.objects.bulk_create(
+        [
+            ProductVariant(product_id=product_id, size=size, color=color, stock=count)
+            for product_id, variants in stock.items()
+            for (size, color), count in variants.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['product', 'size', 'color'],
+        update_fields=['stock'],
+        batch_size=1000,
+    )
+
+
+def refresh_product_stock(product_ids):
+    """
+    Write variant stock back into Product.sizes/colors and stock_quantity.
+    Moves the products' updated_at, and with it their detail ETag and cache
+    entry, but not the catalog version (see Prouducts.cache).
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    variants = {}
+    for product_id, size, color, stock in ProductVariant.objects.filter(product_id__in=product_ids).values_list(
+        'product_id', 'size', 'color', 'stock'
+    ):
+        variants.setdefault(product_id, []).append((size, color, stock))
+
+    now = timezone.now()
+    products = list(Product.objects.filter(pk__in=variants).only('id', 'sizes', 'colors'))
+    for product in products:
+        rows = variants[product.pk]
+        sizes = {size: stock for size, color, stock in rows if size and not color}
+        colors = {color: stock for size, color, stock in rows if color and not size}
+        if sizes:
+            product.sizes = sizes
+        if colors:
+            product.colors = colors
+        product.stock_quantity = sum(stock for _, _, stock in rows)
+        product.updated_at = now
+    Product.objects.bulk_update(products, ['sizes', 'colors', 'stock_quantity', 'updated_at'])
+
+
+def resolve_variants(lines):
+    """
+    Map (product_id, size, color) lines to variant ids with one query. A line
+    matches its exact size and color, else the size's color-less row, else
+    the color's size-less row. Unmatched lines map to None.
+    """
+    lines = list(lines)
+    product_ids = {product_id for product_id, _, _ in lines}
+    variants = {
+        (product_id, size, color): pk
+        for pk, product_id, size, color in ProductVariant.objects.filter(product_id__in=product_ids).values_list(
+            'pk', 'product_id', 'size', 'color'
+        )
+    } if product_ids else {}
+    return {
+        (product_id, size, color): (
+            variants.get((product_id, size, color))
+            or variants.get((product_id, size, ''))
+            or variants.get((product_id, '', color))
+        )
+        for product_id, size, color in lines
+    }
+
+
+class InsufficientStock(Exception):
+    """
+    An order asks for more than is in stock; nothing was reserved.
+    """
+
+
+def _order_quantities(lines):
+    """
+    Quantities of (product_id, variant_id, quantity) lines added up per
+    variant, and per product for lines without a variant.
+    """
+    variants, products = {}, {}
+    for product_id, variant_id, quantity in lines:
+        if variant_id:
+            variants[variant_id] = variants.get(variant_id, 0) + quantity
+        else:
+            products[product_id] = products.get(product_id, 0) + quantity
+    return variants, products
+
+
+def _per_row(quantities):
+    """
+    CASE expression giving each row's quantity by primary key.
+    """
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in sorted(quantities.items())],
+        output_field=IntegerField(),
+    )
+
+
+def _facet_fields(queryset, *extra):
+    return {row['id']: row for row in queryset.values('id', *extra, *FACET_SOURCE_FIELDS)}
+
+
+def _lock_products(product_ids):
+    """
+    Lock the products' rows in id order. Returns {id: row} with the name,
+    whether the product has variants and its facet fields.
+    """
+    return _facet_fields(Product.objects.select_for_update().filter(pk__in=product_ids).annotate(
+        has_variants=Exists(ProductVariant.objects.filter(product=OuterRef('pk')))
+    ).order_by('pk'), 'name', 'has_variants')
+
+
+def _update_stock_facets(locked):
+    """
+    Move the size and color facets of the `locked` products to their stock
+    after the change.
+    """
+    apply_stock_facet_changes(locked, _facet_fields(Product.objects.filter(pk__in=locked)))
+
+
+@transaction.atomic
+def reserve_stock(lines):
+    """
+    Take (product_id, variant_id, quantity) lines out of stock, all or
+    nothing. Lines without a variant come out of stock_quantity, which only
+    products without variants have: on other products such a line names a
+    size or color that is not stocked. Raises InsufficientStock naming the
+    first line that cannot be served.
+    """
+    lines = list(lines)
+    variants, products = _order_quantities(lines)
+    locked = _lock_products({product_id for product_id, _, _ in lines})
+
+    for pk, product_id, size, color, stock in ProductVariant.objects.filter(pk__in=variants).order_by('pk').values_list(
+        'pk', 'product_id', 'size', 'color', 'stock'
+    ):
+        if stock < variants[pk]:
+            name = f"{locked[product_id]['name']} {size} {color}".strip()
+            raise InsufficientStock(f'Not enough stock for {name}.')
+    for product_id, quantity in sorted(products.items()):
+        if product_id not in locked:
+            raise InsufficientStock(f'Not enough stock for {product_id}.')
+        product = locked[product_id]
+        if product['has_variants']:
+            raise InsufficientStock(f"{product['name']} is not stocked in the selected size or color.")
+        if product['stock_quantity'] < quantity:
+            raise InsufficientStock(f"Not enough stock for {product['name']}.")
+
+    # The checks above hold as long as the product locks do; the conditions
+    # below still keep stock from going negative where rows are not locked
+    # (SQLite ignores SELECT ... FOR UPDATE).
+    if variants:
+        amount = _per_row(variants)
+        if ProductVariant.objects.filter(pk__in=variants, stock__gte=amount).update(
+            stock=F('stock') - amount
+        ) < len(variants):
+            raise InsufficientStock('Not enough stock for this order.')
+    if products:
+        amount = _per_row(products)
+        if Product.objects.filter(pk__in=products, stock_quantity__gte=amount).update(
+            stock_quantity=F('stock_quantity') - amount, updated_at=timezone.now()
+        ) < len(products):
+            raise InsufficientStock('Not enough stock for this order.')
+    refresh_product_stock({product_id for product_id, variant_id, _ in lines if variant_id})
+    _update_stock_facets(locked)
+
+
+@transaction.atomic
+def restock(lines):
+    """
+    Put (product_id, variant_id, quantity) lines back into stock, e.g. when an
+    order is cancelled. Lines without a variant go to stock_quantity on
+    products without variants; on other products their size or color is no
+    longer stocked (the variant was removed), so they are left out.
+    """
+    lines = list(lines)
+    variants, products = _order_quantities(lines)
+    locked = _lock_products({product_id for product_id, _, _ in lines})
+    products = {
+        product_id: quantity for product_id, quantity in products.items()
+        if product_id in locked and not locked[product_id]['has_variants']
+    }
+    if variants:
+        ProductVariant.objects.filter(pk__in=variants).update(stock=F('stock') + _per_row(variants))
+    if products:
+        Product.objects.filter(pk__in=products).update(
+            stock_quantity=F('stock_quantity') + _per_row(products), updated_at=timezone.now()
+        )
+    refresh_product_stock({product_id for product_id, variant_id, _ in lines if variant_id})
+    _update_stock_facets(locked)
@@ -0,0 +1,69 @@
+import random
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from Prouducts.autocomplete import BRAND, CATEGORY, PRODUCT, AutocompleteIndex
+
+
+class Command(BaseCommand):
+    help = 'Time the autocomplete index build and its lookups against catalog size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000', help='Comma-separated catalog sizes')
+        parser.add_argument('--queries', type=int, default=20000, help='Lookups timed per size')
+        parser.add_argument('--max-bytes', type=int, default=settings.AUTOCOMPLETE_MAX_BYTES,
+                            help='Index memory budget')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        syllables = ['ka', 're', 'mo', 'ti', 'lu', 'sa', 'ne', 'po', 'vi', 'da', 'ro', 'fe', 'zu', 'gi', 'xo', 'be']
+        vocabulary = [''.join(rng.choices(syllables, k=rng.randint(2, 4))).title() for _ in range(5000)]
+        self.stdout.write(
+            f'{"products":>10} {"build":>8} {"peak MB":>8} {"index MB":>9} {"indexed":>8} '
+            f'{"p50 ms":>7} {"p99 ms":>7} {"max ms":>7}'
+        )
+        for size in (int(value) for value in options['sizes'].split(',')):
+            brands = vocabulary[:200]
+            categories = vocabulary[200:260]
+            names = [
+                ' '.join([rng.choice(brands)] + rng.choices(vocabulary, k=rng.randint(1, 4)) + [str(rng.randint(1, 999))])
+                for _ in range(size)
+            ]
+            suggestions = (
+                [(BRAND, brand, None, 0) for brand in brands]
+                + [(CATEGORY, category, number, 0) for number, category in enumerate(categories, 1)]
+                + [(PRODUCT, name, number, 0) for number, name in enumerate(names, 1)]
+            )
+
+            start = time.perf_counter()
+            index = AutocompleteIndex(suggestions, max_bytes=options['max_bytes'])
+            built = time.perf_counter() - start
+            # Tracing slows the build down, so the peak is measured separately.
+            tracemalloc.start()
+            AutocompleteIndex(suggestions, max_bytes=options['max_bytes'])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            # Keystrokes: prefixes of 1 to 12 characters of a word of a name.
+            queries = []
+            for _ in range(options['queries']):
+                words = rng.choice(names).split()
+                typed = ' '.join(words[rng.randrange(len(words)):])
+                queries.append(typed[:rng.randint(1, 12)])
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                index.suggest(query)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+
+            def percentile(share):
+                return timings[min(len(timings) - 1, int(len(timings) * share))] * 1000
+
+            self.stdout.write(
+                f'{size:>10} {built:>7.2f}s {peak / 2 ** 20:>8.1f} {index.nbytes / 2 ** 20:>9.1f} {len(index):>8} '
+                f'{percentile(0.5):>7.3f} {percentile(0.99):>7.3f} {timings[-1] * 1000:>7.3f}'
+            )
@@ -0,0 +1,89 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.pagination import Cursor
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory
+
+from Prouducts.cache import bump_catalog_version
+from Prouducts.models import Category, Product
+from Prouducts.pagination import ProductCursorPagination
+from Prouducts.views import HomeProductListView
+
+
+class Command(BaseCommand):
+    help = 'Compare page 1 and a deep page of the home feed in cursor and page-number mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000, help='Number of products to generate')
+        parser.add_argument('--page', type=int, default=5000, help='Deep page number to measure')
+        parser.add_argument('--repeat', type=int, default=20, help='Requests per measurement')
+
+    def handle(self, *args, **options):
+        page_size = api_settings.PAGE_SIZE
+        products = options['products']
+        page = min(options['page'], products // page_size)
+        repeat = options['repeat']
+
+        # Everything runs inside one transaction that is rolled back at the end,
+        # so the benchmark never leaves rows behind.
+        with transaction.atomic():
+            category = Category.objects.create(name='Benchmark')
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        name=f'Benchmark shoe {i}',
+                        brand='Benchmark',
+                        description='Benchmark product',
+                        price=100,
+                        category=category,
+                    )
+                    for i in range(products)
+                ],
+                batch_size=1000,
+            )
+
+            url = '/products/home-products/'
+            deep_cursor_url = self.cursor_url(url, (page - 1) * page_size)
+            results = [
+                ('page-number, page 1', f'{url}?pagination=page'),
+                (f'page-number, page {page}', f'{url}?page={page}'),
+                ('cursor, page 1', url),
+                (f'cursor, page {page}', deep_cursor_url),
+            ]
+            for label, target in results:
+                timings = self.measure(target, repeat)
+                self.stdout.write(
+                    f'{label:<28} median {statistics.median(timings):8.2f} ms   '
+                    f'max {max(timings):8.2f} ms'
+                )
+
+            transaction.set_rollback(True)
+
+    def cursor_url(self, url, offset):
+        """
+        Build the cursor a client would hold after walking `offset` rows.
+        """
+        if offset == 0:
+            return url
+        paginator = ProductCursorPagination()
+        paginator.base_url = url
+        last_seen = HomeProductListView.queryset[offset - 1:offset].get()
+        position = paginator._get_position_from_instance(last_seen, paginator.ordering)
+        return paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def measure(self, url, repeat):
+        factory = APIRequestFactory()
+        view = HomeProductListView.as_view()
+        timings = []
+        for _ in range(repeat):
+            # Measure the database path, not the catalog response cache.
+            bump_catalog_version()
+            request = factory.get(url)
+            start = time.perf_counter()
+            response = view(request)
+            response.render()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
@@ -0,0 +1,38 @@
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from Prouducts.similarity import TfidfMatrix
+
+
+class Command(BaseCommand):
+    help = 'Time the similar-products build (TF-IDF matrix and blocked top-K) against catalog size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,50000', help='Comma-separated catalog sizes')
+        parser.add_argument('--vocabulary', type=int, default=20000, help='Distinct words in the generated text')
+        parser.add_argument('--words', type=int, default=60, help='Words per generated product')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        self.stdout.write(f'{"products":>10} {"matrix":>10} {"top-k":>10} {"peak MB":>10}')
+        for size in (int(value) for value in options['sizes'].split(',')):
+            # Zipf-distributed words, like real product text.
+            words = rng.zipf(1.3, size=(size, options['words'])) % options['vocabulary']
+            documents = [(product_id, Counter(f'w{word}' for word in row.tolist())) for product_id, row in enumerate(words, 1)]
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            matrix = TfidfMatrix(documents)
+            built = time.perf_counter()
+            for _ in matrix.top_neighbors(np.arange(len(matrix))):
+                pass
+            ranked = time.perf_counter()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.stdout.write(
+                f'{size:>10} {built - start:>9.2f}s {ranked - built:>9.2f}s {peak / 2 ** 20:>10.1f}'
+            )
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from Prouducts.recommendations import ORDER_BATCH_SIZE, update_related_products
+
+
+class Command(BaseCommand):
+    help = 'Update "customers also bought" recommendations from orders placed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Discard stored counts and rebuild from every order')
+        parser.add_argument('--batch-size', type=int, default=ORDER_BATCH_SIZE, help='Orders read per transaction')
+
+    def handle(self, *args, **options):
+        orders, products = update_related_products(full=options['full'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Read {orders} orders, re-ranked {products} products'))
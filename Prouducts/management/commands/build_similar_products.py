@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from Prouducts.similarity import update_similar_products
+
+
+class Command(BaseCommand):
+    help = 'Update content-based similar products for products changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Re-rank every product')
+
+    def handle(self, *args, **options):
+        products = update_similar_products(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Re-ranked {products} products'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from Prouducts.cache import catalog_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the catalog response cache'
+
+    def handle(self, *args, **options):
+        stats = catalog_cache_stats()
+        self.stdout.write(
+            f"version={stats['version']} hits={stats['hits']} misses={stats['misses']} "
+            f"hit_rate={stats['hit_rate']}%"
+        )
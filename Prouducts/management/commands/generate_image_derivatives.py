@@ -0,0 +1,39 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from Prouducts.images import needs_derivatives, process_product_image
+from Prouducts.models import ProductImage
+from Prouducts.tasks import generate_image_derivatives
+
+
+def _process(image_id, force):
+    try:
+        return process_product_image(image_id, force=force)
+    finally:
+        # Worker threads open their own connection.
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnail/card/zoom renditions of product images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help='Images processed concurrently')
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that are already current')
+        parser.add_argument('--enqueue', action='store_true', help='Queue the images on the Celery workers instead')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.only('id', 'image', 'derivatives').order_by('id')
+        image_ids = [image.pk for image in images.iterator() if options['force'] or needs_derivatives(image)]
+        if options['enqueue']:
+            for image_id in image_ids:
+                generate_image_derivatives.delay(image_id, force=options['force'])
+            self.stdout.write(self.style.SUCCESS(f'Queued {len(image_ids)} images'))
+            return
+
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            processed = sum(pool.map(lambda image_id: _process(image_id, options['force']), image_ids))
+        self.stdout.write(self.style.SUCCESS(f'Generated renditions for {processed} of {len(image_ids)} images'))
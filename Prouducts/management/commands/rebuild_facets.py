@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from Prouducts.cache import bump_catalog_version
+from Prouducts.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = 'Recompute catalog facet counts from the product table'
+
+    def handle(self, *args, **options):
+        values = rebuild_facets()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {values} facet values'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from Prouducts.cache import bump_catalog_version
+from Prouducts.ratings import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute rating average, count and histogram for every product from the Rating table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Products written per bulk update')
+
+    def handle(self, *args, **options):
+        rebuild_rating_aggregates(batch_size=options['batch_size'])
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS('Rating aggregates rebuilt'))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0004_rating_comment_rating_created_at_rating_rating_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['-created_at', '-id'], name='product_avail_created_idx'),
+        ),
+    ]
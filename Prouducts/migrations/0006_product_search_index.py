@@ -0,0 +1,56 @@
+from django.db import migrations
+
+POSTGRES_CREATE = [
+    """
+    ALTER TABLE "Prouducts_product" ADD COLUMN "search_vector" tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce("name", '')), 'A') ||
+        setweight(to_tsvector('english', coalesce("brand", '')), 'B') ||
+        setweight(to_tsvector('english', coalesce("description", '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX "product_search_vector_gin" ON "Prouducts_product" USING gin ("search_vector")',
+]
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS "product_search_vector_gin"',
+    'ALTER TABLE "Prouducts_product" DROP COLUMN IF EXISTS "search_vector"',
+]
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE "Prouducts_product_fts" USING fts5(
+        name, brand, description,
+        tokenize = 'porter unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO "Prouducts_product_fts" (rowid, name, brand, description)
+    SELECT id, name, brand, description FROM "Prouducts_product"
+    """,
+]
+SQLITE_DROP = [
+    'DROP TABLE IF EXISTS "Prouducts_product_fts"',
+]
+
+
+def run_statements(create):
+    def run(apps, schema_editor):
+        statements = {
+            'postgresql': POSTGRES_CREATE if create else POSTGRES_DROP,
+            'sqlite': SQLITE_CREATE if create else SQLITE_DROP,
+        }.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0005_product_avail_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_statements(create=True), run_statements(create=False)),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:11
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def populate_facets(apps, schema_editor):
+    from Prouducts.facets import FACET_SOURCE_FIELDS, facet_values
+
+    Product = apps.get_model('Prouducts', 'Product')
+    ProductFacet = apps.get_model('Prouducts', 'ProductFacet')
+    tag_ids = {}
+    for product_id, tag_id in Product.tags.through.objects.values_list('product_id', 'tag_id'):
+        tag_ids.setdefault(product_id, []).append(tag_id)
+    counts = Counter()
+    for fields in Product.objects.filter(is_available=True).values('id', *FACET_SOURCE_FIELDS).iterator():
+        counts.update(facet_values(fields, tag_ids.get(fields['id'], ())))
+    ProductFacet.objects.bulk_create(
+        [ProductFacet(facet=facet, value=value, count=count) for (facet, value), count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('brand', 'Brand'), ('category', 'Category'), ('tag', 'Tag'), ('price', 'Price band'), ('size', 'Size'), ('color', 'Color')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value'), name='unique_product_facet_value')],
+            },
+        ),
+        migrations.RunPython(populate_facets, migrations.RunPython.noop),
+    ]
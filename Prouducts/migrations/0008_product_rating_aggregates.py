@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:13
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('Prouducts', 'Product')
+    Rating = apps.get_model('Prouducts', 'Rating')
+    levels = (1, 2, 3, 4, 5)
+    stats = (
+        Rating.objects.filter(rating__in=levels)
+        .values('product_id')
+        .annotate(
+            total=Sum('rating'),
+            count=Count('id'),
+            **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in levels}
+        )
+        .order_by()
+    )
+    for row in stats:
+        Product.objects.filter(pk=row['product_id']).update(
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            rating_avg=round(row['total'] / row['count'], 2),
+            **{f'rating_{stars}': row[f'stars_{stars}'] for stars in levels}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0007_productfacet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_avg',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:15
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Max, Q, Sum
+
+
+def remove_duplicate_ratings(apps, schema_editor):
+    """
+    Keep only the most recent rating per (user, product) and recompute the
+    aggregates of the products that had duplicates.
+    """
+    Product = apps.get_model('Prouducts', 'Product')
+    Rating = apps.get_model('Prouducts', 'Rating')
+    duplicates = (
+        Rating.objects.values('user_id', 'product_id')
+        .annotate(rows=Count('id'), keep=Max('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    product_ids = set()
+    for row in duplicates:
+        Rating.objects.filter(user_id=row['user_id'], product_id=row['product_id']).exclude(pk=row['keep']).delete()
+        product_ids.add(row['product_id'])
+
+    levels = (1, 2, 3, 4, 5)
+    for product_id in product_ids:
+        stats = Rating.objects.filter(product_id=product_id, rating__in=levels).aggregate(
+            total=Sum('rating'),
+            count=Count('id'),
+            **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in levels}
+        )
+        count = stats['count']
+        Product.objects.filter(pk=product_id).update(
+            rating_sum=stats['total'] or 0,
+            rating_count=count,
+            rating_avg=round(stats['total'] / count, 2) if count else 0,
+            **{f'rating_{stars}': stats[f'stars_{stars}'] for stars in levels}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0008_product_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_ratings, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='rating',
+            unique_together={('user', 'product')},
+        ),
+    ]
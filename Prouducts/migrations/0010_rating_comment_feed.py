@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:16
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_comment_counts(apps, schema_editor):
+    Product = apps.get_model('Prouducts', 'Product')
+    Rating = apps.get_model('Prouducts', 'Rating')
+    counts = (
+        Rating.objects.filter(comment__isnull=False).exclude(comment='')
+        .values('product_id')
+        .annotate(comments=Count('id'))
+        .order_by()
+    )
+    for row in counts:
+        Product.objects.filter(pk=row['product_id']).update(comment_count=row['comments'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0009_rating_unique_user_product'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='comment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='rating',
+            name='helpful_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['product', '-created_at'], name='rating_product_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['product', '-helpful_count', '-created_at'], name='rating_product_helpful_idx'),
+        ),
+        migrations.RunPython(populate_comment_counts, migrations.RunPython.noop),
+    ]
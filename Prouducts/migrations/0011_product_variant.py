@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _stock(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def populate_variants(apps, schema_editor):
+    """
+    One variant per size when `sizes` maps sizes to stock, per color when
+    `colors` does. Products listing sizes without counts are left alone and
+    keep their stock_quantity.
+    """
+    Product = apps.get_model('Prouducts', 'Product')
+    ProductVariant = apps.get_model('Prouducts', 'ProductVariant')
+    variants = []
+    for product in Product.objects.only('id', 'sizes', 'colors', 'stock_quantity').iterator(chunk_size=1000):
+        if product.sizes and isinstance(product.sizes, dict):
+            stock = {(str(size), ''): _stock(count) for size, count in product.sizes.items()}
+        elif product.sizes:
+            continue
+        elif product.colors and isinstance(product.colors, dict):
+            stock = {('', str(color)): _stock(count) for color, count in product.colors.items()}
+        else:
+            continue
+        variants.extend(
+            ProductVariant(product_id=product.pk, size=size, color=color, stock=count)
+            for (size, color), count in stock.items()
+        )
+        if product.stock_quantity != sum(stock.values()):
+            Product.objects.filter(pk=product.pk).update(stock_quantity=sum(stock.values()))
+        if len(variants) >= 1000:
+            ProductVariant.objects.bulk_create(variants)
+            variants = []
+    ProductVariant.objects.bulk_create(variants)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0010_rating_comment_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(blank=True, default='', max_length=20)),
+                ('color', models.CharField(blank=True, default='', max_length=50)),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='Prouducts.product')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('stock__gt', 0)), fields=['size', 'product'], name='variant_size_in_stock_idx'), models.Index(condition=models.Q(('stock__gt', 0)), fields=['color', 'product'], name='variant_color_in_stock_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'size', 'color'), name='unique_product_variant')],
+            },
+        ),
+        migrations.RunPython(populate_variants, migrations.RunPython.noop),
+    ]
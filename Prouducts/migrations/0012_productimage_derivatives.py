@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0011_product_variant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
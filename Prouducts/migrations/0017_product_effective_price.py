@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:51
+
+import django.db.models.expressions
+import django.db.models.functions.math
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0016_similar_products'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('price'), '*', django.db.models.expressions.CombinedExpression(models.Value(100), '-', models.F('discount_percentage'))), '*', models.Value(Decimal('0.01'))), 2), output_field=models.DecimalField(decimal_places=2, max_digits=10)),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['effective_price', 'id'], name='product_avail_eff_price_idx'),
+        ),
+    ]
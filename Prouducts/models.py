@@ -1,4 +1,7 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models.functions import Round
 from django.conf import settings
 class Category(models.Model):
     name = models.CharField(max_length=100)
@@ -11,11 +14,21 @@ class Tag(models.Model):
         return self.name
 
 class Product(models.Model):
+    # Supplier stock-keeping unit; the upsert key of catalog imports.
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     brand= models.CharField(max_length=100)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount_percentage = models.IntegerField(default=0)
+    # Price after discount, computed and stored by the database. Scaling by
+    # 0.01 instead of dividing by 100 keeps SQLite, which stores whole prices
+    # as integers, from truncating the result.
+    effective_price = models.GeneratedField(
+        expression=Round(models.F('price') * (100 - models.F('discount_percentage')) * Decimal('0.01'), 2),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        db_persist=True,
+    )
     main_image = models.URLField(max_length=255, blank=True, null=True)
     sizes = models.JSONField(default=dict)
     colors = models.JSONField(default=dict)
@@ -25,12 +38,84 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     tags = models.ManyToManyField(Tag, blank=True)
     stock_quantity = models.IntegerField(default=0)
+    # Rating aggregates over 1-5 star ratings, maintained by Prouducts.ratings.
+    rating_avg = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    rating_1 = models.IntegerField(default=0)
+    rating_2 = models.IntegerField(default=0)
+    rating_3 = models.IntegerField(default=0)
+    rating_4 = models.IntegerField(default=0)
+    rating_5 = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_available=True),
+                name='product_avail_created_idx',
+            ),
+            models.Index(
+                fields=['effective_price', 'id'],
+                condition=models.Q(is_available=True),
+                name='product_avail_eff_price_idx',
+            ),
+        ]
     def __str__(self):
         return self.name
+    @property
+    def rating_histogram(self):
+        return {str(stars): getattr(self, f'rating_{stars}') for stars in range(1, 6)}
+
+class ProductFacet(models.Model):
+    """
+    Number of available products per facet value (e.g. brand "Nike": 124),
+    maintained incrementally from Product changes; see Prouducts.facets.
+    """
+    FACET_CHOICES = [
+        ('brand', 'Brand'),
+        ('category', 'Category'),
+        ('tag', 'Tag'),
+        ('price', 'Price band'),
+        ('size', 'Size'),
+        ('color', 'Color'),
+    ]
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['facet', 'value'], name='unique_product_facet_value'),
+        ]
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.count}"
+
+class ProductVariant(models.Model):
+    """
+    Stock of one size/color of a product. Variants are the source of truth
+    for inventory; Product.sizes and Product.stock_quantity mirror them, see
+    Prouducts.inventory. An empty color means the stock is not split by color.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants')
+    size = models.CharField(max_length=20, blank=True, default='')
+    color = models.CharField(max_length=50, blank=True, default='')
+    stock = models.PositiveIntegerField(default=0)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'size', 'color'], name='unique_product_variant'),
+        ]
+        indexes = [
+            models.Index(fields=['size', 'product'], condition=models.Q(stock__gt=0), name='variant_size_in_stock_idx'),
+            models.Index(fields=['color', 'product'], condition=models.Q(stock__gt=0), name='variant_color_in_stock_idx'),
+        ]
+    def __str__(self):
+        return f"{self.product.name} {self.size} {self.color}".strip()
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/')
+    # Resized WebP/JPEG renditions of `image`, written by Prouducts.images.
+    derivatives = models.JSONField(default=dict, blank=True)
     def __str__(self):
         return f"Image for {self.product.name}"
 class Rating(models.Model):
@@ -38,21 +123,104 @@ class Rating(models.Model):
     user=models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE)
     rating=models.IntegerField(default=0)
     comment=models.TextField(null=True,blank=True)
+    helpful_count=models.IntegerField(default=0)
     created_at=models.DateTimeField(auto_now_add=True)
     updated_at=models.DateTimeField(auto_now=True)
+    class Meta:
+        unique_together = ('user', 'product')
+        indexes = [
+            models.Index(fields=['product', '-created_at'], name='rating_product_created_idx'),
+            models.Index(fields=['product', '-helpful_count', '-created_at'], name='rating_product_helpful_idx'),
+        ]
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so saves can update product aggregates
+        # without re-reading the row.
+        if not {'product_id', 'rating', 'comment'} & instance.get_deferred_fields():
+            instance._stored_rating = (instance.product_id, instance.rating, instance.comment)
+        return instance
     def __str__(self):
         return f"{self.user.username}'s rating: {self.product.name}"
+class RatingHelpfulVote(models.Model):
+    # One "helpful" vote per user and review; Rating.helpful_count is their count.
+    rating=models.ForeignKey(Rating,on_delete=models.CASCADE,related_name='helpful_votes')
+    user=models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE)
+    created_at=models.DateTimeField(auto_now_add=True)
+    class Meta:
+        unique_together = ('rating', 'user')
+    def __str__(self):
+        return f"{self.user.username} found rating {self.rating_id} helpful"
 class Favorite(models.Model):
     user=models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE)
     product=models.ForeignKey(Product,on_delete=models.CASCADE)
     created_at=models.DateTimeField(auto_now_add=True)
     class Meta:
         unique_together = ('user', 'product')
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='favorite_user_created_idx'),
+        ]
         verbose_name = 'Favorite'
         verbose_name_plural = 'Favorites'
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
 
+class ProductCooccurrence(models.Model):
+    """
+    Number of orders containing both `product` and `other`, stored in both
+    directions. The diagonal row (other == product) counts the orders that
+    contain the product. Maintained by Prouducts.recommendations.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField(default=0)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='unique_product_cooccurrence'),
+        ]
+    def __str__(self):
+        return f"{self.product_id} & {self.other_id}: {self.orders}"
 
+class RelatedProduct(models.Model):
+    """
+    "Customers also bought" neighbors of a product, best first (rank 0).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_from')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_related_product_rank'),
+        ]
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
 
+class SimilarProduct(models.Model):
+    """
+    Content-based neighbors of a product (TF-IDF cosine over its name,
+    brand, description and tags), best first (rank 0); see
+    Prouducts.similarity.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_products')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_from')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_similar_product_rank'),
+        ]
+    def __str__(self):
+        return f"{self.product_id} ~ {self.similar_id} (#{self.rank})"
 
+class RecommendationCheckpoint(models.Model):
+    """
+    How far an incremental recommendation job has got, e.g. the last order
+    folded into the co-occurrence counts or the time of the last similarity
+    refresh (in microseconds).
+    """
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    def __str__(self):
+        return f"{self.name}: {self.position}"
@@ -0,0 +1,78 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+# ?sort= values of the product listings. The price orderings use the stored
+# discounted price, i.e. what customers actually pay.
+PRODUCT_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'price_asc': ('effective_price', 'id'),
+    'price_desc': ('-effective_price', '-id'),
+}
+
+
+def product_ordering(request):
+    """
+    Ordering of a product listing for ?sort=, newest first by default.
+    """
+    return PRODUCT_ORDERINGS.get(request.query_params.get('sort'), PRODUCT_ORDERINGS['newest'])
+
+
+class ProductCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (created_at, id), newest first, or over
+    (effective_price, id) with ?sort=price_asc / price_desc.
+
+    Returns opaque next/previous cursors and never runs COUNT(*) or OFFSET,
+    so page 5,000 costs the same as page 1. Served by the partial
+    (created_at, id) and (effective_price, id) WHERE is_available indexes
+    on Product.
+    """
+    ordering = PRODUCT_ORDERINGS['newest']
+
+    def get_ordering(self, request, queryset, view):
+        return product_ordering(request)
+
+
+class CommentCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a product's comments, newest first, or most
+    helpful first with ?sort=helpful. Served by the Rating (product,
+    created_at) and (product, helpful_count, created_at) indexes.
+    """
+    ordering = ('-created_at', '-id')
+    helpful_ordering = ('-helpful_count', '-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('sort') == 'helpful':
+            return self.helpful_ordering
+        return self.ordering
+
+
+class FavoriteCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a user's favorites, most recently added first.
+    Served by the Favorite (user, created_at) index.
+    """
+    ordering = ('-created_at', '-id')
+
+
+class KeysetPaginationMixin:
+    """
+    Use cursor pagination by default, falling back to page-number pagination
+    for clients that send ?page=N or ?pagination=page.
+    """
+    pagination_class = ProductCursorPagination
+    legacy_pagination_class = PageNumberPagination
+
+    def use_page_number_pagination(self):
+        params = self.request.query_params
+        return 'page' in params or params.get('pagination') == 'page'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_page_number_pagination():
+                self._paginator = self.legacy_pagination_class()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
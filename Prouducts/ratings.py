@@ -0,0 +1,163 @@
+"""
+Denormalized rating aggregates on Product.
+
+Each product stores the sum and count of its 1-5 star ratings, the average
+and a per-star histogram. Every rating change is applied with a single
+UPDATE of F() expressions on the product row, so the aggregates stay exact
+under concurrent writes without re-reading the Rating table. Ratings outside
+1-5 (e.g. comment-only rows left at 0) are not counted towards the stars,
+but every rating with a non-empty comment counts towards `comment_count`.
+
+Rating.helpful_count, which orders the comment feed by `?sort=helpful`, is
+kept the same way: one F() update per helpful vote added or removed.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Product, Rating, RatingHelpfulVote
+
+RATING_LEVELS = (1, 2, 3, 4, 5)
+RATING_HISTOGRAM_FIELDS = tuple(f'rating_{stars}' for stars in RATING_LEVELS)
+RATING_FIELDS = ('rating_avg', 'rating_count', 'rating_sum', 'comment_count') + RATING_HISTOGRAM_FIELDS
+HAS_COMMENT = Q(comment__isnull=False) & ~Q(comment='')
+
+
+def _level(value):
+    return value if value in RATING_LEVELS else None
+
+
+def rating_state(rating, comment):
+    """
+    What one Rating row contributes to its product: (counted stars or None,
+    whether it has a comment).
+    """
+    return (_level(rating), bool(comment))
+
+
+def rating_change_updates(previous=None, current=None):
+    """
+    UPDATE kwargs that move a product's aggregates from the `previous` rating
+    state to `current` (see rating_state), where None means "no rating row".
+    Returns {} when nothing changes.
+    """
+    previous_stars, previous_comment = previous or (None, False)
+    stars, has_comment = current or (None, False)
+    updates = {}
+    if previous_stars != stars:
+        sum_delta = (stars or 0) - (previous_stars or 0)
+        count_delta = (stars is not None) - (previous_stars is not None)
+        updates.update({
+            'rating_sum': F('rating_sum') + sum_delta,
+            'rating_count': F('rating_count') + count_delta,
+            # The right-hand side of an UPDATE sees the old row, so the deltas
+            # are applied here as well.
+            'rating_avg': Case(
+                When(
+                    rating_count__gt=-count_delta,
+                    then=Cast(F('rating_sum') + sum_delta, FloatField()) / (F('rating_count') + count_delta),
+                ),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        })
+        if previous_stars is not None:
+            updates[f'rating_{previous_stars}'] = F(f'rating_{previous_stars}') - 1
+        if stars is not None:
+            updates[f'rating_{stars}'] = F(f'rating_{stars}') + 1
+    if previous_comment != has_comment:
+        updates['comment_count'] = F('comment_count') + (1 if has_comment else -1)
+    if updates:
+        updates['updated_at'] = timezone.now()
+    return updates
+
+
+def apply_rating_change(product_id, previous=None, current=None):
+    updates = rating_change_updates(previous, current)
+    if updates:
+        Product.objects.filter(pk=product_id).update(**updates)
+
+
+def submit_rating(user, product_id, **fields):
+    """
+    Create or update `user`'s rating of a product and return (rating, created).
+    The Rating signals move the product aggregates with a single UPDATE, so
+    concurrent reviews of one product only contend on that row briefly.
+    """
+    with transaction.atomic():
+        rating = Rating.objects.select_for_update().filter(user=user, product_id=product_id).first()
+        if rating is None:
+            try:
+                with transaction.atomic():
+                    return Rating.objects.create(user=user, product_id=product_id, **fields), True
+            except IntegrityError:
+                # Lost a race with a concurrent first rating by the same user.
+                rating = Rating.objects.select_for_update().get(user=user, product_id=product_id)
+        for name, value in fields.items():
+            setattr(rating, name, value)
+        rating.save(update_fields=[*fields, 'updated_at'])
+        return rating, False
+
+
+def add_helpful_vote(user, rating_id):
+    """
+    Record that `user` found a review helpful. Returns False when they had
+    already voted for it.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                RatingHelpfulVote.objects.create(user=user, rating_id=rating_id)
+        except IntegrityError:
+            return False
+        Rating.objects.filter(pk=rating_id).update(helpful_count=F('helpful_count') + 1)
+        return True
+
+
+def remove_helpful_vote(user, rating_id):
+    """
+    Take back `user`'s helpful vote on a review. Returns False when there
+    was none.
+    """
+    with transaction.atomic():
+        deleted, _ = RatingHelpfulVote.objects.filter(user=user, rating_id=rating_id).delete()
+        if not deleted:
+            return False
+        Rating.objects.filter(pk=rating_id).update(helpful_count=F('helpful_count') - 1)
+        return True
+
+
+@transaction.atomic
+def rebuild_rating_aggregates(batch_size=1000):
+    """
+    Recompute every product's rating aggregates from the Rating table.
+    """
+    counted = Q(rating__in=RATING_LEVELS)
+    stats = (
+        Rating.objects.values('product_id')
+        .annotate(
+            total=Sum('rating', filter=counted),
+            count=Count('id', filter=counted),
+            comments=Count('id', filter=HAS_COMMENT),
+            **{f'stars_{stars}': Count('id', filter=Q(rating=stars)) for stars in RATING_LEVELS}
+        )
+        .order_by()
+    )
+    Product.objects.update(**{field: 0 for field in RATING_FIELDS})
+    products = []
+    for row in stats.iterator(chunk_size=batch_size):
+        product = Product(
+            pk=row['product_id'],
+            rating_sum=row['total'] or 0,
+            rating_count=row['count'],
+            rating_avg=round(row['total'] / row['count'], 2) if row['count'] else 0,
+            comment_count=row['comments'],
+            **{f'rating_{stars}': row[f'stars_{stars}'] for stars in RATING_LEVELS}
+        )
+        products.append(product)
+        if len(products) >= batch_size:
+            Product.objects.bulk_update(products, RATING_FIELDS)
+            products = []
+    if products:
+        Product.objects.bulk_update(products, RATING_FIELDS)
@@ -0,0 +1,189 @@
+"""
+"Customers also bought" recommendations from order co-occurrence.
+
+update_related_products() folds the orders placed since its last run into
+ProductCooccurrence, a sparse symmetric product x product matrix of order
+counts whose diagonal holds each product's own order count. It then re-ranks
+the products those orders contain:
+
+    score(a, b) = orders(a, b) / sqrt(orders(a) * orders(b))
+
+The normalization favors specific pairings over products that are in every
+basket. The best RELATED_PRODUCTS_LIMIT neighbors of each product are stored
+in RelatedProduct, which the related endpoint reads with one indexed lookup.
+
+Incremental runs only re-rank products that appear in new orders. Other
+products' scores drift slightly as their neighbors' totals grow, and orders
+cancelled after being counted stay counted; `build_related_products --full`
+recomputes everything.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from .cache import bump_catalog_version
+from .models import ProductCooccurrence, RecommendationCheckpoint, RelatedProduct
+
+RELATED_PRODUCTS_LIMIT = 20
+COOCCURRENCE_CHECKPOINT = 'cooccurrence'
+# Orders read per transaction (by id range).
+ORDER_BATCH_SIZE = 5000
+# Orders with more distinct products are bulk purchases that would add many
+# weak pairs; they are left out.
+MAX_ORDER_PRODUCTS = 50
+# Only orders older than this are read, so an order whose transaction
+# commits after a newer one's is not skipped by the checkpoint.
+SETTLE_DELAY = timedelta(minutes=5)
+
+
+def offsets_within_groups(sizes):
+    """
+    For groups of the given sizes laid end to end: each element's offset
+    within its group, e.g. [2, 3] -> [0, 1, 0, 1, 2].
+    """
+    return np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+
+def cooccurrence_counts(order_ids, product_ids):
+    """
+    Count product pairs within orders, from parallel arrays with one entry
+    per order line. Returns arrays (a, b, orders) covering each pair in both
+    directions, plus a == b for the number of orders containing a.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if not len(order_ids):
+        return empty, empty, empty
+    # Sorted by order then product, one row per product per order.
+    lines = np.unique(np.stack([order_ids, product_ids], axis=1).astype(np.int64), axis=0)
+    orders, products = lines[:, 0], lines[:, 1]
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(orders)])
+    keep = sizes <= MAX_ORDER_PRODUCTS
+    starts, sizes = starts[keep], sizes[keep]
+    if not len(sizes):
+        return empty, empty, empty
+
+    # Pair every line with each line of its order, itself included.
+    line_index = np.repeat(starts, sizes) + offsets_within_groups(sizes)
+    pairs_per_line = np.repeat(sizes, sizes)
+    left = np.repeat(line_index, pairs_per_line)
+    right = np.repeat(np.repeat(starts, sizes), pairs_per_line) + offsets_within_groups(pairs_per_line)
+
+    base = int(products.max()) + 1
+    keys, counts = np.unique(products[left] * base + products[right], return_counts=True)
+    return keys // base, keys % base, counts
+
+
+def rank_related(product_ids, other_ids, pair_orders, product_orders, limit=RELATED_PRODUCTS_LIMIT):
+    """
+    Top `limit` neighbors per product from off-diagonal pair counts and the
+    per-product order counts (a dict). Returns arrays (product, related,
+    rank, score), best first within each product.
+    """
+    totals = np.vectorize(product_orders.__getitem__, otypes=[np.float64])
+    scores = pair_orders / np.sqrt(totals(product_ids) * totals(other_ids))
+    order = np.lexsort((other_ids, -scores, product_ids))
+    product_ids, other_ids, scores = product_ids[order], other_ids[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, product_ids[1:] != product_ids[:-1]])
+    ranks = offsets_within_groups(np.diff(np.r_[starts, len(product_ids)]))
+    keep = ranks < limit
+    return product_ids[keep], other_ids[keep], ranks[keep], scores[keep]
+
+
+def _fold_lines(lines):
+    """
+    Add the pairs of a batch of (order_id, product_id) lines to the stored
+    counts and re-rank the products involved. Returns their ids.
+    """
+    a, b, counts = cooccurrence_counts(lines[:, 0], lines[:, 1])
+    if not len(a):
+        return []
+    touched = np.unique(a).tolist()
+
+    pairs = defaultdict(dict)
+    for product_id, other_id, orders in ProductCooccurrence.objects.filter(product_id__in=touched).values_list(
+        'product_id', 'other_id', 'orders'
+    ).iterator():
+        pairs[product_id][other_id] = orders
+    changed = []
+    for product_id, other_id, count in zip(a.tolist(), b.tolist(), counts.tolist()):
+        pairs[product_id][other_id] = pairs[product_id].get(other_id, 0) + count
+        changed.append(ProductCooccurrence(
+            product_id=product_id, other_id=other_id, orders=pairs[product_id][other_id]
+        ))
+    ProductCooccurrence.objects.bulk_create(
+        changed,
+        update_conflicts=True,
+        unique_fields=['product', 'other'],
+        update_fields=['orders'],
+        batch_size=1000,
+    )
+
+    product_orders = {product_id: row[product_id] for product_id, row in pairs.items()}
+    neighbors = {other_id for row in pairs.values() for other_id in row} - product_orders.keys()
+    product_orders.update(
+        ProductCooccurrence.objects.filter(product_id__in=neighbors, other=F('product')).values_list('product_id', 'orders')
+    )
+    off_diagonal = [
+        (product_id, other_id, orders)
+        for product_id, row in pairs.items()
+        for other_id, orders in row.items()
+        if other_id != product_id
+    ]
+    RelatedProduct.objects.filter(product_id__in=touched).delete()
+    if off_diagonal:
+        product_ids, other_ids, pair_orders = (np.array(column) for column in zip(*off_diagonal))
+        RelatedProduct.objects.bulk_create(
+            [
+                RelatedProduct(product_id=product_id, related_id=related_id, rank=rank, score=score)
+                for product_id, related_id, rank, score in zip(
+                    *(column.tolist() for column in rank_related(product_ids, other_ids, pair_orders, product_orders))
+                )
+            ],
+            batch_size=1000,
+        )
+    return touched
+
+
+def update_related_products(full=False, batch_size=ORDER_BATCH_SIZE):
+    """
+    Fold the orders placed since the last run into the co-occurrence counts
+    and re-rank the products they contain. Each batch commits together with
+    the checkpoint, so an interrupted run resumes where it stopped. Returns
+    (orders read, products re-ranked).
+    """
+    if full:
+        with transaction.atomic():
+            ProductCooccurrence.objects.all().delete()
+            RelatedProduct.objects.all().delete()
+            RecommendationCheckpoint.objects.filter(name=COOCCURRENCE_CHECKPOINT).delete()
+    checkpoint, _ = RecommendationCheckpoint.objects.get_or_create(name=COOCCURRENCE_CHECKPOINT)
+    last_order_id = Order.objects.filter(
+        pk__gt=checkpoint.position, created_at__lte=timezone.now() - SETTLE_DELAY
+    ).aggregate(last=Max('pk'))['last'] or checkpoint.position
+
+    orders_read = 0
+    reranked = set()
+    start = checkpoint.position
+    while start < last_order_id:
+        end = min(start + batch_size, last_order_id)
+        rows = (
+            OrderItem.objects.filter(order_id__gt=start, order_id__lte=end)
+            .exclude(order__status='cancelled')
+            .values_list('order_id', 'product_id')
+        )
+        lines = np.array(list(rows), dtype=np.int64).reshape(-1, 2)
+        with transaction.atomic():
+            reranked.update(_fold_lines(lines))
+            RecommendationCheckpoint.objects.filter(pk=checkpoint.pk).update(position=end)
+        orders_read += len(np.unique(lines[:, 0]))
+        start = end
+
+    if reranked:
+        bump_catalog_version()
+    return orders_read, len(reranked)
@@ -0,0 +1,133 @@
+"""
+Full-text product search.
+
+PostgreSQL uses a generated, weighted tsvector column on the product table with
+a GIN index, so the database keeps it current on every write. SQLite (dev and
+tests) uses an FTS5 table that is kept in sync from Product post_save /
+post_delete signals. Any other database falls back to icontains matching.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+PRODUCT_TABLE = 'Prouducts_product'
+FTS_TABLE = 'Prouducts_product_fts'
+
+# Relative weight of name, brand and description when ranking matches.
+SQLITE_COLUMN_WEIGHTS = (10.0, 5.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall((query or '').lower())
+
+
+class BaseSearchBackend:
+    def search(self, queryset, query):
+        """
+        Restrict `queryset` to products matching `query`, best matches first.
+        """
+        raise NotImplementedError
+
+    def index_products(self, products):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(name__icontains=token) |
+                Q(brand__icontains=token) |
+                Q(description__icontains=token)
+            )
+        return queryset.order_by('-created_at', '-id')
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Matches against the generated `search_vector` column. Indexing happens in
+    the database, so the index/remove hooks are no-ops.
+    """
+
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        vector = f'"{PRODUCT_TABLE}"."search_vector"'
+        return queryset.extra(
+            select={'search_rank': f"ts_rank_cd({vector}, to_tsquery('english', %s))"},
+            select_params=[tsquery],
+            where=[f"{vector} @@ to_tsquery('english', %s)"],
+            params=[tsquery],
+        ).order_by('-search_rank', '-id')
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    def search(self, queryset, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(weight) for weight in SQLITE_COLUMN_WEIGHTS)
+        return queryset.extra(
+            # bm25() is lower-is-better, negate it so ranks sort like Postgres.
+            select={'search_rank': f'-bm25("{FTS_TABLE}", {weights})'},
+            tables=[FTS_TABLE],
+            where=[
+                f'"{FTS_TABLE}".rowid = "{PRODUCT_TABLE}"."id"',
+                f'"{FTS_TABLE}" MATCH %s',
+            ],
+            params=[match],
+        ).order_by('-search_rank', '-id')
+
+    def index_products(self, products):
+        rows = [(p.pk, p.name, p.brand, p.description) for p in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM "{FTS_TABLE}" WHERE rowid = %s',
+                [(row[0],) for row in rows],
+            )
+            cursor.executemany(
+                f'INSERT INTO "{FTS_TABLE}" (rowid, name, brand, description) VALUES (%s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM "{FTS_TABLE}" WHERE rowid = %s',
+                [(pk,) for pk in product_ids],
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{FTS_TABLE}"')
+            cursor.execute(
+                f'INSERT INTO "{FTS_TABLE}" (rowid, name, brand, description) '
+                f'SELECT id, name, brand, description FROM "{PRODUCT_TABLE}"'
+            )
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend():
+    return BACKENDS.get(connection.vendor, BasicSearchBackend)()
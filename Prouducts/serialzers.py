@@ -1,6 +1,114 @@
 from rest_framework import serializers
-from .models import Product,Favorite    
-class HomeProductSerializer(serializers.ModelSerializer):
+from .models import Product,Favorite,Rating,ProductImage,Tag
+from .images import DERIVATIVE_FORMATS, srcset
+from .ratings import RATING_HISTOGRAM_FIELDS
+
+
+def _field_list(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    Let clients pick the serialized fields with ?fields=a,b or drop some with
+    ?omit=a,b. Unknown names are ignored and `id` is always kept.
+    optimize_queryset() loads only the columns and relations the selected
+    fields read, so the query count does not depend on the page size.
+    """
+    always_included = ('id',)
+    # Serializer fields that read model columns under other names.
+    field_columns = {
+        'rating_histogram': RATING_HISTOGRAM_FIELDS,
+        'category_name': ('category', 'category__name'),
+        'images': (),
+        'tags': (),
+        'is_favorite': (),
+    }
+    field_select_related = {'category_name': 'category'}
+    field_prefetch_related = {'images': 'images', 'tags': 'tags'}
+
+    @classmethod
+    def selected_field_names(cls, request, names=None):
+        names = list(names or cls.Meta.fields)
+        if request is None:
+            return names
+        fields = _field_list(request.query_params.get('fields'))
+        omit = _field_list(request.query_params.get('omit'))
+        return [
+            name for name in names
+            if name in cls.always_included or ((not fields or name in fields) and name not in omit)
+        ]
+
+    @classmethod
+    def selected_columns(cls, request, prefix=''):
+        columns = []
+        for name in cls.selected_field_names(request):
+            columns.extend(cls.field_columns.get(name, (name,)))
+        return [prefix + column for column in columns]
+
+    @classmethod
+    def selected_relations(cls, request, prefix=''):
+        """
+        (select_related paths, prefetch_related lookups) for the selection.
+        """
+        names = cls.selected_field_names(request)
+        return (
+            [prefix + cls.field_select_related[name] for name in names if name in cls.field_select_related],
+            [prefix + cls.field_prefetch_related[name] for name in names if name in cls.field_prefetch_related],
+        )
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request, *extra_columns):
+        select_related, prefetch_related = cls.selected_relations(request)
+        return (
+            queryset.select_related(*select_related)
+            .prefetch_related(*prefetch_related)
+            .only(*extra_columns, *cls.selected_columns(request))
+        )
+
+    def get_field_names(self, declared_fields, info):
+        names = super().get_field_names(declared_fields, info)
+        return self.selected_field_names(self.context.get('request'), names)
+
+
+class ProductImageSerializer(serializers.ModelSerializer):
+    """
+    `srcset` maps each format to a srcset attribute value; it is empty until
+    the resized renditions have been generated.
+    """
+    srcset = serializers.SerializerMethodField()
+    class Meta:
+        model=ProductImage
+        fields=['id','image','srcset']
+
+    def get_srcset(self, obj):
+        if obj.derivatives.get('source') != obj.image.name:
+            return {}
+        request = self.context.get('request')
+        def url(name):
+            location = obj.image.storage.url(name)
+            return request.build_absolute_uri(location) if request else location
+        return {key: srcset(obj.derivatives, key, url) for key, _, _, _ in DERIVATIVE_FORMATS}
+
+
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model=Tag
+        fields=['id','name']
+
+
+class HomeProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    `is_favorite` is always serialized as False so the output can be cached
+    for everyone; FavoriteStatusMixin sets it per user on the way out.
+    """
+    rating_histogram = serializers.ReadOnlyField()
+    # Generated columns map to ReadOnlyField; serialize it like `price`.
+    effective_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    tags = TagSerializer(many=True, read_only=True)
+    images = ProductImageSerializer(many=True, read_only=True)
+    is_favorite = serializers.SerializerMethodField()
     class Meta:
         model=Product
         fields=[
@@ -9,13 +117,30 @@ class HomeProductSerializer(serializers.ModelSerializer):
             'brand',
             'price',    
             'discount_percentage',
+            'effective_price',
             'is_available',
             'main_image',
             'description',
             'sizes',
-
+            'rating_avg',
+            'rating_count',
+            'rating_histogram',
+            'category_name',
+            'tags',
+            'images',
+            'is_favorite',
         ]
-class ProductDetailsSerializer(serializers.ModelSerializer):
+
+    def get_is_favorite(self, obj):
+        return False
+
+class ProductDetailsSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    rating_histogram = serializers.ReadOnlyField()
+    # Generated columns map to ReadOnlyField; serialize it like `price`.
+    effective_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    category_name = serializers.CharField(source='category.name', read_only=True)
+    tags = TagSerializer(many=True, read_only=True)
+    images = ProductImageSerializer(many=True, read_only=True)
     class Meta:
         model=Product
         fields=[
@@ -25,16 +150,46 @@ class ProductDetailsSerializer(serializers.ModelSerializer):
             'description',
             'price',    
             'discount_percentage',
+            'effective_price',
             'is_available',
             'main_image',
             'sizes',
             'colors',
             'category',
-            'stock_quantity'
+            'stock_quantity',
+            'rating_avg',
+            'rating_count',
+            'rating_histogram',
+            'category_name',
+            'tags',
+            'images',
         ]
 class FavoriteSerializer(serializers.ModelSerializer):
+    """
+    ?fields= / ?omit= select the fields of the nested product.
+    """
     product=ProductDetailsSerializer(read_only=True)
     class Meta:
         model=Favorite
         fields=['id','product','created_at']
         read_only_fields=['user','created_at']
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request):
+        select_related, prefetch_related = ProductDetailsSerializer.selected_relations(request, prefix='product__')
+        return (
+            queryset.select_related('product', *select_related)
+            .prefetch_related(*prefetch_related)
+            .only('id', 'created_at', 'product', *ProductDetailsSerializer.selected_columns(request, prefix='product__'))
+        )
+class RatingSerializer(serializers.ModelSerializer):
+    rating=serializers.IntegerField(min_value=1,max_value=5)
+    class Meta:
+        model=Rating
+        fields=['id','product','rating','comment','created_at','updated_at']
+        read_only_fields=['product','created_at','updated_at']
+class CommentSerializer(serializers.ModelSerializer):
+    user=serializers.CharField(source='user.username',read_only=True)
+    class Meta:
+        model=Rating
+        fields=['id','user','comment','rating','helpful_count','created_at']
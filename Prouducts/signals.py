@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version, invalidate_products
+from .facets import (
+    adjust_facet_counts, apply_facet_changes, facet_values, product_fields,
+    stored_product_fields, tag_link_deltas,
+)
+from .images import needs_derivatives
+from .inventory import derived_stock_quantity, sync_variants
+from .models import Category, Product, ProductImage, Rating, Tag
+from .ratings import apply_rating_change, rating_state
+from .search import get_search_backend
+from .tasks import generate_image_derivatives
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_facets(sender, instance, **kwargs):
+    instance._stored_facet_fields = stored_product_fields(instance.pk) if instance.pk else None
+
+
+@receiver(pre_save, sender=Product)
+def derive_stock_quantity(sender, instance, **kwargs):
+    quantity = derived_stock_quantity(instance.sizes, instance.colors)
+    if quantity is not None:
+        instance.stock_quantity = quantity
+
+
+@receiver(post_save, sender=Product)
+def update_product_variants(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored_facet_fields', None)
+    if created or not stored or (stored['sizes'], stored['colors']) != (instance.sizes, instance.colors):
+        sync_variants([instance])
+
+
+@receiver(post_save, sender=Product)
+def update_product_facets(sender, instance, created, **kwargs):
+    stored = getattr(instance, '_stored_facet_fields', None)
+    tag_ids = [] if created else list(instance.tags.values_list('id', flat=True))
+    previous = facet_values(stored, tag_ids) if stored else set()
+    apply_facet_changes(previous, facet_values(product_fields(instance), tag_ids))
+
+
+@receiver(pre_delete, sender=Product)
+def remove_product_facets(sender, instance, **kwargs):
+    tag_ids = list(instance.tags.values_list('id', flat=True))
+    apply_facet_changes(facet_values(product_fields(instance), tag_ids), set())
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_tag_facets(sender, instance, action, reverse, pk_set, **kwargs):
+    links = sender.objects.filter(**{'tag_id' if reverse else 'product_id': instance.pk})
+    if action in ('pre_remove', 'pre_clear'):
+        # Capture the links that actually exist before they are deleted.
+        if pk_set is not None:
+            links = links.filter(**{'product_id__in' if reverse else 'tag_id__in': pk_set})
+        instance._removed_tag_links = list(links.values_list('product__is_available', 'tag_id'))
+    elif action in ('post_remove', 'post_clear'):
+        adjust_facet_counts(tag_link_deltas(getattr(instance, '_removed_tag_links', []), -1))
+    elif action == 'post_add' and pk_set:
+        links = links.filter(**{'product_id__in' if reverse else 'tag_id__in': pk_set})
+        adjust_facet_counts(tag_link_deltas(links.values_list('product__is_available', 'tag_id'), 1))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+# Category names and tags are embedded in product responses, so changing
+# them changes the products' ETags too.
+@receiver(post_save, sender=Category)
+def invalidate_category_products(sender, instance, **kwargs):
+    invalidate_products(Product.objects.filter(category=instance).values('pk'))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def invalidate_tag_products(sender, instance, **kwargs):
+    invalidate_products(Product.tags.through.objects.filter(tag_id=instance.pk).values('product_id'))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_tagged_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_product_ids = list(sender.objects.filter(tag_id=instance.pk).values_list('product_id', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            product_ids = [instance.pk]
+        elif action == 'post_clear':
+            product_ids = getattr(instance, '_cleared_product_ids', [])
+        else:
+            product_ids = pk_set or []
+        invalidate_products(product_ids)
+
+
+@receiver(post_save, sender=ProductImage)
+def queue_image_derivatives(sender, instance, **kwargs):
+    if needs_derivatives(instance):
+        transaction.on_commit(lambda: generate_image_derivatives.delay(instance.pk))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_images(sender, instance, **kwargs):
+    invalidate_products([instance.product_id])
+
+
+@receiver(pre_save, sender=Rating)
+def remember_rating(sender, instance, **kwargs):
+    if instance.pk and not hasattr(instance, '_stored_rating'):
+        instance._stored_rating = (
+            Rating.objects.filter(pk=instance.pk).values_list('product_id', 'rating', 'comment').first()
+        )
+
+
+@receiver(post_save, sender=Rating)
+def update_rating_aggregates(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_rating', None)
+    previous = rating_state(*stored[1:]) if stored else None
+    if stored and stored[0] != instance.product_id:
+        apply_rating_change(stored[0], previous=previous)
+        previous = None
+    apply_rating_change(instance.product_id, previous, rating_state(instance.rating, instance.comment))
+    instance._stored_rating = (instance.product_id, instance.rating, instance.comment)
+
+
+@receiver(post_delete, sender=Rating)
+def remove_rating_aggregates(sender, instance, **kwargs):
+    apply_rating_change(instance.product_id, previous=rating_state(instance.rating, instance.comment))
@@ -0,0 +1,264 @@
+"""
+Content-based "similar products" from TF-IDF over product text.
+
+Each available product becomes a document made of its name, brand, tags and
+description (weighted by FIELD_WEIGHTS). The documents form a sparse,
+row-normalized TF-IDF matrix held as NumPy arrays, once by product and once
+by term. Cosine similarities are computed for a block of products against
+the whole catalog at a time, with at most BLOCK_CELLS scores in memory, so
+memory stays flat as the catalog grows (see benchmark_similar_products).
+The best SIMILAR_PRODUCTS_LIMIT neighbors of each product are stored in
+SimilarProduct.
+
+update_similar_products() is incremental after the first run: it re-ranks
+the products whose rows changed since the last run (Product.updated_at,
+which tag, category and stock changes also move), plus the products whose
+lists they leave or may now enter. The matrix itself is rebuilt from the
+catalog text on every run, which is linear in the catalog size; only the
+quadratic similarity step is restricted. `build_similar_products --full`
+re-ranks everything, e.g. after bulk imports that shift term frequencies.
+"""
+import math
+from array import array
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import Product, RecommendationCheckpoint, SimilarProduct
+from .recommendations import offsets_within_groups
+from .search import tokenize
+
+SIMILAR_PRODUCTS_LIMIT = 20
+SIMILARITY_CHECKPOINT = 'similarity'
+FIELD_WEIGHTS = {'name': 3, 'brand': 2, 'tags': 2, 'description': 1}
+# Terms found in fewer products cannot relate two products; terms in a
+# larger share of the catalog carry little signal and make blocks dense.
+# Small catalogs keep terms found in up to MAX_DOCUMENT_FREQUENCY_FLOOR
+# products, where dense blocks are cheap anyway.
+MIN_DOCUMENT_FREQUENCY = 2
+MAX_DOCUMENT_FREQUENCY = 0.1
+MAX_DOCUMENT_FREQUENCY_FLOOR = 100
+# Similarity scores held in memory at once. With the top-K selection's
+# work arrays, 4M cells peak at about 100 MB whatever the catalog size.
+BLOCK_CELLS = 4_000_000
+
+
+def document_terms(name='', brand='', description='', tags=()):
+    """
+    Weighted term counts of one product.
+    """
+    terms = Counter()
+    for field, text in (('name', name), ('brand', brand), ('description', description), ('tags', ' '.join(tags))):
+        for token in tokenize(text):
+            terms[token] += FIELD_WEIGHTS[field]
+    return terms
+
+
+def catalog_documents():
+    """
+    Yield (product id, weighted term counts) for every available product,
+    reading the catalog in chunks.
+    """
+    tags = {}
+    for product_id, tag in Product.tags.through.objects.filter(product__is_available=True).values_list(
+        'product_id', 'tag__name'
+    ).iterator(chunk_size=5000):
+        tags.setdefault(product_id, []).append(tag)
+    for product_id, name, brand, description in Product.objects.filter(is_available=True).values_list(
+        'pk', 'name', 'brand', 'description'
+    ).iterator(chunk_size=2000):
+        yield product_id, document_terms(name, brand, description, tags.get(product_id, ()))
+
+
+class TfidfMatrix:
+    """
+    Sparse TF-IDF rows of a set of documents, L2-normalized so dot products
+    are cosine similarities. Rows are stored CSR-style (indptr, terms,
+    weights) and the same entries are indexed by term (postings) for the
+    block multiply.
+    """
+
+    def __init__(self, documents):
+        self.product_ids = array('q')
+        rows, terms, counts = array('q'), array('q'), array('d')
+        vocabulary = {}
+        for row, (product_id, term_counts) in enumerate(documents):
+            self.product_ids.append(product_id)
+            for term, count in term_counts.items():
+                rows.append(row)
+                terms.append(vocabulary.setdefault(term, len(vocabulary)))
+                counts.append(count)
+        self.product_ids = np.frombuffer(self.product_ids, dtype=np.int64)
+        self.rows = {product_id: row for row, product_id in enumerate(self.product_ids.tolist())}
+        size = len(self.product_ids)
+        rows, terms, counts = (np.frombuffer(column, dtype=dtype) for column, dtype in (
+            (rows, np.int64), (terms, np.int64), (counts, np.float64),
+        ))
+
+        frequency = np.bincount(terms, minlength=len(vocabulary))
+        useful = (frequency >= MIN_DOCUMENT_FREQUENCY) & (
+            frequency <= max(MAX_DOCUMENT_FREQUENCY * size, MAX_DOCUMENT_FREQUENCY_FLOOR)
+        )
+        keep = useful[terms]
+        rows, terms, counts = rows[keep], terms[keep], counts[keep]
+        idf = np.log((1 + size) / (1 + frequency)) + 1
+        weights = (1 + np.log(counts)) * idf[terms]
+        norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=size))
+        weights = weights / norms[rows]
+
+        # Entries arrive grouped by row; the postings are the same entries by term.
+        self.indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=size))]
+        self.terms, self.weights = terms, weights
+        by_term = np.argsort(terms, kind='stable')
+        self.term_indptr = np.r_[0, np.cumsum(np.bincount(terms, minlength=len(vocabulary)))]
+        self.posting_rows, self.posting_weights = rows[by_term], weights[by_term]
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def block_size(self):
+        return max(1, BLOCK_CELLS // max(len(self), 1))
+
+    def similarities(self, rows):
+        """
+        Dense (len(rows) x catalog) cosine similarities of the given rows.
+        """
+        size = len(self)
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        entries = np.repeat(starts, lengths) + offsets_within_groups(lengths)
+        block_rows = np.repeat(np.arange(len(rows)), lengths)
+        terms = self.terms[entries]
+
+        posting_starts = self.term_indptr[terms]
+        posting_lengths = self.term_indptr[terms + 1] - posting_starts
+        postings = np.repeat(posting_starts, posting_lengths) + offsets_within_groups(posting_lengths)
+        cells = np.repeat(block_rows, posting_lengths) * size + self.posting_rows[postings]
+        products = np.repeat(self.weights[entries], posting_lengths) * self.posting_weights[postings]
+        return np.bincount(cells, weights=products, minlength=len(rows) * size).reshape(len(rows), size)
+
+    def top_neighbors(self, rows, limit=SIMILAR_PRODUCTS_LIMIT):
+        """
+        Yield (product id, [(similar product id, score), ...]) for `rows`,
+        best first, computed block by block.
+        """
+        for start in range(0, len(rows), self.block_size()):
+            block = rows[start:start + self.block_size()]
+            scores = self.similarities(block)
+            scores[np.arange(len(block)), block] = 0
+            count = min(limit, len(self) - 1)
+            if count <= 0:
+                for row in block.tolist():
+                    yield int(self.product_ids[row]), []
+                continue
+            best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind='stable')
+            best = np.take_along_axis(best, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            for row, neighbors, neighbor_scores in zip(block.tolist(), best, best_scores):
+                keep = neighbor_scores > 0
+                yield int(self.product_ids[row]), list(zip(
+                    self.product_ids[neighbors[keep]].tolist(), neighbor_scores[keep].tolist()
+                ))
+
+    def entering_rows(self, rows, thresholds):
+        """
+        Rows whose neighbor lists one of `rows` may now enter: a similarity
+        above the row's current lowest stored score (`thresholds`, indexed
+        by row).
+        """
+        entering = np.zeros(len(self), dtype=bool)
+        for start in range(0, len(rows), self.block_size()):
+            block = rows[start:start + self.block_size()]
+            scores = self.similarities(block)
+            scores[np.arange(len(block)), block] = 0
+            entering |= (scores > thresholds).any(axis=0)
+        return np.flatnonzero(entering)
+
+
+def _store(neighbor_lists):
+    with transaction.atomic():
+        product_ids = [product_id for product_id, _ in neighbor_lists]
+        SimilarProduct.objects.filter(product_id__in=product_ids).delete()
+        SimilarProduct.objects.bulk_create(
+            [
+                SimilarProduct(product_id=product_id, similar_id=similar_id, rank=rank, score=score)
+                for product_id, neighbors in neighbor_lists
+                for rank, (similar_id, score) in enumerate(neighbors)
+            ],
+            batch_size=1000,
+        )
+
+
+def _rank(matrix, rows):
+    """
+    Recompute and store the neighbor lists of `rows`, block by block.
+    """
+    batch = []
+    for neighbors in matrix.top_neighbors(rows):
+        batch.append(neighbors)
+        if len(batch) >= matrix.block_size():
+            _store(batch)
+            batch = []
+    if batch:
+        _store(batch)
+
+
+def _checkpoint_time(position):
+    return datetime.fromtimestamp(position / 1_000_000, tz=dt_timezone.utc)
+
+
+def update_similar_products(full=False):
+    """
+    Refresh stored similar products; see the module docstring. Returns the
+    number of products re-ranked.
+    """
+    started = timezone.now()
+    checkpoint = RecommendationCheckpoint.objects.filter(name=SIMILARITY_CHECKPOINT).first()
+    full = full or checkpoint is None
+    matrix = TfidfMatrix(catalog_documents())
+
+    if full:
+        rows = np.arange(len(matrix))
+    else:
+        changed = list(
+            Product.objects.filter(updated_at__gt=_checkpoint_time(checkpoint.position)).values_list('pk', flat=True)
+        )
+        # Lists of changed products that are no longer indexed go, and the
+        # lists they appear in are recomputed without them.
+        SimilarProduct.objects.filter(
+            product_id__in=[product_id for product_id in changed if product_id not in matrix.rows]
+        ).delete()
+        affected = {matrix.rows[product_id] for product_id in changed if product_id in matrix.rows}
+        affected.update(
+            matrix.rows[product_id]
+            for product_id in SimilarProduct.objects.filter(similar_id__in=changed).values_list('product_id', flat=True)
+            if product_id in matrix.rows
+        )
+        thresholds = np.zeros(len(matrix))
+        for product_id, lowest in SimilarProduct.objects.values('product_id').annotate(
+            stored=Count('pk'), lowest=Min('score')
+        ).filter(stored__gte=SIMILAR_PRODUCTS_LIMIT).values_list('product_id', 'lowest'):
+            if product_id in matrix.rows:
+                thresholds[matrix.rows[product_id]] = lowest
+        changed_rows = np.array(sorted(matrix.rows[product_id] for product_id in changed if product_id in matrix.rows),
+                                dtype=np.int64)
+        affected.update(matrix.entering_rows(changed_rows, thresholds).tolist())
+        rows = np.array(sorted(affected), dtype=np.int64)
+
+    _rank(matrix, rows)
+    if full:
+        SimilarProduct.objects.filter(product__is_available=False).delete()
+    RecommendationCheckpoint.objects.update_or_create(
+        name=SIMILARITY_CHECKPOINT,
+        defaults={'position': math.floor(started.timestamp() * 1_000_000)},
+    )
+    if len(rows):
+        bump_catalog_version()
+    return len(rows)
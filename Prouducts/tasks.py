@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from .images import process_product_image
+
+
+@shared_task
+def generate_image_derivatives(image_id, force=False):
+    process_product_image(image_id, force=force)
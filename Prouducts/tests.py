@@ -1,8 +1,36 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.urls import reverse
-from .models import Product, Category
+from django.utils import timezone
+from datetime import timedelta
+from unittest.mock import patch
+from django.contrib.auth import get_user_model
+from .models import (
+    Product, Category, Tag, ProductFacet, ProductImage, ProductVariant, Rating, Favorite, ProductCooccurrence,
+    RelatedProduct, SimilarProduct,
+)
+from orders.models import Order, OrderItem
+from shoe_ecommerce.celery import check_broker
+from .inventory import InsufficientStock, reserve_stock, restock
+from .pagination import ProductCursorPagination
+from .images import process_product_image
+from .facets import rebuild_facets
+from .ratings import rebuild_rating_aggregates
+from .cache import catalog_cache_stats, get_catalog_version
+from .recommendations import update_related_products
+from .similarity import update_similar_products
+from . import autocomplete
 
 # Create your tests here.
 
@@ -30,10 +58,1106 @@ class ProductAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         print (response.data)
         print (self.product.price)
-        self.assertTrue(any(p['name'] == self.product.name for p in response.data))
+        self.assertTrue(any(p['name'] == self.product.name for p in response.data['results']))
 
     def test_product_details(self):
         url = reverse('product-details', args=[self.product.pk])
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['name'], self.product.name)
+
+    def test_home_product_list_cursor_pagination(self):
+        for i in range(12):
+            Product.objects.create(
+                name=f"Shoe {i}",
+                brand="Test Brand",
+                description="A test shoe.",
+                price=100.00,
+                category=self.category,
+            )
+        url = reverse('home-products')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNotNone(response.data['next'])
+        first_page_ids = [p['id'] for p in response.data['results']]
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        second_page_ids = [p['id'] for p in response.data['results']]
+        self.assertEqual(len(second_page_ids), 3)
+        self.assertIsNone(response.data['next'])
+        self.assertFalse(set(first_page_ids) & set(second_page_ids))
+        self.assertEqual(first_page_ids + second_page_ids, sorted(first_page_ids + second_page_ids, reverse=True))
+
+    def test_home_product_list_page_number_opt_in(self):
+        url = reverse('home-products')
+        response = self.client.get(url, {'pagination': 'page'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+        response = self.client.get(url, {'page': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+
+class ProductSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Sneakers")
+        self.runner = Product.objects.create(
+            name="Air Runner",
+            brand="Nike",
+            description="Lightweight running shoe.",
+            price=100.00,
+            category=self.category,
+        )
+        self.boot = Product.objects.create(
+            name="Trail Boot",
+            brand="Timberland",
+            description="Waterproof boot, great for running errands in the rain.",
+            price=150.00,
+            category=self.category,
+        )
+
+    def test_search_ranks_name_matches_first(self):
+        response = self.client.get(reverse('product-search'), {'q': 'running'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [p['id'] for p in response.data['results']]
+        self.assertEqual(ids, [self.runner.id, self.boot.id])
+
+    def test_search_matches_prefixes_and_all_terms(self):
+        response = self.client.get(reverse('product-search'), {'q': 'timber boo'})
+        ids = [p['id'] for p in response.data['results']]
+        self.assertEqual(ids, [self.boot.id])
+
+    def test_search_index_follows_saves_and_deletes(self):
+        self.runner.name = "Cloud Racer"
+        self.runner.save()
+        response = self.client.get(reverse('product-search'), {'q': 'racer'})
+        self.assertEqual([p['id'] for p in response.data['results']], [self.runner.id])
+
+        self.runner.delete()
+        response = self.client.get(reverse('product-search'), {'q': 'racer'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_search_excludes_unavailable_products(self):
+        self.boot.is_available = False
+        self.boot.save()
+        response = self.client.get(reverse('product-search'), {'q': 'boot'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_search_requires_query(self):
+        response = self.client.get(reverse('product-search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductFacetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.sneakers = Category.objects.create(name="Sneakers")
+        self.boots = Category.objects.create(name="Boots")
+        self.running = Tag.objects.create(name="running")
+        self.nike = Product.objects.create(
+            name="Air Runner",
+            brand="Nike",
+            description="Running shoe.",
+            price=800.00,
+            sizes={"42": 5, "43": 1},
+            colors={"red": 2},
+            category=self.sneakers,
+        )
+        self.adidas = Product.objects.create(
+            name="Boost",
+            brand="Adidas",
+            description="Running shoe.",
+            price=1500.00,
+            sizes={"42": 2},
+            colors={"black": 2},
+            category=self.sneakers,
+        )
+
+    def counts(self):
+        return {
+            (facet, value): count
+            for facet, value, count in ProductFacet.objects.filter(count__gt=0).values_list('facet', 'value', 'count')
+        }
+
+    def assertCountsMatchRebuild(self):
+        incremental = self.counts()
+        rebuild_facets()
+        self.assertEqual(incremental, self.counts())
+
+    def test_counts_follow_product_changes(self):
+        counts = self.counts()
+        self.assertEqual(counts[('size', '42')], 2)
+        self.assertEqual(counts[('size', '43')], 1)
+        self.assertEqual(counts[('category', str(self.sneakers.id))], 2)
+        self.assertEqual(counts[('price', '500-1000')], 1)
+
+        self.nike.category = self.boots
+        self.nike.sizes = {"44": 1}
+        self.nike.save()
+        counts = self.counts()
+        self.assertEqual(counts[('size', '42')], 1)
+        self.assertNotIn(('size', '43'), counts)
+        self.assertEqual(counts[('category', str(self.boots.id))], 1)
+
+        self.adidas.is_available = False
+        self.adidas.save()
+        self.assertNotIn(('brand', 'Adidas'), self.counts())
+
+        self.nike.delete()
+        self.assertEqual(self.counts(), {})
+
+    def test_size_and_color_counts_follow_stock(self):
+        url = reverse('product-catalog')
+
+        def facet(name):
+            return {value: count for (facet, value), count in self.counts().items() if facet == name}
+
+        def matches(**params):
+            return len(self.client.get(url, params).data['results'])
+
+        self.nike.sizes = {"42": 5, "43": 0}
+        self.nike.save()
+        self.assertEqual(self.client.get(url).data['facets']['size'], [{'value': '42', 'count': 2}])
+        self.assertEqual(matches(size='43'), 0)
+
+        # Orders and cancellations move the counts as stock runs out or returns.
+        size_42 = self.adidas.variants.get(size='42')
+        reserve_stock([(self.adidas.pk, size_42.pk, 2)])
+        self.assertEqual(facet('size'), {'42': 1})
+        self.assertEqual(facet('color'), {'red': 1})
+        self.assertCountsMatchRebuild()
+
+        restock([(self.adidas.pk, size_42.pk, 1)])
+        self.assertEqual(facet('size'), {'42': 2})
+        self.assertEqual(facet('color'), {'red': 1, 'black': 1})
+        self.assertCountsMatchRebuild()
+
+    def test_counts_follow_tag_changes(self):
+        self.nike.tags.add(self.running)
+        self.running.product_set.add(self.adidas)
+        self.assertEqual(self.counts()[('tag', str(self.running.id))], 2)
+        self.assertCountsMatchRebuild()
+
+        self.nike.tags.remove(self.running)
+        self.nike.tags.remove(self.running)
+        self.assertEqual(self.counts()[('tag', str(self.running.id))], 1)
+
+        self.running.product_set.clear()
+        self.assertNotIn(('tag', str(self.running.id)), self.counts())
+        self.assertCountsMatchRebuild()
+
+    def test_catalog_filters_and_facets(self):
+        url = reverse('product-catalog')
+        response = self.client.get(url, {'size': '43'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.data['results']], [self.nike.id])
+
+        response = self.client.get(url, {'brand': 'adidas'})
+        self.assertEqual([p['id'] for p in response.data['results']], [self.adidas.id])
+
+        response = self.client.get(url, {'price_band': '1000-2000', 'color': 'black'})
+        self.assertEqual([p['id'] for p in response.data['results']], [self.adidas.id])
+
+        brands = {entry['value']: entry['count'] for entry in response.data['facets']['brand']}
+        self.assertEqual(brands, {'Nike': 1, 'Adidas': 1})
+        self.assertEqual(response.data['facets']['category'], [
+            {'value': str(self.sneakers.id), 'count': 2, 'label': 'Sneakers'},
+        ])
+
+
+class RatingAggregateTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(email=f'rater{i}@example.com', username=f'rater{i}', password='testpass123')
+            for i in range(3)
+        ]
+        self.category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Air Runner",
+            brand="Nike",
+            description="Running shoe.",
+            price=100.00,
+            category=self.category,
+        )
+
+    def aggregates(self):
+        self.product.refresh_from_db()
+        return (self.product.rating_avg, self.product.rating_count, self.product.rating_histogram)
+
+    def test_aggregates_follow_rating_changes(self):
+        first = Rating.objects.create(product=self.product, user=self.users[0], rating=5)
+        Rating.objects.create(product=self.product, user=self.users[1], rating=4)
+        Rating.objects.create(product=self.product, user=self.users[2], rating=0, comment="No stars")
+        avg, count, histogram = self.aggregates()
+        self.assertEqual(str(avg), '4.50')
+        self.assertEqual(count, 2)
+        self.assertEqual(histogram, {'1': 0, '2': 0, '3': 0, '4': 1, '5': 1})
+
+        first.rating = 1
+        first.save()
+        avg, count, histogram = self.aggregates()
+        self.assertEqual(str(avg), '2.50')
+        self.assertEqual(histogram['1'], 1)
+        self.assertEqual(histogram['5'], 0)
+
+        first.delete()
+        avg, count, histogram = self.aggregates()
+        self.assertEqual((str(avg), count), ('4.00', 1))
+
+        Rating.objects.filter(product=self.product).delete()
+        self.assertEqual(self.aggregates()[:2], (0, 0))
+
+    def test_rebuild_matches_incremental_aggregates(self):
+        for user, stars in zip(self.users, (3, 4, 4)):
+            Rating.objects.create(product=self.product, user=user, rating=stars)
+        incremental = self.aggregates()
+        Product.objects.filter(pk=self.product.pk).update(rating_count=0, rating_avg=0, rating_4=0)
+        rebuild_rating_aggregates()
+        self.assertEqual(self.aggregates(), incremental)
+        self.assertEqual(str(incremental[0]), '3.67')
+
+    def test_listing_exposes_ratings_without_extra_queries(self):
+        Rating.objects.create(product=self.product, user=self.users[0], rating=4)
+        url = reverse('home-products')
+        # The page, its images and tags, and the ETag aggregate; ratings add nothing.
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        product = response.data['results'][0]
+        self.assertEqual(product['rating_avg'], '4.00')
+        self.assertEqual(product['rating_count'], 1)
+        self.assertEqual(product['rating_histogram']['4'], 1)
+
+    def test_product_rating_view(self):
+        Rating.objects.create(product=self.product, user=self.users[0], rating=4)
+        Rating.objects.create(product=self.product, user=self.users[1], rating=5)
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get(reverse('product-rating', args=[self.product.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rating'], 4.5)
+        self.assertEqual(response.data['rating_count'], 2)
+
+
+class RatingSubmissionTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='rater@example.com', username='rater', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Air Runner",
+            brand="Nike",
+            description="Running shoe.",
+            price=100.00,
+            category=self.category,
+        )
+        self.url = reverse('product-rating', args=[self.product.pk])
+
+    def test_submit_then_update_rating(self):
+        response = self.client.post(self.url, {'rating': 5, 'comment': 'Great'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(6):
+            # exists, SAVEPOINT, SELECT ... FOR UPDATE, UPDATE rating,
+            # UPDATE product aggregates, RELEASE SAVEPOINT
+            response = self.client.post(self.url, {'rating': 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['comment'], 'Great')
+
+        self.assertEqual(Rating.objects.filter(user=self.user, product=self.product).count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_sum), (1, 3))
+        self.assertEqual(self.product.rating_histogram, {'1': 0, '2': 0, '3': 1, '4': 0, '5': 0})
+
+    def test_submit_rating_validation(self):
+        response = self.client.post(self.url, {'rating': 6}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('product-rating', args=[999]), {'rating': 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_submit_rating_requires_authentication(self):
+        response = APIClient().post(self.url, {'rating': 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class ProductCommentFeedTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        User = get_user_model()
+        self.users = [
+            User.objects.create_user(email=f'reviewer{i}@example.com', username=f'reviewer{i}', password=None)
+            for i in range(13)
+        ]
+        self.client.force_authenticate(user=self.users[0])
+        self.category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Air Runner",
+            brand="Nike",
+            description="Running shoe.",
+            price=100.00,
+            category=self.category,
+        )
+        self.ratings = [
+            Rating.objects.create(product=self.product, user=user, rating=4, comment=f"Comment {i}", helpful_count=i % 3)
+            for i, user in enumerate(self.users[:12])
+        ]
+        Rating.objects.create(product=self.product, user=self.users[12], rating=5)
+        self.url = reverse('product-comment', args=[self.product.pk])
+
+    def test_comment_feed_is_paginated_with_fixed_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['comments']), 10)
+        self.assertEqual(response.data['comments'][0]['comment'], 'Comment 11')
+        self.assertEqual(response.data['comments'][0]['user'], 'reviewer11')
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([c['comment'] for c in response.data['comments']], ['Comment 1', 'Comment 0'])
+        self.assertIsNone(response.data['next'])
+
+    def test_comment_feed_most_helpful_first(self):
+        response = self.client.get(self.url, {'sort': 'helpful'})
+        helpful = [c['helpful_count'] for c in response.data['comments']]
+        self.assertEqual(helpful, sorted(helpful, reverse=True))
+        self.assertEqual(response.data['comments'][0]['comment'], 'Comment 11')
+
+    def test_helpful_votes_reorder_the_feed(self):
+        vote_url = reverse('comment-helpful-vote', args=[self.ratings[0].pk])
+        for user in self.users[:3]:
+            self.client.force_authenticate(user=user)
+            self.assertEqual(self.client.post(vote_url).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.post(vote_url).status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url, {'sort': 'helpful'})
+        self.assertEqual(response.data['comments'][0]['comment'], 'Comment 0')
+        self.assertEqual(response.data['comments'][0]['helpful_count'], 3)
+
+        self.assertEqual(self.client.delete(vote_url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.delete(vote_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.ratings[0].refresh_from_db()
+        self.assertEqual(self.ratings[0].helpful_count, 2)
+        self.assertEqual(self.client.post(reverse('comment-helpful-vote', args=[0])).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_comment_count_follows_comment_edits(self):
+        self.ratings[0].comment = ''
+        self.ratings[0].save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.comment_count, 11)
+
+        self.ratings[1].delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.comment_count, 10)
+
+
+class CatalogCacheTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Air Runner",
+            brand="Nike",
+            description="Running shoe.",
+            price=100.00,
+            category=self.category,
+        )
+
+    def test_home_list_served_from_cache_until_catalog_changes(self):
+        url = reverse('home-products')
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        hits = catalog_cache_stats()['hits']
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(catalog_cache_stats()['hits'], hits + 1)
+
+        self.product.name = "Air Runner 2"
+        self.product.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['name'], "Air Runner 2")
+
+    def test_cache_key_ignores_query_param_order(self):
+        url = reverse('product-catalog')
+        self.client.get(url + '?brand=Nike&min_price=10')
+        response = self.client.get(url + '?min_price=10&brand=Nike')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['facets']['brand'][0]['value'], 'Nike')
+        self.assertEqual(self.client.get(url + '?brand=Adidas')['X-Cache'], 'MISS')
+
+    def test_details_invalidated_by_category_and_tag_changes(self):
+        url = reverse('product-details', args=[self.product.pk])
+        self.client.get(url)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        self.category.name = "Runners"
+        self.category.save()
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+        self.product.tags.add(Tag.objects.create(name="sale"))
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Air Runner",
+            brand="Nike",
+            description="Running shoe.",
+            price=100.00,
+            category=self.category,
+        )
+
+    def test_details_not_modified_without_serializing(self):
+        url = reverse('product-details', args=[self.product.pk])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.product.price = 90
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_home_list_etag_follows_updates_and_count(self):
+        url = reverse('home-products')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Product.objects.create(name="Trail", brand="Nike", description="Trail shoe.", price=50, category=self.category)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+
+    def test_catalog_not_modified(self):
+        url = reverse('product-catalog')
+        response = self.client.get(url, {'brand': 'Nike'})
+        self.assertIn('facets', response.data)
+        etag = response['ETag']
+
+        response = self.client.get(url, {'brand': 'Nike'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, {'brand': 'Nike'}, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class SparseFieldsetTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='fields@example.com', username='fields', password='testpass123')
+        self.category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Air Runner",
+            brand="Nike",
+            description="A very long description. " * 50,
+            price=100.00,
+            category=self.category,
+        )
+
+    def test_home_list_fields_selector_defers_unrequested_columns(self):
+        url = reverse('home-products')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'name,price'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price'})
+        self.assertFalse(any('"description"' in query['sql'] for query in queries.captured_queries))
+
+    def test_omit_drops_fields(self):
+        response = self.client.get(reverse('product-details', args=[self.product.pk]), {'omit': 'description,rating_histogram'})
+        self.assertNotIn('description', response.data)
+        self.assertNotIn('rating_histogram', response.data)
+        self.assertIn('colors', response.data)
+
+    def test_favorites_select_nested_product_fields(self):
+        Favorite.objects.create(user=self.user, product=self.product)
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('list-favorites'), {'fields': 'name'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'product', 'created_at'})
+        self.assertEqual(response.data['results'][0]['product'], {'id': self.product.pk, 'name': 'Air Runner'})
+
+
+class ProductVariantTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Air Runner",
+            brand="Nike",
+            description="Running shoe.",
+            price=100.00,
+            sizes={"42": 5, "43": 0},
+            colors={"red": 2},
+            category=self.category,
+            stock_quantity=99,
+        )
+
+    def variants(self):
+        return dict(((v.size, v.color), v.stock) for v in self.product.variants.all())
+
+    def test_variants_follow_sizes_json(self):
+        self.assertEqual(self.variants(), {('42', ''): 5, ('43', ''): 0})
+        self.assertEqual(self.product.stock_quantity, 5)
+
+        self.product.sizes = {"42": 2, "44": 3}
+        self.product.save()
+        self.assertEqual(self.variants(), {('42', ''): 2, ('44', ''): 3})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 5)
+
+    def test_list_sizes_keep_stock_quantity(self):
+        self.product.sizes = ["42", "43"]
+        self.product.stock_quantity = 7
+        self.product.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 7)
+        self.assertEqual(self.variants(), {})
+
+    def test_restock_updates_variants_and_mirrors(self):
+        variant = self.product.variants.get(size='43')
+        restock([(self.product.pk, variant.pk, 4)])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.sizes, {'42': 5, '43': 4})
+        self.assertEqual(self.product.stock_quantity, 9)
+
+    def test_reserve_stock_takes_all_lines_or_none(self):
+        plain = Product.objects.create(
+            name="Plain Runner", brand="Nike", description="Running shoe.", price=80.00, category=self.category,
+            stock_quantity=4,
+        )
+        size_42 = self.product.variants.get(size='42')
+        reserve_stock([(self.product.pk, size_42.pk, 2), (self.product.pk, size_42.pk, 1), (plain.pk, None, 4)])
+        self.product.refresh_from_db()
+        plain.refresh_from_db()
+        self.assertEqual(self.product.sizes, {'42': 2, '43': 0})
+        self.assertEqual(self.product.stock_quantity, 2)
+        self.assertEqual(plain.stock_quantity, 0)
+
+        with self.assertRaisesMessage(InsufficientStock, 'Air Runner 42'):
+            reserve_stock([(self.product.pk, size_42.pk, 1), (self.product.pk, size_42.pk, 2)])
+        with self.assertRaisesMessage(InsufficientStock, 'Plain Runner'):
+            reserve_stock([(self.product.pk, size_42.pk, 1), (plain.pk, None, 1)])
+        self.assertEqual(self.variants()[('42', '')], 2)
+
+        restock([(self.product.pk, size_42.pk, 3), (plain.pk, None, 4)])
+        self.assertEqual(self.variants()[('42', '')], 5)
+        plain.refresh_from_db()
+        self.assertEqual(plain.stock_quantity, 4)
+
+    def test_stock_changes_keep_the_catalog_version(self):
+        url = reverse('product-details', args=[self.product.pk])
+        etag = self.client.get(url)['ETag']
+        version = get_catalog_version()
+        size_42 = self.product.variants.get(size='42')
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock([(self.product.pk, size_42.pk, 1)])
+            restock([(self.product.pk, size_42.pk, 1)])
+        self.assertEqual(get_catalog_version(), version)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_lines_without_variant_on_products_with_variants(self):
+        # A size the product does not stock resolves to no variant; its
+        # stock_quantity is derived from the variants and cannot serve it.
+        with self.assertRaisesMessage(InsufficientStock, 'not stocked in the selected size'):
+            reserve_stock([(self.product.pk, None, 1)])
+        restock([(self.product.pk, None, 3)])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 5)
+        self.assertEqual(self.variants(), {('42', ''): 5, ('43', ''): 0})
+
+    def test_size_filter_only_matches_sizes_in_stock(self):
+        url = reverse('product-catalog')
+        self.assertEqual(len(self.client.get(url, {'size': '42'}).data['results']), 1)
+        self.assertEqual(len(self.client.get(url, {'size': '43'}).data['results']), 0)
+        ProductVariant.objects.filter(product=self.product, size='42').update(stock=0)
+        self.product.save()
+        self.assertEqual(len(self.client.get(url, {'size': '42'}).data['results']), 0)
+
+
+class StockReservationConcurrencyTestCase(TransactionTestCase):
+    threads = 12
+
+    def setUp(self):
+        category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Air Runner", brand="Nike", description="Running shoe.", price=100.00, sizes={"42": 10},
+            category=category,
+        )
+        self.variant = self.product.variants.get()
+
+    def hammer(self, attempts):
+        """
+        Reserve one unit of the same variant `attempts` times per thread, all
+        threads starting together. Returns the number of reservations made.
+        """
+        barrier = threading.Barrier(self.threads)
+        reserved = []
+        if connection.vendor == 'sqlite':
+            # Take SQLite's write lock when the transaction begins, so two
+            # readers never wait on each other to upgrade it.
+            options = connection.settings_dict['OPTIONS']
+            self.addCleanup(options.pop, 'transaction_mode', None)
+            options['transaction_mode'] = 'IMMEDIATE'
+
+        def worker():
+            barrier.wait()
+            try:
+                for _ in range(attempts):
+                    while True:
+                        try:
+                            reserve_stock([(self.product.pk, self.variant.pk, 1)])
+                        except InsufficientStock:
+                            pass
+                        except OperationalError:
+                            # SQLite's shared-cache test database reports
+                            # "database table is locked" instead of waiting.
+                            time.sleep(0.001)
+                            continue
+                        else:
+                            reserved.append(1)
+                        break
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return len(reserved)
+
+    def test_concurrent_orders_never_oversell(self):
+        self.assertEqual(self.hammer(attempts=3), 10)
+        self.variant.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(self.variant.stock, 0)
+        self.assertEqual(self.product.sizes, {'42': 0})
+        self.assertEqual(self.product.stock_quantity, 0)
+
+
+class ProductImageDerivativeTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Air Runner", brand="Nike", description="Running shoe.", price=100.00, category=self.category,
+        )
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1200), 'red').save(buffer, 'PNG')
+        self.image = ProductImage.objects.create(
+            product=self.product, image=SimpleUploadedFile('shoe.png', buffer.getvalue(), content_type='image/png'),
+        )
+
+    def test_renditions_are_generated_once(self):
+        self.assertTrue(process_product_image(self.image.pk))
+        self.image.refresh_from_db()
+        sizes = self.image.derivatives['sizes']
+        self.assertEqual((sizes['zoom']['width'], sizes['zoom']['height']), (1200, 900))
+        self.assertEqual(sizes['thumbnail']['width'], 150)
+        with self.image.image.storage.open(sizes['card']['webp']) as rendition:
+            self.assertEqual(Image.open(rendition).format, 'WEBP')
+        self.assertFalse(process_product_image(self.image.pk))
+
+    def test_details_expose_srcset(self):
+        response = self.client.get(reverse('product-details', args=[self.product.pk]))
+        self.assertEqual(response.data['images'][0]['srcset'], {})
+
+        process_product_image(self.image.pk)
+        response = self.client.get(reverse('product-details', args=[self.product.pk]))
+        srcset = response.data['images'][0]['srcset']
+        self.assertEqual([entry.split()[-1] for entry in srcset['webp'].split(', ')], ['150w', '400w', '1200w'])
+        self.assertIn('_card.jpg 400w', srcset['jpeg'])
+
+
+    def test_missing_broker_is_reported(self):
+        with override_settings(CELERY_BROKER_URL='memory://', CELERY_TASK_ALWAYS_EAGER=False, PRODUCTION=True):
+            self.assertEqual([error.id for error in check_broker(None)], ['shoe_ecommerce.E001'])
+        with override_settings(CELERY_BROKER_URL='memory://', CELERY_TASK_ALWAYS_EAGER=False, PRODUCTION=False):
+            self.assertEqual([error.id for error in check_broker(None)], ['shoe_ecommerce.W001'])
+        with override_settings(CELERY_BROKER_URL='memory://', CELERY_TASK_ALWAYS_EAGER=True, PRODUCTION=True):
+            self.assertEqual(check_broker(None), [])
+
+class ProductEmbeddedRelationsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Sneakers")
+        self.tags = [Tag.objects.create(name=name) for name in ("running", "sale")]
+
+    def create_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                name=f"Shoe {i}", brand="Nike", description="Shoe.", price=100.00, category=self.category,
+            )
+            product.tags.set(self.tags)
+            ProductImage.objects.create(product=product, image=f'products/shoe_{i}.jpg')
+
+    def test_listing_query_count_does_not_depend_on_page_size(self):
+        url = reverse('home-products')
+        self.create_products(2)
+        # Page, images, tags and the ETag aggregate.
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.create_products(8)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        product = response.data['results'][0]
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(product['category_name'], 'Sneakers')
+        self.assertEqual([tag['name'] for tag in product['tags']], ['running', 'sale'])
+        self.assertEqual(len(product['images']), 1)
+
+    def test_details_embed_images_tags_and_category(self):
+        self.create_products(1)
+        product = Product.objects.get()
+        # Validators, product with its category, images and tags.
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('product-details', args=[product.pk]))
+        self.assertEqual(response.data['category_name'], 'Sneakers')
+        self.assertEqual(len(response.data['tags']), 2)
+        self.assertTrue(response.data['images'][0]['image'].endswith('products/shoe_0.jpg'))
+
+    def test_tag_and_category_changes_move_the_etag(self):
+        self.create_products(1)
+        url = reverse('product-details', args=[Product.objects.get().pk])
+        etag = self.client.get(url)['ETag']
+
+        self.tags[0].name = "trail"
+        self.tags[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tags'][0]['name'], 'trail')
+
+        self.category.name = "Runners"
+        self.category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.data['category_name'], 'Runners')
+
+
+class FavoriteStatusTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='fav@example.com', username='fav', password='testpass123')
+        self.other = get_user_model().objects.create_user(email='other@example.com', username='other', password='testpass123')
+        self.category = Category.objects.create(name="Sneakers")
+        self.products = [
+            Product.objects.create(name=f"Shoe {i}", brand="Nike", description="Shoe.", price=100.00, category=self.category)
+            for i in range(3)
+        ]
+        Favorite.objects.create(user=self.user, product=self.products[0])
+        Favorite.objects.create(user=self.user, product=self.products[2])
+
+    def test_batch_status_returns_favorited_subset_in_one_query(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('batch-favorite-status')
+        ids = ','.join(str(product.pk) for product in self.products)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'ids': ids + ',999999'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['favorites'], [self.products[0].pk, self.products[2].pk])
+
+        self.assertEqual(self.client.get(url, {'ids': 'a,b'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        too_many = ','.join(str(i) for i in range(1, 102))
+        self.assertEqual(self.client.get(url, {'ids': too_many}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_home_feed_flags_favorites_per_user_on_shared_cache(self):
+        url = reverse('home-products')
+        response = self.client.get(url)
+        self.assertFalse(any(product['is_favorite'] for product in response.data['results']))
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        flagged = {product['id'] for product in response.data['results'] if product['is_favorite']}
+        self.assertEqual(flagged, {self.products[0].pk, self.products[2].pk})
+
+        self.client.force_authenticate(user=self.other)
+        response = self.client.get(url)
+        self.assertFalse(any(product['is_favorite'] for product in response.data['results']))
+
+        response = self.client.get(url, {'omit': 'is_favorite'})
+        self.assertNotIn('is_favorite', response.data['results'][0])
+
+    def test_favorite_changes_move_the_users_etag(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('home-products')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Favorite.objects.filter(user=self.user, product=self.products[0]).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sum(product['is_favorite'] for product in response.data['results']), 1)
+
+    def test_favorites_list_is_cursor_paginated_with_fixed_query_count(self):
+        self.client.force_authenticate(user=self.user)
+        for product in self.products:
+            Favorite.objects.filter(user=self.user, product=product).delete()
+        products = [
+            Product.objects.create(name=f"Wish {i}", brand="Nike", description="Shoe.", price=100.00, category=self.category)
+            for i in range(15)
+        ]
+        for product in products:
+            Favorite.objects.create(user=self.user, product=product)
+
+        url = reverse('list-favorites')
+        # Favorites with products and categories, then images and tags.
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        first_page = response.data['results']
+        self.assertEqual(len(first_page), 10)
+        self.assertEqual(first_page[0]['product']['name'], 'Wish 14')
+        self.assertEqual(first_page[0]['product']['category_name'], 'Sneakers')
+
+        with self.assertNumQueries(3):
+            response = self.client.get(response.data['next'])
+        self.assertEqual([favorite['product']['name'] for favorite in response.data['results']],
+                         [f"Wish {i}" for i in range(4, -1, -1)])
+        self.assertIsNone(response.data['next'])
+
+
+class RelatedProductsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', username='buyer', password='testpass123')
+        self.category = Category.objects.create(name="Sneakers")
+        self.products = {
+            name: Product.objects.create(name=name, brand="Nike", description="Shoe.", price=100.00, category=self.category)
+            for name in ('popular', 'runner', 'sock', 'lace', 'boot')
+        }
+
+    def place_orders(self, *baskets):
+        for basket in baskets:
+            order = Order.objects.create(
+                user=self.user, order_number=f'R{Order.objects.count()}', total_amount=100,
+                shipping_address='Somewhere', payment_status='paid',
+            )
+            for name in basket:
+                OrderItem.objects.create(
+                    order=order, product=self.products[name], size='42', color='', quantity=1, price_at_purchase=100,
+                )
+        # Orders are only read once they have settled.
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def related_names(self, name):
+        response = self.client.get(reverse('related-products', args=[self.products[name].pk]), {'fields': 'name'})
+        return [product['name'] for product in response.data]
+
+    def test_rare_pairings_rank_above_popular_products(self):
+        self.place_orders(
+            ['popular', 'runner', 'sock'], ['popular', 'runner', 'sock'],
+            ['popular'], ['popular'], ['popular', 'lace'],
+        )
+        self.assertEqual(update_related_products(), (5, 4))
+        self.assertEqual(self.related_names('runner'), ['sock', 'popular'])
+        self.assertEqual(self.related_names('popular'), ['runner', 'sock', 'lace'])
+        self.assertEqual(self.related_names('boot'), [])
+
+        # One lookup on RelatedProduct joined to the products.
+        with self.assertNumQueries(1):
+            self.client.get(reverse('related-products', args=[self.products['lace'].pk]), {'fields': 'name,price'})
+
+    def test_incremental_update_reads_only_new_orders(self):
+        self.place_orders(['runner', 'sock'])
+        update_related_products()
+        self.place_orders(['runner', 'lace'], ['runner', 'lace'], ['boot', 'lace'])
+        self.assertEqual(update_related_products(), (3, 3))
+
+        runner, lace = self.products['runner'], self.products['lace']
+        self.assertEqual(ProductCooccurrence.objects.get(product=runner, other=runner).orders, 3)
+        self.assertEqual(ProductCooccurrence.objects.get(product=runner, other=lace).orders, 2)
+        self.assertEqual(self.related_names('runner'), ['lace', 'sock'])
+        self.assertEqual(update_related_products(), (0, 0))
+
+        update_related_products(full=True)
+        self.assertEqual(ProductCooccurrence.objects.get(product=runner, other=runner).orders, 3)
+        self.assertEqual(RelatedProduct.objects.filter(product=runner).count(), 2)
+
+
+class SimilarProductsTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Sneakers")
+        self.trail = Tag.objects.create(name="trail")
+        specs = [
+            ('Trail Runner', 'Salomon', 'Grippy trail running shoe for mud and rock.'),
+            ('Trail Runner GTX', 'Salomon', 'Waterproof trail running shoe with grippy sole.'),
+            ('Court Classic', 'Adidas', 'Leather tennis shoe for the court.'),
+            ('Court Classic Low', 'Adidas', 'Low leather tennis shoe.'),
+            ('Office Loafer', 'Clarks', 'Leather loafer for the office.'),
+        ]
+        self.products = {
+            name: Product.objects.create(name=name, brand=brand, description=description, price=100.00, category=self.category)
+            for name, brand, description in specs
+        }
+
+    def similar_names(self, name):
+        response = self.client.get(reverse('similar-products', args=[self.products[name].pk]), {'fields': 'name'})
+        return [product['name'] for product in response.data]
+
+    def test_similar_products_rank_by_shared_text(self):
+        self.assertEqual(update_similar_products(), 5)
+        self.assertEqual(self.similar_names('Trail Runner')[0], 'Trail Runner GTX')
+        self.assertEqual(self.similar_names('Court Classic')[0], 'Court Classic Low')
+        self.assertIn(self.similar_names('Office Loafer')[0], {'Court Classic', 'Court Classic Low'})
+
+    def test_incremental_refresh_follows_product_changes(self):
+        update_similar_products()
+        self.assertEqual(update_similar_products(), 0)
+
+        loafer = self.products['Office Loafer']
+        loafer.name = 'Trail Loafer'
+        loafer.description = 'Grippy trail running loafer.'
+        loafer.save()
+        loafer.tags.add(self.trail)
+        self.assertGreater(update_similar_products(), 0)
+        self.assertIn('Trail Loafer', self.similar_names('Trail Runner')[:2])
+        self.assertEqual(
+            set(SimilarProduct.objects.filter(product=loafer).order_by('rank').values_list('similar__name', flat=True)[:2]),
+            {'Trail Runner', 'Trail Runner GTX'},
+        )
+
+        loafer.is_available = False
+        loafer.save()
+        update_similar_products()
+        self.assertFalse(SimilarProduct.objects.filter(product=loafer).exists())
+        self.assertFalse(SimilarProduct.objects.filter(similar=loafer).exists())
+
+
+class EffectivePriceTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Sneakers")
+        # (price, discount): effective prices 90.00, 85.50, 120.00, 50.00 and 67.00.
+        self.products = [
+            Product.objects.create(
+                name=f"Shoe {i}", brand="Nike", description="Shoe.", price=price, discount_percentage=discount,
+                category=self.category,
+            )
+            for i, (price, discount) in enumerate([(100, 10), (95, 10), (120, 0), (200, 75), (100, 33)])
+        ]
+
+    def effective_prices(self, response):
+        return [product['effective_price'] for product in response.data['results']]
+
+    def test_effective_price_follows_price_and_discount(self):
+        product = Product.objects.get(pk=self.products[0].pk)
+        self.assertEqual(str(product.effective_price), '90.00')
+        product.discount_percentage = 25
+        product.save()
+        product.refresh_from_db()
+        self.assertEqual(str(product.effective_price), '75.00')
+
+    def test_sort_by_effective_price_across_cursor_pages(self):
+        url = reverse('home-products')
+        prices = []
+        with patch.object(ProductCursorPagination, 'page_size', 2):
+            response = self.client.get(url, {'sort': 'price_asc'})
+            while True:
+                prices.extend(self.effective_prices(response))
+                if response.data['next'] is None:
+                    break
+                response = self.client.get(response.data['next'])
+        self.assertEqual(prices, ['50.00', '67.00', '85.50', '90.00', '120.00'])
+
+        # The sort column is loaded even when it is not serialized: validators
+        # plus one page query.
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'sort': 'price_desc', 'fields': 'name'})
+        self.assertEqual(response.data['results'][0]['name'], "Shoe 2")
+
+        response = self.client.get(reverse('product-catalog'), {'sort': 'price_desc', 'pagination': 'page'})
+        self.assertEqual(self.effective_prices(response), ['120.00', '90.00', '85.50', '67.00', '50.00'])
+
+    def test_filter_by_effective_price(self):
+        response = self.client.get(reverse('product-catalog'), {
+            'min_effective_price': 60, 'max_effective_price': 90, 'sort': 'price_asc',
+        })
+        self.assertEqual(self.effective_prices(response), ['67.00', '85.50', '90.00'])
+        # The list price of the 200.00 shoe is above the range, its sale price below.
+        response = self.client.get(reverse('product-catalog'), {'min_price': 150})
+        self.assertEqual(self.effective_prices(response), ['50.00'])
+
+
+@override_settings(AUTOCOMPLETE_BACKGROUND_REFRESH=False)
+class AutocompleteTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        autocomplete._state['index'] = None
+        self.running = Category.objects.create(name="Running Shoes")
+        for name, brand, ratings in [("Air Max 90", "Nike", 5), ("Air Force 1", "Nike", 9), ("Runner Pro", "Asics", 0)]:
+            Product.objects.create(
+                name=name, brand=brand, description="Shoe.", price=100.00, rating_count=ratings, category=self.running,
+            )
+
+    def suggest(self, query, **params):
+        response = self.client.get(reverse('product-autocomplete'), {'q': query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(suggestion['type'], suggestion['text']) for suggestion in response.data['suggestions']]
+
+    def test_suggests_word_starts_best_first_without_queries(self):
+        self.suggest('a')
+        with self.assertNumQueries(0):
+            suggestions = self.suggest('a')
+        self.assertEqual(suggestions, [
+            ('brand', 'Asics'), ('product', 'Air Force 1'), ('product', 'Air Max 90'),
+        ])
+        self.assertEqual(self.suggest('RUN'), [
+            ('category', 'Running Shoes'), ('product', 'Runner Pro'),
+        ])
+        self.assertEqual(self.suggest('max'), [('product', 'Air Max 90')])
+        self.assertEqual(self.suggest('air f'), [('product', 'Air Force 1')])
+        self.assertEqual(self.suggest('a', limit=1), [('brand', 'Asics')])
+        self.assertEqual(self.suggest('zz'), [])
+        self.assertEqual(self.suggest(''), [])
+
+    def test_index_follows_catalog_version(self):
+        self.assertEqual(self.suggest('boot'), [])
+        # Queryset updates do not bump the catalog version.
+        Product.objects.filter(name="Air Max 90").update(is_available=False)
+        self.assertEqual(self.suggest('max'), [('product', 'Air Max 90')])
+
+        Product.objects.create(name="Trail Boot", brand="Nike", description="Boot.", price=100.00, category=self.running)
+        self.assertEqual(self.suggest('boot'), [('product', 'Trail Boot')])
+        self.assertEqual(self.suggest('max'), [])
+
+    def test_memory_budget_drops_lowest_ranked_products(self):
+        suggestions = [(autocomplete.PRODUCT, f"Shoe {number}", number, 0) for number in range(1, 101)]
+        index = autocomplete.AutocompleteIndex(suggestions, max_bytes=1000)
+        self.assertTrue(index.truncated)
+        self.assertLess(len(index), 100)
+        self.assertEqual(index.suggest('shoe', limit=2), [
+            {'type': 'product', 'text': "Shoe 1", 'id': 1}, {'type': 'product', 'text': "Shoe 2", 'id': 2},
+        ])
+        self.assertEqual(index.suggest(f"shoe {len(index) + 1}"), [])
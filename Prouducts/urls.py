@@ -1,13 +1,20 @@
 from django.urls import path
-from .views import HomeProductListView, ProductDetailsView, AddToFavoritesView, RemoveFromFavoritesView, CheckFavoriteStatusView, ListFavoritesView, ProductRatingView, ProductCommentView
+from .views import HomeProductListView, ProductCatalogView, ProductSearchView, ProductAutocompleteView, ProductDetailsView, RelatedProductsView, SimilarProductsView, AddToFavoritesView, RemoveFromFavoritesView, CheckFavoriteStatusView, BatchFavoriteStatusView, ListFavoritesView, ProductRatingView, ProductCommentView, CommentHelpfulVoteView
 urlpatterns = [
     path('home-products/', HomeProductListView.as_view(), name='home-products'),
+    path('catalog/', ProductCatalogView.as_view(), name='product-catalog'),
+    path('search/', ProductSearchView.as_view(), name='product-search'),
+    path('autocomplete/', ProductAutocompleteView.as_view(), name='product-autocomplete'),
     path('products-details/<int:pk>/', ProductDetailsView.as_view(), name='product-details'),
+    path('<int:pk>/related/', RelatedProductsView.as_view(), name='related-products'),
+    path('<int:pk>/similar/', SimilarProductsView.as_view(), name='similar-products'),
     path('favorites/add', AddToFavoritesView.as_view(), name='add-to-favorites'),
     path('favorites/remove/<int:pk>/', RemoveFromFavoritesView.as_view(), name='remove-from-favorites'),
     path('favorites/check-favorite-status/<int:pk>/', CheckFavoriteStatusView.as_view(), name='check-favorite-status'),
+    path('favorites/status/', BatchFavoriteStatusView.as_view(), name='batch-favorite-status'),
     path('favorites/list', ListFavoritesView.as_view(), name='list-favorites'),
     path('product-rating/<int:pk>/', ProductRatingView.as_view(), name='product-rating'), 
     path('product-comment/<int:pk>/', ProductCommentView.as_view(), name='product-comment'),
+    path('product-comment/helpful/<int:pk>/', CommentHelpfulVoteView.as_view(), name='comment-helpful-vote'),
     
 ]
\ No newline at end of file
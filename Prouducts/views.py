@@ -2,9 +2,18 @@ from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.permissions import IsAuthenticatedOrReadOnly,IsAuthenticated
-from django.db import models
 from .models import Product, Favorite, Rating
-from .serialzers import HomeProductSerializer, ProductDetailsSerializer, FavoriteSerializer
+from .serialzers import HomeProductSerializer, ProductDetailsSerializer, FavoriteSerializer, RatingSerializer, CommentSerializer
+from .pagination import KeysetPaginationMixin, CommentCursorPagination, FavoriteCursorPagination, product_ordering
+from .search import get_search_backend
+from .filters import ProductFilter
+from .facets import facet_counts
+from .autocomplete import AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MAX_LIMIT, get_autocomplete_index
+from .cache import CatalogCacheMixin, cached_catalog_value
+from .conditional import ConditionalGetMixin, catalog_list_validators, object_validators
+from .favorites import FAVORITE_STATUS_MAX_IDS, FavoriteStatusMixin, favorite_product_ids
+from .ratings import HAS_COMMENT, RATING_HISTOGRAM_FIELDS, add_helpful_vote, remove_helpful_vote, submit_rating
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.response import Response
 from rest_framework import status   
 from rest_framework.views import APIView
@@ -12,18 +21,233 @@ from rest_framework import permissions
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-class HomeProductListView(ListAPIView):
-    queryset = Product.objects.filter(is_available=True)
+SPARSE_FIELDSET_PARAMETERS = [
+    openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated product fields to include", type=openapi.TYPE_STRING),
+    openapi.Parameter('omit', openapi.IN_QUERY, description="Comma-separated product fields to leave out", type=openapi.TYPE_STRING),
+]
+PRODUCT_SORT_PARAMETER = openapi.Parameter(
+    'sort', openapi.IN_QUERY, description="Ordering: 'newest' (default), 'price_asc' or 'price_desc' (by price after discount)",
+    type=openapi.TYPE_STRING,
+)
+
+class HomeProductListView(FavoriteStatusMixin, ConditionalGetMixin, KeysetPaginationMixin, CatalogCacheMixin, ListAPIView):
+    queryset = Product.objects.filter(is_available=True).order_by('-created_at', '-id')
+    serializer_class = HomeProductSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    @swagger_auto_schema(
+        operation_description="Get available products, newest first or by price with sort. Cursor-paginated by "
+                              "default; pass page or pagination=page for page-number pagination",
+        manual_parameters=[
+            PRODUCT_SORT_PARAMETER,
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the next/previous link", type=openapi.TYPE_STRING),
+            openapi.Parameter('pagination', openapi.IN_QUERY, description="Set to 'page' for page-number pagination", type=openapi.TYPE_STRING),
+            openapi.Parameter('page', openapi.IN_QUERY, description="Page number (page-number mode only)", type=openapi.TYPE_INTEGER),
+            *SPARSE_FIELDSET_PARAMETERS,
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        ordering = product_ordering(self.request)
+        # The sort column is read back by the cursor paginator.
+        return self.get_serializer_class().optimize_queryset(
+            super().get_queryset().order_by(*ordering), self.request, ordering[0].lstrip('-')
+        )
+
+    def get_validators(self):
+        return catalog_list_validators(self.request, self.filter_queryset(self.get_queryset()))
+
+class ProductCatalogView(HomeProductListView):
+    """
+    Filtered home feed. Responses also carry the catalog-wide facet counts,
+    read from the precomputed ProductFacet table.
+    """
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = ProductFilter
+
+    @swagger_auto_schema(
+        operation_description="Get available products filtered by brand, category, tag, price, size and color, "
+                              "together with facet counts for the whole catalog",
+        manual_parameters=[
+            PRODUCT_SORT_PARAMETER,
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the next/previous link", type=openapi.TYPE_STRING),
+            openapi.Parameter('pagination', openapi.IN_QUERY, description="Set to 'page' for page-number pagination", type=openapi.TYPE_STRING),
+            openapi.Parameter('page', openapi.IN_QUERY, description="Page number (page-number mode only)", type=openapi.TYPE_INTEGER),
+            *SPARSE_FIELDSET_PARAMETERS,
+        ]
+    )
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        # 304s carry no body to add the facets to.
+        if response.status_code == 200:
+            response.data['facets'] = cached_catalog_value('facets', facet_counts)
+        return response
+
+class ProductSearchView(FavoriteStatusMixin, CatalogCacheMixin, ListAPIView):
     serializer_class = HomeProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
-class ProductDetailsView(RetrieveAPIView):  
+    def get_queryset(self):
+        queryset = HomeProductSerializer.optimize_queryset(Product.objects.filter(is_available=True), self.request)
+        return get_search_backend().search(queryset, self.request.query_params.get('q', ''))
+
+    @swagger_auto_schema(
+        operation_description="Full-text search over available products, best matches first",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Search terms matched against name, brand and description", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
+            *SPARSE_FIELDSET_PARAMETERS,
+        ],
+        responses={
+            200: HomeProductSerializer(many=True),
+            400: openapi.Response(
+                description="Missing search query",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'error': openapi.Schema(type=openapi.TYPE_STRING)
+                    }
+                )
+            )
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        if not request.query_params.get('q', '').strip():
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        return super().get(request, *args, **kwargs)
+
+class ProductAutocompleteView(APIView):
+    """
+    Search-box suggestions from the in-process prefix index (see
+    autocomplete.py). No authentication, so no database query per keystroke.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    @swagger_auto_schema(
+        operation_description="Suggest brands, categories and product names whose words start with the typed text",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, description="Text typed so far", type=openapi.TYPE_STRING, required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, description=f"Number of suggestions (default {AUTOCOMPLETE_LIMIT}, at most {AUTOCOMPLETE_MAX_LIMIT})", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Suggestions, best first: brands, then categories, then products",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'suggestions': openapi.Schema(
+                            type=openapi.TYPE_ARRAY,
+                            items=openapi.Schema(
+                                type=openapi.TYPE_OBJECT,
+                                properties={
+                                    'type': openapi.Schema(type=openapi.TYPE_STRING, enum=['brand', 'category', 'product']),
+                                    'text': openapi.Schema(type=openapi.TYPE_STRING),
+                                    'id': openapi.Schema(type=openapi.TYPE_INTEGER, description="Category or product ID; null for brands", x_nullable=True),
+                                }
+                            )
+                        )
+                    }
+                )
+            ),
+            400: openapi.Response(
+                description="Invalid limit",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'error': openapi.Schema(type=openapi.TYPE_STRING)
+                    }
+                )
+            )
+        }
+    )
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+        query = request.query_params.get('q', '')
+        return Response({'suggestions': get_autocomplete_index().suggest(query, limit) if query.strip() else []})
+
+class ProductDetailsView(ConditionalGetMixin, CatalogCacheMixin, RetrieveAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductDetailsSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    @swagger_auto_schema(
+        operation_description="Get product details. Served from the catalog cache until the product, "
+                              "its category or tags change. Supports If-None-Match / If-Modified-Since",
+        manual_parameters=SPARSE_FIELDSET_PARAMETERS,
+        responses={
+            200: ProductDetailsSerializer,
+            304: openapi.Response(description="Not modified"),
+            404: openapi.Response(description="Product not found")
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return ProductDetailsSerializer.optimize_queryset(super().get_queryset(), self.request)
+
+    def get_validators(self):
+        return object_validators(self.request, Product.objects.filter(pk=self.kwargs['pk']))
 
 
+class RelatedProductsView(FavoriteStatusMixin, CatalogCacheMixin, ListAPIView):
+    """
+    "Customers also bought": the precomputed neighbors of a product from
+    RelatedProduct, read with one lookup on its (product, rank) index.
+    """
+    serializer_class = HomeProductSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    # At most RELATED_PRODUCTS_LIMIT rows per product.
+    pagination_class = None
+
+    @swagger_auto_schema(
+        operation_description="Get products often bought together with this one, best match first. "
+                              "Empty until build_related_products has seen orders containing it",
+        manual_parameters=SPARSE_FIELDSET_PARAMETERS,
+        responses={
+            200: HomeProductSerializer(many=True)
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = Product.objects.filter(
+            is_available=True, related_from__product_id=self.kwargs['pk']
+        ).order_by('related_from__rank')
+        return HomeProductSerializer.optimize_queryset(queryset, self.request)
+
+
+class SimilarProductsView(RelatedProductsView):
+    """
+    Content-based neighbors of a product (TF-IDF over name, brand, tags and
+    description) from SimilarProduct; useful for products without orders.
+    """
+
+    @swagger_auto_schema(
+        operation_description="Get products with similar names, brands, tags and descriptions, best match first. "
+                              "Empty until build_similar_products has indexed the product",
+        manual_parameters=SPARSE_FIELDSET_PARAMETERS,
+        responses={
+            200: HomeProductSerializer(many=True)
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = Product.objects.filter(
+            is_available=True, similar_from__product_id=self.kwargs['pk']
+        ).order_by('similar_from__rank')
+        return HomeProductSerializer.optimize_queryset(queryset, self.request)
+
 
 class AddToFavoritesView(APIView):
     permission_classes = [IsAuthenticated]
@@ -141,20 +365,73 @@ class CheckFavoriteStatusView(APIView):
         return Response({'is_in_favorites': is_favorite})
 
 
+class BatchFavoriteStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description=f"Return which of up to {FAVORITE_STATUS_MAX_IDS} products are in user's favorites",
+        manual_parameters=[
+            openapi.Parameter('ids', openapi.IN_QUERY, description="Comma-separated product IDs", type=openapi.TYPE_STRING, required=True),
+        ],
+        responses={
+            200: openapi.Response(
+                description="IDs of the given products that are favorites",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'favorites': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER))
+                    }
+                )
+            ),
+            400: openapi.Response(
+                description="Missing, malformed or too many IDs",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'error': openapi.Schema(type=openapi.TYPE_STRING)
+                    }
+                )
+            ),
+            401: openapi.Response(description="Unauthorized")
+        }
+    )
+    def get(self, request):
+        try:
+            product_ids = {int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()}
+        except ValueError:
+            return Response({'error': 'ids must be comma-separated integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not product_ids:
+            return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(product_ids) > FAVORITE_STATUS_MAX_IDS:
+            return Response(
+                {'error': f'At most {FAVORITE_STATUS_MAX_IDS} ids per request'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({'favorites': sorted(favorite_product_ids(request.user, product_ids))})
+
+
 class ListFavoritesView(APIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = FavoriteCursorPagination
 
     @swagger_auto_schema(
-        operation_description="Get all user's favorite products",
+        operation_description="Get user's favorite products, most recently added first, cursor-paginated",
+        manual_parameters=[
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the next/previous link", type=openapi.TYPE_STRING),
+            *SPARSE_FIELDSET_PARAMETERS,
+        ],
         responses={
             200: FavoriteSerializer(many=True),
             401: openapi.Response(description="Unauthorized")
         }
     )
     def get(self, request):
-        favorites = Favorite.objects.filter(user=request.user)
-        serializer = FavoriteSerializer(favorites, many=True)
-        return Response(serializer.data)
+        # Products and their categories come with the page; images and tags
+        # are one prefetch each, whatever the page size.
+        favorites = FavoriteSerializer.optimize_queryset(Favorite.objects.filter(user=request.user), request)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(favorites, request, view=self)
+        serializer = FavoriteSerializer(page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
     
 class ProductRatingView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -167,7 +444,9 @@ class ProductRatingView(APIView):
                 schema=openapi.Schema(
                     type=openapi.TYPE_OBJECT,
                     properties={
-                        'rating': openapi.Schema(type=openapi.TYPE_NUMBER, description='Average rating (0-5)')
+                        'rating': openapi.Schema(type=openapi.TYPE_NUMBER, description='Average rating (0-5)'),
+                        'rating_count': openapi.Schema(type=openapi.TYPE_INTEGER, description='Number of ratings'),
+                        'histogram': openapi.Schema(type=openapi.TYPE_OBJECT, description='Number of ratings per star (1-5)')
                     }
                 )
             ),
@@ -178,37 +457,77 @@ class ProductRatingView(APIView):
     def get(self, request, pk):
         """Get product rating"""
         try:
-            product = Product.objects.get(pk=pk)
+            product = Product.objects.only('rating_avg', 'rating_count', *RATING_HISTOGRAM_FIELDS).get(pk=pk)
         except Product.DoesNotExist:
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Get average rating from related Rating model
-        ratings = Rating.objects.filter(product=product)
-        if ratings.exists():
-            avg_rating = ratings.aggregate(avg_rating=models.Avg('rating'))['avg_rating']
-            return Response({'rating': round(avg_rating, 2)}, status=status.HTTP_200_OK)
-        else:
-            return Response({'rating': 0}, status=status.HTTP_200_OK)
+        # Aggregates are maintained on the product row as ratings change
+        return Response({
+            'rating': float(product.rating_avg),
+            'rating_count': product.rating_count,
+            'histogram': product.rating_histogram,
+        }, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_description="Create or update the current user's rating of a product",
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            required=['rating'],
+            properties={
+                'rating': openapi.Schema(type=openapi.TYPE_INTEGER, description='Stars (1-5)'),
+                'comment': openapi.Schema(type=openapi.TYPE_STRING, description='Optional review text')
+            }
+        ),
+        responses={
+            201: RatingSerializer,
+            200: RatingSerializer,
+            400: openapi.Response(description="Invalid rating"),
+            401: openapi.Response(description="Unauthorized"),
+            404: openapi.Response(description="Product not found")
+        }
+    )
+    def post(self, request, pk):
+        """Submit or update a product rating"""
+        if not Product.objects.filter(pk=pk).exists():
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = RatingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rating, created = submit_rating(request.user, pk, **serializer.validated_data)
+        return Response(
+            RatingSerializer(rating).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
 
 class ProductCommentView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CommentCursorPagination
 
     @swagger_auto_schema(
-        operation_description="Get product comments",
+        operation_description="Get product comments, cursor-paginated",
+        manual_parameters=[
+            openapi.Parameter('sort', openapi.IN_QUERY, description="Ordering: 'newest' (default) or 'helpful'", type=openapi.TYPE_STRING),
+            openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from the next/previous link", type=openapi.TYPE_STRING),
+        ],
         responses={
             200: openapi.Response(
                 description="Product comments retrieved",
                 schema=openapi.Schema(
                     type=openapi.TYPE_OBJECT,
                     properties={
+                        'count': openapi.Schema(type=openapi.TYPE_INTEGER, description='Total number of comments'),
+                        'next': openapi.Schema(type=openapi.TYPE_STRING),
+                        'previous': openapi.Schema(type=openapi.TYPE_STRING),
                         'comments': openapi.Schema(
                             type=openapi.TYPE_ARRAY,
                             items=openapi.Schema(
                                 type=openapi.TYPE_OBJECT,
                                 properties={
+                                    'id': openapi.Schema(type=openapi.TYPE_INTEGER),
                                     'user': openapi.Schema(type=openapi.TYPE_STRING),
                                     'comment': openapi.Schema(type=openapi.TYPE_STRING),
                                     'rating': openapi.Schema(type=openapi.TYPE_NUMBER),
+                                    'helpful_count': openapi.Schema(type=openapi.TYPE_INTEGER),
                                     'created_at': openapi.Schema(type=openapi.TYPE_STRING, format='date-time')
                                 }
                             )
@@ -222,14 +541,61 @@ class ProductCommentView(APIView):
     )
     def get(self, request, pk):
         """Get product comments"""
-        try:
-            product = Product.objects.get(pk=pk)
-        except Product.DoesNotExist:
+        # The total comes from the product's denormalized comment_count
+        product = Product.objects.filter(pk=pk).values('comment_count').first()
+        if product is None:
             return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Get comments from related Rating model
-        comments = Rating.objects.filter(product=product, comment__isnull=False).exclude(comment='')
-        comments_data = [{'user': rating.user.username, 'comment': rating.comment, 'rating': rating.rating, 'created_at': rating.created_at} for rating in comments]
-        return Response({'comments': comments_data}, status=status.HTTP_200_OK)
+        comments = (
+            Rating.objects.filter(HAS_COMMENT, product_id=pk)
+            .select_related('user')
+            .only('id', 'comment', 'rating', 'helpful_count', 'created_at', 'user__username')
+        )
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(comments, request, view=self)
+        return Response({
+            'count': product['comment_count'],
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'comments': CommentSerializer(page, many=True).data,
+        }, status=status.HTTP_200_OK)
 
 
+class CommentHelpfulVoteView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    message_response = openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'message': openapi.Schema(type=openapi.TYPE_STRING)
+        }
+    )
+
+    @swagger_auto_schema(
+        operation_description="Mark a product comment (rating id) as helpful; orders ?sort=helpful",
+        responses={
+            201: openapi.Response(description="Vote recorded", schema=message_response),
+            200: openapi.Response(description="Already voted", schema=message_response),
+            401: openapi.Response(description="Unauthorized"),
+            404: openapi.Response(description="Comment not found")
+        }
+    )
+    def post(self, request, pk):
+        if not Rating.objects.filter(pk=pk).exists():
+            return Response({'error': 'Comment not found'}, status=status.HTTP_404_NOT_FOUND)
+        if add_helpful_vote(request.user, pk):
+            return Response({'message': 'Marked as helpful'}, status=status.HTTP_201_CREATED)
+        return Response({'message': 'Already marked as helpful'}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_description="Take back a helpful vote on a product comment",
+        responses={
+            200: openapi.Response(description="Vote removed", schema=message_response),
+            401: openapi.Response(description="Unauthorized"),
+            404: openapi.Response(description="No vote on this comment")
+        }
+    )
+    def delete(self, request, pk):
+        if remove_helpful_vote(request.user, pk):
+            return Response({'message': 'Helpful vote removed'}, status=status.HTTP_200_OK)
+        return Response({'message': 'Not marked as helpful'}, status=status.HTTP_404_NOT_FOUND)
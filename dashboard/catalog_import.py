@@ -0,0 +1,292 @@
+"""
+Bulk catalog import from CSV or JSON Lines files.
+
+The file is read as a stream and cut into batches, so memory stays constant
+whatever the file size. Category and tag names are resolved to ids through
+in-memory maps in the main process, which creates the missing ones. Every
+batch is validated with the dashboard product rules and upserted on `sku`
+with bulk_create(update_conflicts=True) inside its own transaction,
+optionally on several worker processes. An upsert only overwrites the
+columns the row provides.
+
+After each committed batch the last row number that is fully imported is
+written to a state file. Re-running the same import skips those rows, and
+because batches are upserts, replaying a partly imported batch is harmless.
+
+CSV columns: sku, name, brand, description, price, discount_percentage,
+main_image, sizes, colors, category, tags, is_available, stock_quantity.
+`sizes` and `colors` hold JSON objects and `tags` is "|"-separated.
+"""
+import csv
+import json
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+
+import django
+from django.db import transaction
+from rest_framework import serializers
+
+from Prouducts.cache import bump_catalog_version
+from Prouducts.facets import rebuild_facets
+from Prouducts.inventory import derived_stock_quantity, sync_variants
+from Prouducts.models import Category, Product, Tag
+from Prouducts.search import get_search_backend
+from .serializers import DashboardProductCreateSerializer
+
+PRODUCT_FIELDS = (
+    'name', 'brand', 'description', 'price', 'discount_percentage', 'main_image',
+    'sizes', 'colors', 'is_available', 'stock_quantity',
+)
+JSON_COLUMNS = ('sizes', 'colors')
+TAG_SEPARATOR = '|'
+
+
+class CatalogImportRowSerializer(DashboardProductCreateSerializer):
+    """
+    Dashboard product rules for one import row. The category and tags arrive
+    as ids resolved from their names; `sku` identifies the product.
+    """
+    sku = serializers.CharField(max_length=64)
+    category = serializers.IntegerField(min_value=1)
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+    class Meta(DashboardProductCreateSerializer.Meta):
+        fields = DashboardProductCreateSerializer.Meta.fields + ['tags']
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    invalid: int = 0
+    skipped: int = 0
+
+
+def read_rows(path, file_format):
+    """
+    Yield (line number, row dict) from a CSV or JSON Lines file, one line at
+    a time. Unparseable lines are yielded with an `_error`.
+    """
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, _normalize_csv_row(row)
+            return
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as exc:
+                yield line_number, {'_error': f'invalid JSON: {exc}'}
+
+
+def _normalize_csv_row(row):
+    row = {key: value for key, value in row.items() if key and value not in (None, '')}
+    try:
+        for column in JSON_COLUMNS:
+            if column in row:
+                row[column] = json.loads(row[column])
+    except ValueError as exc:
+        return {'_error': f'invalid JSON in {column}: {exc}'}
+    if 'tags' in row:
+        row['tags'] = [tag.strip() for tag in row['tags'].split(TAG_SEPARATOR) if tag.strip()]
+    return row
+
+
+class NameResolver:
+    """
+    Map names to ids of a model with a `name` field, creating missing rows.
+    Names that do not fit the field resolve to None.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.max_length = model._meta.get_field('name').max_length
+        self.ids = {}
+        for pk, name in model.objects.order_by('-pk').values_list('pk', 'name'):
+            self.ids[name] = pk
+
+    def resolve(self, names):
+        missing = {name for name in names if name not in self.ids and 0 < len(name) <= self.max_length}
+        if missing:
+            self.model.objects.bulk_create([self.model(name=name) for name in missing])
+            for pk, name in self.model.objects.filter(name__in=missing).order_by('-pk').values_list('pk', 'name'):
+                self.ids[name] = pk
+        return {name: self.ids.get(name) for name in names}
+
+
+def import_batch(rows):
+    """
+    Validate and upsert one batch of (line number, row) pairs whose category
+    and tags are already ids. Returns (imported count, [(line, errors)]).
+    """
+    errors = []
+    valid = {}
+    # One serializer validates the whole batch: building its fields per row
+    # would cost more than the database writes.
+    validator = CatalogImportRowSerializer()
+    for line_number, row in rows:
+        if '_error' in row:
+            errors.append((line_number, row['_error']))
+            continue
+        try:
+            data = validator.run_validation(row)
+        except serializers.ValidationError as exc:
+            # Plain data, so results can cross process boundaries.
+            errors.append((line_number, json.loads(json.dumps(exc.detail))))
+            continue
+        # A SKU repeated within the batch: the last row wins.
+        valid[data['sku']] = (data, 'tags' in row)
+
+    if not valid:
+        return 0, errors
+
+    # Only the columns a row provides are written over an existing product;
+    # bulk_create takes one update_fields list, so rows are grouped by theirs.
+    groups = {}
+    for sku, (data, _) in valid.items():
+        columns = tuple(name for name in PRODUCT_FIELDS if name in data)
+        groups.setdefault(columns, []).append(
+            Product(sku=sku, category_id=data['category'], **{name: data[name] for name in columns})
+        )
+
+    with transaction.atomic():
+        for columns, group in groups.items():
+            Product.objects.bulk_create(
+                group,
+                update_conflicts=True,
+                unique_fields=['sku'],
+                update_fields=[*columns, 'category', 'updated_at'],
+            )
+        # Read the rows back: variants, stock and the search index follow the
+        # stored product, including the columns the file left out.
+        products = list(Product.objects.filter(sku__in=valid))
+        derived = []
+        for product in products:
+            quantity = derived_stock_quantity(product.sizes, product.colors)
+            if quantity is not None and quantity != product.stock_quantity:
+                product.stock_quantity = quantity
+                derived.append(product)
+        Product.objects.bulk_update(derived, ['stock_quantity'])
+
+        tagged = [product.pk for product in products if valid[product.sku][1]]
+        links = Product.tags.through
+        links.objects.filter(product_id__in=tagged).delete()
+        links.objects.bulk_create(
+            [
+                links(product_id=product.pk, tag_id=tag_id)
+                for product in products if valid[product.sku][1]
+                for tag_id in set(valid[product.sku][0].get('tags', []))
+            ],
+            ignore_conflicts=True,
+        )
+        sync_variants(products)
+        get_search_backend().index_products(products)
+    return len(products), errors
+
+
+class CatalogImporter:
+    def __init__(self, path, file_format=None, batch_size=1000, workers=1, state_path=None, restart=False,
+                 on_error=None):
+        self.path = path
+        self.file_format = file_format or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        self.batch_size = batch_size
+        self.workers = workers
+        self.state_path = state_path or f'{path}.import-state.json'
+        self.restart = restart
+        # Called with (line number, errors) for every rejected row.
+        self.on_error = on_error or (lambda line_number, errors: None)
+
+    def load_checkpoint(self):
+        if self.restart or not os.path.exists(self.state_path):
+            return 0
+        with open(self.state_path) as state:
+            return json.load(state).get('row', 0)
+
+    def save_checkpoint(self, row):
+        with open(self.state_path, 'w') as state:
+            json.dump({'path': os.path.abspath(self.path), 'row': row}, state)
+
+    def batches(self, result, start_after):
+        categories = NameResolver(Category)
+        tags = NameResolver(Tag)
+        batch = []
+        for line_number, row in read_rows(self.path, self.file_format):
+            if line_number <= start_after:
+                result.skipped += 1
+                continue
+            batch.append((line_number, row))
+            if len(batch) >= self.batch_size:
+                yield self.resolve(batch, categories, tags)
+                batch = []
+        if batch:
+            yield self.resolve(batch, categories, tags)
+
+    def resolve(self, batch, categories, tags):
+        category_names = [str(row['category']).strip() for _, row in batch if row.get('category')]
+        tag_names = [str(tag).strip() for _, row in batch if isinstance(row.get('tags'), list) for tag in row['tags']]
+        category_ids = categories.resolve(category_names)
+        tag_ids = tags.resolve(tag_names)
+        for _, row in batch:
+            if row.get('category'):
+                row['category'] = category_ids[str(row['category']).strip()]
+            if isinstance(row.get('tags'), list):
+                row['tags'] = [tag_ids[str(tag).strip()] for tag in row['tags']]
+        return batch
+
+    def run(self):
+        result = ImportResult()
+        start_after = self.load_checkpoint()
+        if self.workers > 1:
+            self.run_parallel(result, start_after)
+        else:
+            for batch in self.batches(result, start_after):
+                self.record(result, import_batch(batch))
+                self.save_checkpoint(batch[-1][0])
+
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        # Bulk writes skip the Product signals; refresh what they maintain.
+        rebuild_facets()
+        bump_catalog_version()
+        return result
+
+    def run_parallel(self, result, start_after):
+        pending = {}
+        finished = {}
+        order = []
+        # Spawned (not forked) workers never share the parent's database
+        # connection; each sets Django up and opens its own.
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+        )
+        with pool:
+            for batch in self.batches(result, start_after):
+                if len(pending) >= self.workers * 2:
+                    self.collect(result, pending, finished, order, wait(pending, return_when=FIRST_COMPLETED).done)
+                future = pool.submit(import_batch, batch)
+                pending[future] = batch[-1][0]
+                order.append(batch[-1][0])
+            self.collect(result, pending, finished, order, wait(pending).done)
+
+    def collect(self, result, pending, finished, order, done):
+        for future in done:
+            last_row = pending.pop(future)
+            self.record(result, future.result())
+            finished[last_row] = True
+        # Only checkpoint past batches whose predecessors are committed too.
+        last_committed = None
+        while order and finished.pop(order[0], False):
+            last_committed = order.pop(0)
+        if last_committed is not None:
+            self.save_checkpoint(last_committed)
+
+    def record(self, result, outcome):
+        imported, errors = outcome
+        result.imported += imported
+        result.invalid += len(errors)
+        for line_number, row_errors in errors:
+            self.on_error(line_number, row_errors)
@@ -0,0 +1,125 @@
+"""
+Streaming CSV / JSON Lines exports for the dashboard list endpoints.
+
+Rows are read as plain tuples with values_list() and .iterator(), so no
+model instances are built and the result set is never held in memory: each
+chunk of rows is written to the response as soon as it is read. A column is
+a (header, lookup) pair, where the lookup may follow relations
+('user__email').
+"""
+import csv
+import json
+from datetime import date, datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+# Rows fetched per database round trip (a server-side cursor on PostgreSQL).
+EXPORT_CHUNK_SIZE = 2000
+# Rows joined into one piece of the response body.
+EXPORT_BUFFER_ROWS = 500
+
+PRODUCT_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('sku', 'sku'),
+    ('name', 'name'),
+    ('brand', 'brand'),
+    ('category', 'category__name'),
+    ('price', 'price'),
+    ('discount_percentage', 'discount_percentage'),
+    ('stock_quantity', 'stock_quantity'),
+    ('is_available', 'is_available'),
+    ('rating_avg', 'rating_avg'),
+    ('rating_count', 'rating_count'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+ORDER_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('order_number', 'order_number'),
+    ('customer_email', 'user__email'),
+    ('customer_first_name', 'user__first_name'),
+    ('customer_last_name', 'user__last_name'),
+    ('status', 'status'),
+    ('payment_status', 'payment_status'),
+    ('total_amount', 'total_amount'),
+    ('shipping_address', 'shipping_address'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+PAYMENT_EXPORT_COLUMNS = (
+    ('id', 'id'),
+    ('payment_order_id', 'payment_order_id'),
+    ('paymob_payment_id', 'paymob_payment_id'),
+    ('order_number', 'order__order_number'),
+    ('customer_email', 'order__user__email'),
+    ('amount', 'order__total_amount'),
+    ('status', 'status'),
+    ('error_messages', 'error_messages'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+)
+
+
+class _Echo:
+    """
+    File-like object for csv.writer that hands each line back instead of
+    storing it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _rows(queryset, columns):
+    return queryset.values_list(*(lookup for _, lookup in columns)).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _buffered(lines):
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= EXPORT_BUFFER_ROWS:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def csv_lines(queryset, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([header for header, _ in columns])
+    for row in _rows(queryset, columns):
+        yield writer.writerow([_csv_value(value) for value in row])
+
+
+def jsonl_lines(queryset, columns):
+    headers = [header for header, _ in columns]
+    for row in _rows(queryset, columns):
+        yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def streaming_export(queryset, columns, file_format, name):
+    """
+    StreamingHttpResponse with `queryset` as a `file_format` ('csv' or
+    'jsonl') attachment named after `name` and the current time.
+    """
+    content_type, extension = EXPORT_FORMATS[file_format]
+    lines = csv_lines(queryset, columns) if file_format == 'csv' else jsonl_lines(queryset, columns)
+    response = StreamingHttpResponse(_buffered(lines), content_type=content_type)
+    filename = f'{name}-{timezone.now():%Y%m%d-%H%M%S}.{extension}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.catalog_import import CatalogImporter
+
+
+class Command(BaseCommand):
+    help = 'Import or update products from a CSV or JSON Lines file, upserting on sku'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per transaction')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Parallel worker processes (use 1 on SQLite, which serializes writes)')
+        parser.add_argument('--state', help='Resume state file (default: <path>.import-state.json)')
+        parser.add_argument('--restart', action='store_true', help='Ignore saved progress and import from the first row')
+
+    def handle(self, *args, **options):
+        importer = CatalogImporter(
+            options['path'],
+            file_format=options['format'],
+            batch_size=max(options['batch_size'], 1),
+            workers=max(options['workers'], 1),
+            state_path=options['state'],
+            restart=options['restart'],
+            on_error=lambda line_number, errors: self.stderr.write(f'line {line_number}: {errors}'),
+        )
+        try:
+            result = importer.run()
+        except FileNotFoundError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.imported} products ({result.invalid} invalid rows, '
+            f'{result.skipped} rows already imported)'
+        ))
@@ -58,7 +58,7 @@ class DashboardProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = [
-            'id', 'name', 'brand', 'description', 'price', 'discount_percentage',
+            'id', 'sku', 'name', 'brand', 'description', 'price', 'discount_percentage',
             'main_image', 'sizes', 'colors', 'category', 'category_name',
             'is_available', 'stock_quantity', 'sales_count', 'stock_status',
             'created_at', 'updated_at'
@@ -79,7 +79,7 @@ class DashboardProductCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = [
-            'name', 'brand', 'description', 'price', 'discount_percentage',
+            'sku', 'name', 'brand', 'description', 'price', 'discount_percentage',
             'main_image', 'sizes', 'colors', 'category', 'is_available', 'stock_quantity'
         ]
 
@@ -1,10 +1,17 @@
+import csv
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from .models import DashboardAdmin, AuditLog
-from Prouducts.models import Product, Category
+from Prouducts.models import Product, Category, ProductFacet, ProductVariant
 from orders.models import Order, OrderItem, Payment, Country, State, City
 from user_profile.models import UserProfile
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -157,6 +164,34 @@ class DashboardProductManagementTestCase(APITestCase):
         })
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_dashboard_product_export_csv(self):
+        Product.objects.create(name='Hidden Shoe', brand='Other', price=80.00, category=self.category, is_available=False)
+        url = reverse('dashboard:dashboard-products-export')
+        response = self.client.get(url, {'status': 'available', 'search': 'test'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="products-', response['Content-Disposition'])
+
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual([row['name'] for row in rows], ['Test Shoe'])
+        self.assertEqual(rows[0]['category'], 'Sneakers')
+        self.assertEqual(rows[0]['stock_quantity'], '8')
+        self.assertTrue(AuditLog.objects.filter(action='EXPORT', model_name='Product', details__format='csv').exists())
+
+    def test_dashboard_export_rejects_unknown_format(self):
+        url = reverse('dashboard:dashboard-products-export')
+        response = self.client.get(url, {'export_format': 'xlsx'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_dashboard_product_search(self):
+        url = reverse('dashboard:dashboard-products')
+        response = self.client.get(url, {'search': 'brand'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p['id'] for p in response.data['data']], [self.product.id])
+
+        response = self.client.get(url, {'search': 'sandal'})
+        self.assertEqual(response.data['data'], [])
+
     def test_dashboard_product_detail(self):
         url = reverse('dashboard:dashboard-product-detail', args=[self.product.id])
         response = self.client.get(url)
@@ -274,6 +309,23 @@ class DashboardOrderManagementTestCase(APITestCase):
         })
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_dashboard_order_export_jsonl(self):
+        Order.objects.create(
+            user=self.customer, order_number='TEST456', status='paid',
+            total_amount=50.00, shipping_address='Test Address', payment_status='paid'
+        )
+        url = reverse('dashboard:dashboard-orders-export')
+        response = self.client.get(url, {'status': 'pending', 'customer': 'customer', 'export_format': 'jsonl'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        order = json.loads(lines[0])
+        self.assertEqual(order['order_number'], 'TEST123')
+        self.assertEqual(order['customer_email'], 'customer@test.com')
+        self.assertEqual(order['total_amount'], '200.00')
+
     def test_dashboard_order_detail(self):
         url = reverse('dashboard:dashboard-order-detail', args=[self.order.id])
         response = self.client.get(url)
@@ -297,6 +349,30 @@ class DashboardOrderManagementTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.order.refresh_from_db()
         self.assertEqual(self.order.status, 'cancelled')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 12)
+
+        # Cancelling again does not restock twice
+        self.client.delete(url)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 12)
+
+    def test_dashboard_order_cancel_through_update_restocks_once(self):
+        url = reverse('dashboard:dashboard-order-detail', args=[self.order.id])
+        response = self.client.put(url, {'status': 'cancelled'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 12)
+
+        self.client.delete(url)
+        self.client.put(url, {'status': 'cancelled', 'shipping_address': 'New Address'})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 12)
+
+        response = self.client.put(url, {'status': 'pending'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.shipping_address), ('cancelled', 'New Address'))
 
 class DashboardAnalyticsTestCase(APITestCase):
     def setUp(self):
@@ -375,4 +451,79 @@ class DashboardPermissionsTestCase(APITestCase):
         self.client.force_authenticate(user=self.user)
         url = reverse('dashboard:dashboard-analytics')
         response = self.client.get(url)
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN) 
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN) 
+
+class CatalogImportTestCase(TestCase):
+    HEADER = 'sku,name,brand,description,price,sizes,colors,category,tags\n'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'catalog.csv')
+
+    def write(self, *rows):
+        with open(self.path, 'w') as catalog:
+            catalog.write(self.HEADER + ''.join(rows))
+
+    def run_import(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', self.path, '--batch-size', '2', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_import_upserts_products_with_categories_tags_and_variants(self):
+        self.write(
+            'SKU-1,Air Runner,Nike,Running shoe,900,"{""42"": 3, ""43"": 1}",{},Sneakers,running|sale\n',
+            'SKU-2,Boost,Adidas,Trainer,1500,"{""42"": 2}",{},Sneakers,running\n',
+            'SKU-3,Bad,Adidas,No price,,{},{},Sneakers,\n',
+        )
+        out, err = self.run_import()
+        self.assertIn('Imported 2 products (1 invalid rows', out)
+        self.assertIn('line 4', err)
+
+        product = Product.objects.get(sku='SKU-1')
+        self.assertEqual(product.category.name, 'Sneakers')
+        self.assertEqual(sorted(product.tags.values_list('name', flat=True)), ['running', 'sale'])
+        self.assertEqual(product.stock_quantity, 4)
+        self.assertEqual(ProductVariant.objects.filter(product=product).count(), 2)
+        self.assertEqual(ProductFacet.objects.get(facet='brand', value='Nike').count, 1)
+        self.assertEqual(Category.objects.count(), 1)
+
+        self.write('SKU-1,Air Runner 2,Nike,Running shoe,950,"{""44"": 5}",{},Sneakers,running\n')
+        self.run_import()
+        product = Product.objects.get(sku='SKU-1')
+        self.assertEqual((product.name, product.stock_quantity), ('Air Runner 2', 5))
+        self.assertEqual(list(product.tags.values_list('name', flat=True)), ['running'])
+        self.assertEqual(list(product.variants.values_list('size', flat=True)), ['44'])
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_import_keeps_columns_missing_from_the_file(self):
+        category = Category.objects.create(name='Sneakers')
+        Product.objects.create(
+            sku='SKU-1', name='Air Runner', brand='Nike', description='Running shoe', price=900,
+            discount_percentage=20, main_image='https://example.com/air.jpg', is_available=False,
+            colors={'red': 4}, category=category,
+        )
+        self.write('SKU-1,Air Runner 2,Nike,Running shoe,950,,,Sneakers,\n')
+        self.run_import()
+
+        product = Product.objects.get(sku='SKU-1')
+        self.assertEqual(product.name, 'Air Runner 2')
+        self.assertEqual(
+            (product.discount_percentage, product.main_image, product.is_available, product.colors),
+            (20, 'https://example.com/air.jpg', False, {'red': 4}),
+        )
+        self.assertEqual(product.stock_quantity, 4)
+        self.assertEqual(list(product.variants.values_list('color', 'stock')), [('red', 4)])
+
+    def test_import_resumes_after_last_committed_row(self):
+        self.write(
+            'SKU-1,Air Runner,Nike,Running shoe,900,{},{},Sneakers,\n',
+            'SKU-2,Boost,Adidas,Trainer,1500,{},{},Sneakers,\n',
+            'SKU-3,Gel,Asics,Trainer,1200,{},{},Sneakers,\n',
+        )
+        with open(self.path + '.import-state.json', 'w') as state:
+            json.dump({'row': 3}, state)
+        out, _ = self.run_import()
+        self.assertIn('2 rows already imported', out)
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['SKU-3'])
+        self.assertFalse(os.path.exists(self.path + '.import-state.json'))
@@ -2,7 +2,8 @@ from django.urls import path
 from .views import (
     DashboardLoginView, DashboardLogoutView, DashboardAuthVerifyView,
     DashboardOverviewView, DashboardProductListView, DashboardProductDetailView,
-    DashboardOrderListView, DashboardOrderDetailView, DashboardPaymentListView,
+    DashboardProductExportView, DashboardOrderListView, DashboardOrderDetailView,
+    DashboardOrderExportView, DashboardPaymentListView, DashboardPaymentExportView,
     DashboardAnalyticsView
 )
 
@@ -19,14 +20,17 @@ urlpatterns = [
     
     # Products Management
     path('products/', DashboardProductListView.as_view(), name='dashboard-products'),
+    path('products/export/', DashboardProductExportView.as_view(), name='dashboard-products-export'),
     path('products/<int:product_id>/', DashboardProductDetailView.as_view(), name='dashboard-product-detail'),
     
     # Orders Management
     path('orders/', DashboardOrderListView.as_view(), name='dashboard-orders'),
+    path('orders/export/', DashboardOrderExportView.as_view(), name='dashboard-orders-export'),
     path('orders/<int:order_id>/', DashboardOrderDetailView.as_view(), name='dashboard-order-detail'),
     
     # Payments Analytics
     path('payments/transactions/', DashboardPaymentListView.as_view(), name='dashboard-payments'),
+    path('payments/transactions/export/', DashboardPaymentExportView.as_view(), name='dashboard-payments-export'),
     
     # Analytics
     path('analytics/', DashboardAnalyticsView.as_view(), name='dashboard-analytics'),
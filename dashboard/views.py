@@ -23,13 +23,19 @@ from .permissions import (
     IsDashboardAdmin, HasProductManagementPermission, HasOrderManagementPermission,
     HasPaymentViewPermission, HasAnalyticsPermission
 )
+from .exports import (
+    EXPORT_FORMATS, PRODUCT_EXPORT_COLUMNS, ORDER_EXPORT_COLUMNS, PAYMENT_EXPORT_COLUMNS,
+    streaming_export
+)
 from .utils import (
     log_audit_action, update_dashboard_access, get_dashboard_overview,
     calculate_sales_analytics, calculate_order_statistics, calculate_product_statistics,
     calculate_payment_statistics, format_response_data
 )
 from Prouducts.models import Product, Category
+from Prouducts.search import get_search_backend
 from orders.models import Order, OrderItem, Payment
+from orders.placement import cancel_order
 from user_profile.models import UserProfile
 from django.contrib.auth import get_user_model
 
@@ -213,30 +219,12 @@ class DashboardOverviewView(APIView):
         return Response(format_response_data(overview_data, user=request.user))
 
 # Product Management Views
-class DashboardProductListView(APIView):
-    permission_classes = [HasProductManagementPermission]
-    pagination_class = PageNumberPagination
+class DashboardProductFilterMixin:
+    """
+    Filtering, search and sorting shared by the product list and export.
+    """
 
-    @swagger_auto_schema(
-        operation_description="Get paginated list of products with filtering and search",
-        manual_parameters=[
-            openapi.Parameter('status', openapi.IN_QUERY, description="Filter by status (available/unavailable)", type=openapi.TYPE_STRING),
-            openapi.Parameter('category', openapi.IN_QUERY, description="Filter by category ID", type=openapi.TYPE_INTEGER),
-            openapi.Parameter('stock', openapi.IN_QUERY, description="Filter by stock (out_of_stock/low_stock)", type=openapi.TYPE_STRING),
-            openapi.Parameter('search', openapi.IN_QUERY, description="Search in name, brand, description", type=openapi.TYPE_STRING),
-            openapi.Parameter('sort_by', openapi.IN_QUERY, description="Sort field", type=openapi.TYPE_STRING),
-            openapi.Parameter('sort_order', openapi.IN_QUERY, description="Sort order (asc/desc)", type=openapi.TYPE_STRING),
-            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
-        ],
-        responses={
-            200: DashboardProductSerializer(many=True),
-            401: openapi.Response(description="Unauthorized"),
-            403: openapi.Response(description="Permission denied")
-        }
-    )
-    def get(self, request):
-        products = Product.objects.select_related('category').all()
-        
+    def filter_products(self, request, products):
         # Filtering
         status_filter = request.query_params.get('status')
         if status_filter:
@@ -256,23 +244,46 @@ class DashboardProductListView(APIView):
             elif stock_filter == 'low_stock':
                 products = products.filter(stock_quantity__lte=5, stock_quantity__gt=0)
         
-        # Search
+        # Search (results come back ranked; keep that order unless a sort is requested)
         search = request.query_params.get('search')
         if search:
-            products = products.filter(
-                Q(name__icontains=search) |
-                Q(brand__icontains=search) |
-                Q(description__icontains=search)
-            )
+            products = get_search_backend().search(products, search)
         
         # Sorting
-        sort_by = request.query_params.get('sort_by', 'created_at')
-        sort_order = request.query_params.get('sort_order', 'desc')
+        if not search or 'sort_by' in request.query_params:
+            sort_by = request.query_params.get('sort_by', 'created_at')
+            sort_order = request.query_params.get('sort_order', 'desc')
+            
+            if sort_order == 'desc':
+                products = products.order_by(f'-{sort_by}')
+            else:
+                products = products.order_by(sort_by)
         
-        if sort_order == 'desc':
-            products = products.order_by(f'-{sort_by}')
-        else:
-            products = products.order_by(sort_by)
+        return products
+
+class DashboardProductListView(DashboardProductFilterMixin, APIView):
+    permission_classes = [HasProductManagementPermission]
+    pagination_class = PageNumberPagination
+
+    @swagger_auto_schema(
+        operation_description="Get paginated list of products with filtering and search",
+        manual_parameters=[
+            openapi.Parameter('status', openapi.IN_QUERY, description="Filter by status (available/unavailable)", type=openapi.TYPE_STRING),
+            openapi.Parameter('category', openapi.IN_QUERY, description="Filter by category ID", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('stock', openapi.IN_QUERY, description="Filter by stock (out_of_stock/low_stock)", type=openapi.TYPE_STRING),
+            openapi.Parameter('search', openapi.IN_QUERY, description="Search in name, brand, description", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_by', openapi.IN_QUERY, description="Sort field", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_order', openapi.IN_QUERY, description="Sort order (asc/desc)", type=openapi.TYPE_STRING),
+            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: DashboardProductSerializer(many=True),
+            401: openapi.Response(description="Unauthorized"),
+            403: openapi.Response(description="Permission denied")
+        }
+    )
+    def get(self, request):
+        products = self.filter_products(request, Product.objects.select_related('category'))
         
         # Pagination
         paginator = self.pagination_class()
@@ -325,6 +336,44 @@ class DashboardProductListView(APIView):
             'errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
 
+class DashboardProductExportView(DashboardProductFilterMixin, APIView):
+    permission_classes = [HasProductManagementPermission]
+
+    @swagger_auto_schema(
+        operation_description="Stream all products matching the list filters as CSV or JSON Lines",
+        manual_parameters=[
+            openapi.Parameter('status', openapi.IN_QUERY, description="Filter by status (available/unavailable)", type=openapi.TYPE_STRING),
+            openapi.Parameter('category', openapi.IN_QUERY, description="Filter by category ID", type=openapi.TYPE_INTEGER),
+            openapi.Parameter('stock', openapi.IN_QUERY, description="Filter by stock (out_of_stock/low_stock)", type=openapi.TYPE_STRING),
+            openapi.Parameter('search', openapi.IN_QUERY, description="Search in name, brand, description", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_by', openapi.IN_QUERY, description="Sort field", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_order', openapi.IN_QUERY, description="Sort order (asc/desc)", type=openapi.TYPE_STRING),
+            openapi.Parameter('export_format', openapi.IN_QUERY, description="Export format (csv/jsonl)", type=openapi.TYPE_STRING, enum=list(EXPORT_FORMATS), default='csv'),
+        ],
+        responses={
+            200: openapi.Response(description="Products export file"),
+            400: openapi.Response(description="Unknown export format"),
+            401: openapi.Response(description="Unauthorized"),
+            403: openapi.Response(description="Permission denied")
+        }
+    )
+    def get(self, request):
+        file_format = request.query_params.get('export_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response({
+                'status': 'error',
+                'message': f"Unknown export format. Use one of: {', '.join(EXPORT_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        products = self.filter_products(request, Product.objects.all())
+
+        log_audit_action(request.user, 'EXPORT', 'Product', None, {
+            'filters': request.query_params.dict(),
+            'format': file_format
+        }, request)
+
+        return streaming_export(products, PRODUCT_EXPORT_COLUMNS, file_format, 'products')
+
 class DashboardProductDetailView(APIView):
     permission_classes = [HasProductManagementPermission]
 
@@ -435,31 +484,12 @@ class DashboardProductDetailView(APIView):
         })
 
 # Order Management Views
-class DashboardOrderListView(APIView):
-    permission_classes = [HasOrderManagementPermission]
-    pagination_class = PageNumberPagination
+class DashboardOrderFilterMixin:
+    """
+    Filtering, customer search and sorting shared by the order list and export.
+    """
 
-    @swagger_auto_schema(
-        operation_description="Get paginated list of orders with filtering and search",
-        manual_parameters=[
-            openapi.Parameter('status', openapi.IN_QUERY, description="Filter by order status", type=openapi.TYPE_STRING),
-            openapi.Parameter('payment_status', openapi.IN_QUERY, description="Filter by payment status", type=openapi.TYPE_STRING),
-            openapi.Parameter('date_from', openapi.IN_QUERY, description="Filter by start date", type=openapi.TYPE_STRING, format='date'),
-            openapi.Parameter('date_to', openapi.IN_QUERY, description="Filter by end date", type=openapi.TYPE_STRING, format='date'),
-            openapi.Parameter('customer', openapi.IN_QUERY, description="Search by customer email/name", type=openapi.TYPE_STRING),
-            openapi.Parameter('sort_by', openapi.IN_QUERY, description="Sort field", type=openapi.TYPE_STRING),
-            openapi.Parameter('sort_order', openapi.IN_QUERY, description="Sort order (asc/desc)", type=openapi.TYPE_STRING),
-            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
-        ],
-        responses={
-            200: DashboardOrderSerializer(many=True),
-            401: openapi.Response(description="Unauthorized"),
-            403: openapi.Response(description="Permission denied")
-        }
-    )
-    def get(self, request):
-        orders = Order.objects.select_related('user').prefetch_related('items').all()
-        
+    def filter_orders(self, request, orders):
         # Filtering
         status_filter = request.query_params.get('status')
         if status_filter:
@@ -495,6 +525,33 @@ class DashboardOrderListView(APIView):
         else:
             orders = orders.order_by(sort_by)
         
+        return orders
+
+class DashboardOrderListView(DashboardOrderFilterMixin, APIView):
+    permission_classes = [HasOrderManagementPermission]
+    pagination_class = PageNumberPagination
+
+    @swagger_auto_schema(
+        operation_description="Get paginated list of orders with filtering and search",
+        manual_parameters=[
+            openapi.Parameter('status', openapi.IN_QUERY, description="Filter by order status", type=openapi.TYPE_STRING),
+            openapi.Parameter('payment_status', openapi.IN_QUERY, description="Filter by payment status", type=openapi.TYPE_STRING),
+            openapi.Parameter('date_from', openapi.IN_QUERY, description="Filter by start date", type=openapi.TYPE_STRING, format='date'),
+            openapi.Parameter('date_to', openapi.IN_QUERY, description="Filter by end date", type=openapi.TYPE_STRING, format='date'),
+            openapi.Parameter('customer', openapi.IN_QUERY, description="Search by customer email/name", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_by', openapi.IN_QUERY, description="Sort field", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_order', openapi.IN_QUERY, description="Sort order (asc/desc)", type=openapi.TYPE_STRING),
+            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: DashboardOrderSerializer(many=True),
+            401: openapi.Response(description="Unauthorized"),
+            403: openapi.Response(description="Permission denied")
+        }
+    )
+    def get(self, request):
+        orders = self.filter_orders(request, Order.objects.select_related('user').prefetch_related('items'))
+        
         # Pagination
         paginator = self.pagination_class()
         paginated_orders = paginator.paginate_queryset(orders, request)
@@ -507,6 +564,45 @@ class DashboardOrderListView(APIView):
         
         return Response(format_response_data(serializer.data, user=request.user))
 
+class DashboardOrderExportView(DashboardOrderFilterMixin, APIView):
+    permission_classes = [HasOrderManagementPermission]
+
+    @swagger_auto_schema(
+        operation_description="Stream all orders matching the list filters as CSV or JSON Lines",
+        manual_parameters=[
+            openapi.Parameter('status', openapi.IN_QUERY, description="Filter by order status", type=openapi.TYPE_STRING),
+            openapi.Parameter('payment_status', openapi.IN_QUERY, description="Filter by payment status", type=openapi.TYPE_STRING),
+            openapi.Parameter('date_from', openapi.IN_QUERY, description="Filter by start date", type=openapi.TYPE_STRING, format='date'),
+            openapi.Parameter('date_to', openapi.IN_QUERY, description="Filter by end date", type=openapi.TYPE_STRING, format='date'),
+            openapi.Parameter('customer', openapi.IN_QUERY, description="Search by customer email/name", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_by', openapi.IN_QUERY, description="Sort field", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_order', openapi.IN_QUERY, description="Sort order (asc/desc)", type=openapi.TYPE_STRING),
+            openapi.Parameter('export_format', openapi.IN_QUERY, description="Export format (csv/jsonl)", type=openapi.TYPE_STRING, enum=list(EXPORT_FORMATS), default='csv'),
+        ],
+        responses={
+            200: openapi.Response(description="Orders export file"),
+            400: openapi.Response(description="Unknown export format"),
+            401: openapi.Response(description="Unauthorized"),
+            403: openapi.Response(description="Permission denied")
+        }
+    )
+    def get(self, request):
+        file_format = request.query_params.get('export_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response({
+                'status': 'error',
+                'message': f"Unknown export format. Use one of: {', '.join(EXPORT_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        orders = self.filter_orders(request, Order.objects.all())
+
+        log_audit_action(request.user, 'EXPORT', 'Order', None, {
+            'filters': request.query_params.dict(),
+            'format': file_format
+        }, request)
+
+        return streaming_export(orders, ORDER_EXPORT_COLUMNS, file_format, 'orders')
+
 class DashboardOrderDetailView(APIView):
     permission_classes = [HasOrderManagementPermission]
 
@@ -536,6 +632,7 @@ class DashboardOrderDetailView(APIView):
         ),
         responses={
             200: DashboardOrderSerializer,
+            400: openapi.Response(description="Cancelled orders cannot change status"),
             401: openapi.Response(description="Unauthorized"),
             403: openapi.Response(description="Permission denied"),
             404: openapi.Response(description="Order not found")
@@ -544,18 +641,29 @@ class DashboardOrderDetailView(APIView):
     def put(self, request, order_id):
         order = get_object_or_404(Order, id=order_id)
         old_status = order.status
+        new_status = request.data.get('status', old_status)
         
-        # Update order fields
-        if 'status' in request.data:
-            order.status = request.data['status']
-        
-        if 'shipping_address' in request.data:
-            order.shipping_address = request.data['shipping_address']
-        
-        if 'payment_status' in request.data:
-            order.payment_status = request.data['payment_status']
+        # Their stock has been put back; reopening would not take it again
+        if old_status == 'cancelled' and new_status != 'cancelled':
+            return Response({
+                'status': 'error',
+                'message': 'Cancelled orders cannot change status'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        order.save()
+        with transaction.atomic():
+            # Update order fields; cancelling restores inventory like DELETE
+            if new_status == 'cancelled':
+                cancel_order(order)
+            else:
+                order.status = new_status
+            
+            if 'shipping_address' in request.data:
+                order.shipping_address = request.data['shipping_address']
+            
+            if 'payment_status' in request.data:
+                order.payment_status = request.data['payment_status']
+            
+            order.save()
         
         log_audit_action(request.user, 'STATUS_CHANGE', 'Order', order.id, {
             'old_status': old_status,
@@ -585,13 +693,8 @@ class DashboardOrderDetailView(APIView):
     def delete(self, request, order_id):
         order = get_object_or_404(Order, id=order_id)
         
-        # Restore product inventory
-        for item in order.items.all():
-            item.product.stock_quantity += item.quantity
-            item.product.save()
-        
-        order.status = 'cancelled'
-        order.save()
+        # Restore product inventory, once per order
+        cancel_order(order)
         
         log_audit_action(request.user, 'DELETE', 'Order', order.id, {
             'order_number': order.order_number,
@@ -604,29 +707,12 @@ class DashboardOrderDetailView(APIView):
         })
 
 # Payment Analytics Views
-class DashboardPaymentListView(APIView):
-    permission_classes = [HasPaymentViewPermission]
-    pagination_class = PageNumberPagination
+class DashboardPaymentFilterMixin:
+    """
+    Filtering and sorting shared by the payment list and export.
+    """
 
-    @swagger_auto_schema(
-        operation_description="Get paginated list of payment transactions",
-        manual_parameters=[
-            openapi.Parameter('status', openapi.IN_QUERY, description="Filter by payment status", type=openapi.TYPE_STRING),
-            openapi.Parameter('date_from', openapi.IN_QUERY, description="Filter by start date", type=openapi.TYPE_STRING, format='date'),
-            openapi.Parameter('date_to', openapi.IN_QUERY, description="Filter by end date", type=openapi.TYPE_STRING, format='date'),
-            openapi.Parameter('sort_by', openapi.IN_QUERY, description="Sort field", type=openapi.TYPE_STRING),
-            openapi.Parameter('sort_order', openapi.IN_QUERY, description="Sort order (asc/desc)", type=openapi.TYPE_STRING),
-            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
-        ],
-        responses={
-            200: DashboardPaymentSerializer(many=True),
-            401: openapi.Response(description="Unauthorized"),
-            403: openapi.Response(description="Permission denied")
-        }
-    )
-    def get(self, request):
-        payments = Payment.objects.select_related('order__user').all()
-        
+    def filter_payments(self, request, payments):
         # Filtering
         status_filter = request.query_params.get('status')
         if status_filter:
@@ -649,6 +735,31 @@ class DashboardPaymentListView(APIView):
         else:
             payments = payments.order_by(sort_by)
         
+        return payments
+
+class DashboardPaymentListView(DashboardPaymentFilterMixin, APIView):
+    permission_classes = [HasPaymentViewPermission]
+    pagination_class = PageNumberPagination
+
+    @swagger_auto_schema(
+        operation_description="Get paginated list of payment transactions",
+        manual_parameters=[
+            openapi.Parameter('status', openapi.IN_QUERY, description="Filter by payment status", type=openapi.TYPE_STRING),
+            openapi.Parameter('date_from', openapi.IN_QUERY, description="Filter by start date", type=openapi.TYPE_STRING, format='date'),
+            openapi.Parameter('date_to', openapi.IN_QUERY, description="Filter by end date", type=openapi.TYPE_STRING, format='date'),
+            openapi.Parameter('sort_by', openapi.IN_QUERY, description="Sort field", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_order', openapi.IN_QUERY, description="Sort order (asc/desc)", type=openapi.TYPE_STRING),
+            openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
+        ],
+        responses={
+            200: DashboardPaymentSerializer(many=True),
+            401: openapi.Response(description="Unauthorized"),
+            403: openapi.Response(description="Permission denied")
+        }
+    )
+    def get(self, request):
+        payments = self.filter_payments(request, Payment.objects.select_related('order__user'))
+        
         # Pagination
         paginator = self.pagination_class()
         paginated_payments = paginator.paginate_queryset(payments, request)
@@ -657,6 +768,43 @@ class DashboardPaymentListView(APIView):
         
         return Response(format_response_data(serializer.data, user=request.user))
 
+class DashboardPaymentExportView(DashboardPaymentFilterMixin, APIView):
+    permission_classes = [HasPaymentViewPermission]
+
+    @swagger_auto_schema(
+        operation_description="Stream all payments matching the list filters as CSV or JSON Lines",
+        manual_parameters=[
+            openapi.Parameter('status', openapi.IN_QUERY, description="Filter by payment status", type=openapi.TYPE_STRING),
+            openapi.Parameter('date_from', openapi.IN_QUERY, description="Filter by start date", type=openapi.TYPE_STRING, format='date'),
+            openapi.Parameter('date_to', openapi.IN_QUERY, description="Filter by end date", type=openapi.TYPE_STRING, format='date'),
+            openapi.Parameter('sort_by', openapi.IN_QUERY, description="Sort field", type=openapi.TYPE_STRING),
+            openapi.Parameter('sort_order', openapi.IN_QUERY, description="Sort order (asc/desc)", type=openapi.TYPE_STRING),
+            openapi.Parameter('export_format', openapi.IN_QUERY, description="Export format (csv/jsonl)", type=openapi.TYPE_STRING, enum=list(EXPORT_FORMATS), default='csv'),
+        ],
+        responses={
+            200: openapi.Response(description="Payments export file"),
+            400: openapi.Response(description="Unknown export format"),
+            401: openapi.Response(description="Unauthorized"),
+            403: openapi.Response(description="Permission denied")
+        }
+    )
+    def get(self, request):
+        file_format = request.query_params.get('export_format', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response({
+                'status': 'error',
+                'message': f"Unknown export format. Use one of: {', '.join(EXPORT_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        payments = self.filter_payments(request, Payment.objects.all())
+
+        log_audit_action(request.user, 'EXPORT', 'Payment', None, {
+            'filters': request.query_params.dict(),
+            'format': file_format
+        }, request)
+
+        return streaming_export(payments, PAYMENT_EXPORT_COLUMNS, file_format, 'payments')
+
 # Analytics Views
 class DashboardAnalyticsView(APIView):
     permission_classes = [HasAnalyticsPermission]
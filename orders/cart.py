@@ -0,0 +1,135 @@
+"""
+Cart writes.
+
+A cart line is identified by (product, size, color), which a unique
+constraint on CartItem enforces. replace_cart_items() diffs the submitted
+lines against the stored ones and writes only the difference: one
+bulk_create, one bulk_update and one delete, after resolving every product
+and variant with one query each. The query count of a cart replacement does
+not depend on the number of lines.
+
+update_cart_line() changes a single line in place with one conditional
+UPDATE (quantity = quantity + n) or one upsert, so a "+1" tap neither
+rewrites the cart nor holds locks on its other lines.
+"""
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Sum, prefetch_related_objects
+from django.http import Http404
+
+from Prouducts.inventory import resolve_variants
+from Prouducts.models import Product
+from .models import CartItem
+
+PRICE_FIELD = CartItem._meta.get_field('price')
+
+
+def line_key(product_id, size, color):
+    return product_id, size, color
+
+
+def merge_lines(items_data):
+    """
+    Submitted lines keyed by (product, size, color), in submission order.
+    Repeated lines add up their quantities; the first price given wins.
+    """
+    lines = {}
+    for item in items_data:
+        key = line_key(item['product'], item['size'], item['color'])
+        if key in lines:
+            lines[key]['quantity'] += item['quantity']
+        else:
+            lines[key] = {'quantity': item['quantity'], 'price': item.get('price')}
+    return lines
+
+
+@transaction.atomic
+def replace_cart_items(cart, items_data):
+    """
+    Make `cart` hold exactly the lines of `items_data` (dicts with product,
+    size, color, quantity and an optional price, defaulting to the product
+    price). Raises Http404 before writing anything if a product does not
+    exist. Leaves the new lines prefetched on `cart.items`.
+    """
+    lines = merge_lines(items_data)
+    product_ids = {product_id for product_id, _, _ in lines}
+    products = Product.objects.only('id', 'price').in_bulk(product_ids)
+    if len(products) < len(product_ids):
+        raise Http404('No Product matches the given query.')
+    variants = resolve_variants(lines)
+
+    existing = {line_key(item.product_id, item.size, item.color): item for item in cart.items.all()}
+
+    created, updated = [], []
+    for key, line in lines.items():
+        product_id, size, color = key
+        price = products[product_id].price if line['price'] is None else PRICE_FIELD.to_python(line['price'])
+        item = existing.pop(key, None)
+        if item is None:
+            created.append(CartItem(
+                cart=cart, product_id=product_id, variant_id=variants[key], size=size, color=color,
+                quantity=line['quantity'], price=price,
+            ))
+            continue
+        if (item.quantity, item.price, item.variant_id) != (line['quantity'], price, variants[key]):
+            item.quantity, item.price, item.variant_id = line['quantity'], price, variants[key]
+            updated.append(item)
+    stale = [item.pk for item in existing.values()]
+
+    if stale:
+        CartItem.objects.filter(pk__in=stale).delete()
+    if updated:
+        CartItem.objects.bulk_update(updated, ['quantity', 'price', 'variant'])
+    if created:
+        CartItem.objects.bulk_create(created)
+    cart._prefetched_objects_cache = {}
+    prefetch_related_objects([cart], 'items')
+    return cart
+
+
+def cart_total(cart):
+    """
+    Sum of price x quantity over the cart's lines, from one aggregate query.
+    """
+    total = CartItem.objects.filter(cart=cart).aggregate(
+        total=Sum(F('price') * F('quantity'), output_field=models.DecimalField(max_digits=12, decimal_places=2))
+    )['total']
+    return total or 0
+
+
+def _new_line(cart, product, size, color, quantity):
+    variant_id = resolve_variants([(product.pk, size, color)])[(product.pk, size, color)]
+    return CartItem(
+        cart=cart, product=product, variant_id=variant_id, size=size, color=color, quantity=quantity,
+        price=product.price,
+    )
+
+
+@transaction.atomic
+def update_cart_line(cart, product, size, color, quantity=None, delta=None):
+    """
+    Set the quantity of one cart line, or add `delta` (possibly negative) to
+    it. A line that reaches zero is removed; a new line takes the product
+    price. Returns the line afterwards, or None when it is gone.
+    """
+    lines = CartItem.objects.filter(cart=cart, product=product, size=size, color=color)
+    if quantity is not None:
+        if quantity == 0:
+            lines.delete()
+        else:
+            CartItem.objects.bulk_create(
+                [_new_line(cart, product, size, color, quantity)],
+                update_conflicts=True,
+                unique_fields=['cart', 'product', 'size', 'color'],
+                update_fields=['quantity'],
+            )
+    elif delta < 0:
+        if not lines.filter(quantity__gt=-delta).update(quantity=F('quantity') + delta):
+            lines.delete()
+    elif not lines.update(quantity=F('quantity') + delta):
+        try:
+            with transaction.atomic():
+                _new_line(cart, product, size, color, delta).save(force_insert=True)
+        except IntegrityError:
+            # Another request created the line in between.
+            lines.update(quantity=F('quantity') + delta)
+    return lines.first()
@@ -0,0 +1,374 @@
+"""
+Pluggable cart storage behind the cart endpoints and order creation.
+
+DatabaseCartBackend keeps carts in Cart / CartItem (see cart.py).
+
+RedisCartBackend keeps each cart in one Redis hash, `cart:<user id>`:
+
+    id, created_at, updated_at       the Cart row and its timestamps
+    q:<line>                         quantity (HINCRBY for +n / -n taps)
+    l:<line>                         {"variant": id, "price": "..."}
+
+where <line> is the JSON [product, size, color]. Every write adds the user
+to the `carts:dirty` set, and flush_dirty_carts() (the flush_carts beat
+task) writes dirty carts back to Cart / CartItem in batches, one diff per
+cart. The database then sees one write per cart per flush interval instead
+of one transaction per tap. A cart missing from Redis is loaded from the
+database on first access; line ids are only known for carts read from the
+database.
+
+CART_BACKEND selects the backend: 'redis' or 'database'. When Redis
+cannot be reached, requests fall back to the database backend. Changes made
+during the outage are overwritten when the cart's Redis copy is flushed.
+Order placement never falls back: it reads and clears the cart in Redis only
+(get_for_order / clear_ordered), so an order cannot be placed from a stale
+database copy, nor its lines come back with the next flush. During an outage
+it fails with CartUnavailable.
+"""
+import functools
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+from Prouducts.inventory import resolve_variants
+from Prouducts.models import Product
+from .cart import PRICE_FIELD, cart_total, merge_lines, replace_cart_items, update_cart_line
+from .models import Cart
+
+logger = logging.getLogger(__name__)
+
+CART_KEY = 'cart:{}'
+DIRTY_CARTS_KEY = 'carts:dirty'
+# A cart untouched for this long leaves Redis; it is flushed well before.
+CART_REDIS_TIMEOUT = 30 * 24 * 60 * 60
+# Carts written to the database per flush transaction.
+CART_FLUSH_BATCH_SIZE = 500
+
+
+class CartUnavailable(Exception):
+    """
+    The store holding the carts cannot be reached.
+    """
+
+
+@dataclass
+class CartLine:
+    product_id: int
+    size: str
+    color: str
+    quantity: int
+    price: Decimal
+    variant_id: int = None
+    id: int = None
+
+    @classmethod
+    def from_item(cls, item):
+        return cls(
+            product_id=item.product_id, size=item.size, color=item.color, quantity=item.quantity,
+            price=item.price, variant_id=item.variant_id, id=item.pk,
+        )
+
+
+@dataclass
+class CartState:
+    id: int
+    user_id: int
+    created_at: datetime
+    updated_at: datetime
+    lines: list = field(default_factory=list)
+
+    @property
+    def total_amount(self):
+        return sum((line.price * line.quantity for line in self.lines), Decimal('0'))
+
+
+class BaseCartBackend:
+    def get(self, user):
+        """
+        The user's CartState, creating an empty cart if needed.
+        """
+        raise NotImplementedError
+
+    def replace(self, user, items_data):
+        """
+        Replace the cart's lines (dicts with product, size, color, quantity
+        and an optional price). Raises Http404 for unknown products.
+        """
+        raise NotImplementedError
+
+    def update_line(self, user, product, size, color, quantity=None, delta=None):
+        """
+        Set or increment one line; returns (CartLine or None, cart total).
+        """
+        raise NotImplementedError
+
+    def clear(self, user):
+        """
+        Empty the cart. Inside a transaction, takes effect on commit.
+        """
+        raise NotImplementedError
+
+    def get_for_order(self, user):
+        """
+        The cart to turn into an order, read from the store that holds it.
+        Raises CartUnavailable when that store cannot be reached.
+        """
+        return self.get(user)
+
+    def clear_ordered(self, user):
+        """
+        Empty the cart of an order being placed, within its transaction.
+        Raises CartUnavailable, rolling the order back, when the store
+        cannot be reached.
+        """
+        return self.clear(user)
+
+
+class DatabaseCartBackend(BaseCartBackend):
+    def cart(self, user):
+        return Cart.objects.get_or_create(user=user)[0]
+
+    def state(self, cart, items):
+        return CartState(
+            id=cart.pk, user_id=cart.user_id, created_at=cart.created_at, updated_at=cart.updated_at,
+            lines=[CartLine.from_item(item) for item in items],
+        )
+
+    def get(self, user):
+        cart = self.cart(user)
+        return self.state(cart, cart.items.all())
+
+    def replace(self, user, items_data):
+        cart = replace_cart_items(self.cart(user), items_data)
+        return self.state(cart, cart.items.all())
+
+    def update_line(self, user, product, size, color, quantity=None, delta=None):
+        cart = self.cart(user)
+        line = update_cart_line(cart, product, size, color, quantity=quantity, delta=delta)
+        return (CartLine.from_item(line) if line else None), cart_total(cart)
+
+    def clear(self, user):
+        cart = self.cart(user)
+        cart.items.all().delete()
+        return self.state(cart, [])
+
+
+def _line_field(prefix, product_id, size, color):
+    return prefix + json.dumps([product_id, size, color])
+
+
+def _line_details(variant_id, price):
+    return json.dumps({'variant': variant_id, 'price': str(price)})
+
+
+def _with_database_fallback(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except RedisError:
+            logger.warning('Cart store unavailable, using the database', exc_info=True)
+            return getattr(DatabaseCartBackend(), method.__name__)(*args, **kwargs)
+    return wrapper
+
+
+class RedisCartBackend(BaseCartBackend):
+    def __init__(self, client=None):
+        self.client = client if client is not None else get_redis_connection('default')
+
+    def read(self, user_id):
+        """
+        CartState from the user's hash, or None when it is not in Redis.
+        """
+        values = {name.decode(): value.decode() for name, value in self.client.hgetall(CART_KEY.format(user_id)).items()}
+        if 'id' not in values:
+            return None
+        lines = []
+        for name, quantity in values.items():
+            if not name.startswith('q:') or 'l:' + name[2:] not in values:
+                continue
+            product_id, size, color = json.loads(name[2:])
+            details = json.loads(values['l:' + name[2:]])
+            lines.append(CartLine(
+                product_id=product_id, size=size, color=color, quantity=int(quantity),
+                price=Decimal(details['price']), variant_id=details['variant'],
+            ))
+        return CartState(
+            id=int(values['id']), user_id=user_id,
+            created_at=datetime.fromisoformat(values['created_at']),
+            updated_at=datetime.fromisoformat(values['updated_at']),
+            lines=lines,
+        )
+
+    def fields(self, state):
+        fields = {
+            'id': state.id, 'created_at': state.created_at.isoformat(), 'updated_at': state.updated_at.isoformat(),
+        }
+        for line in state.lines:
+            fields[_line_field('q:', line.product_id, line.size, line.color)] = line.quantity
+            fields[_line_field('l:', line.product_id, line.size, line.color)] = _line_details(line.variant_id, line.price)
+        return fields
+
+    def load(self, user):
+        """
+        The user's cart, copied into Redis from the database if missing.
+        """
+        state = self.read(user.pk)
+        if state is not None:
+            return state
+        state = DatabaseCartBackend().get(user)
+        key = CART_KEY.format(user.pk)
+        pipeline = self.client.pipeline()
+        # HSETNX keeps anything a concurrent request wrote in the meantime.
+        for name, value in self.fields(state).items():
+            pipeline.hsetnx(key, name, value)
+        pipeline.expire(key, CART_REDIS_TIMEOUT)
+        pipeline.execute()
+        return state
+
+    def touch(self, pipeline, user_id):
+        key = CART_KEY.format(user_id)
+        pipeline.hset(key, 'updated_at', timezone.now().isoformat())
+        pipeline.expire(key, CART_REDIS_TIMEOUT)
+        pipeline.sadd(DIRTY_CARTS_KEY, user_id)
+
+    @_with_database_fallback
+    def get(self, user):
+        return self.load(user)
+
+    @_with_database_fallback
+    def replace(self, user, items_data):
+        lines = merge_lines(items_data)
+        product_ids = {product_id for product_id, _, _ in lines}
+        products = Product.objects.only('id', 'price').in_bulk(product_ids)
+        if len(products) < len(product_ids):
+            raise Http404('No Product matches the given query.')
+        variants = resolve_variants(lines)
+        state = self.load(user)
+        state.updated_at = timezone.now()
+        state.lines = []
+        for (product_id, size, color), line in lines.items():
+            state.lines.append(CartLine(
+                product_id=product_id, size=size, color=color, quantity=line['quantity'],
+                price=products[product_id].price if line['price'] is None else PRICE_FIELD.to_python(line['price']),
+                variant_id=variants[(product_id, size, color)],
+            ))
+        key = CART_KEY.format(user.pk)
+        pipeline = self.client.pipeline()
+        pipeline.delete(key)
+        pipeline.hset(key, mapping=self.fields(state))
+        self.touch(pipeline, user.pk)
+        pipeline.execute()
+        return state
+
+    @_with_database_fallback
+    def update_line(self, user, product, size, color, quantity=None, delta=None):
+        self.load(user)
+        key = CART_KEY.format(user.pk)
+        quantity_field = _line_field('q:', product.pk, size, color)
+        details_field = _line_field('l:', product.pk, size, color)
+        details = _line_details(resolve_variants([(product.pk, size, color)])[(product.pk, size, color)], product.price)
+        pipeline = self.client.pipeline()
+        if quantity == 0:
+            pipeline.hdel(key, quantity_field, details_field)
+        elif quantity is not None:
+            pipeline.hset(key, quantity_field, quantity)
+            pipeline.hsetnx(key, details_field, details)
+        else:
+            pipeline.hincrby(key, quantity_field, delta)
+            pipeline.hsetnx(key, details_field, details)
+        self.touch(pipeline, user.pk)
+        result = pipeline.execute()
+        if quantity is None and result[0] <= 0:
+            self.client.hdel(key, quantity_field, details_field)
+
+        state = self.read(user.pk)
+        line = next(
+            (line for line in state.lines if (line.product_id, line.size, line.color) == (product.pk, size, color)),
+            None,
+        )
+        return line, state.total_amount
+
+    def write_empty(self, user_id, state):
+        state.lines = []
+        state.updated_at = timezone.now()
+        key = CART_KEY.format(user_id)
+        pipeline = self.client.pipeline()
+        pipeline.delete(key)
+        pipeline.hset(key, mapping=self.fields(state))
+        self.touch(pipeline, user_id)
+        pipeline.execute()
+        return state
+
+    @_with_database_fallback
+    def clear(self, user):
+        state = self.load(user)
+        # A Redis failure after the commit is logged and leaves the lines.
+        transaction.on_commit(lambda: self.write_empty(user.pk, state), robust=True)
+        state.lines = []
+        return state
+
+    def get_for_order(self, user):
+        try:
+            return self.load(user)
+        except RedisError as error:
+            raise CartUnavailable('The cart cannot be read right now.') from error
+
+    def clear_ordered(self, user):
+        # Written before the order commits: if Redis fails the order rolls
+        # back, rather than committing while Redis still holds its lines.
+        state = self.get_for_order(user)
+        try:
+            return self.write_empty(user.pk, state)
+        except RedisError as error:
+            raise CartUnavailable('The cart cannot be cleared right now.') from error
+
+
+def flush_dirty_carts(backend=None, batch_size=CART_FLUSH_BATCH_SIZE):
+    """
+    Write the carts changed in Redis back to Cart / CartItem, `batch_size`
+    carts per transaction. Lines of products deleted in the meantime are
+    dropped. Returns the number of carts written.
+    """
+    backend = backend or get_cart_backend()
+    if not isinstance(backend, RedisCartBackend):
+        return 0
+    flushed = 0
+    while True:
+        user_ids = backend.client.spop(DIRTY_CARTS_KEY, batch_size)
+        if not user_ids:
+            return flushed
+        try:
+            states = [state for state in (backend.read(int(user_id)) for user_id in user_ids) if state is not None]
+            existing = set(Product.objects.filter(
+                pk__in={line.product_id for state in states for line in state.lines}
+            ).values_list('pk', flat=True))
+            with transaction.atomic():
+                for state in states:
+                    replace_cart_items(Cart(pk=state.id, user_id=state.user_id), [
+                        {
+                            'product': line.product_id, 'size': line.size, 'color': line.color,
+                            'quantity': line.quantity, 'price': line.price,
+                        }
+                        for line in state.lines if line.product_id in existing
+                    ])
+        except Exception:
+            # Put the batch back for the next run.
+            backend.client.sadd(DIRTY_CARTS_KEY, *user_ids)
+            raise
+        flushed += len(states)
+
+
+def get_cart_backend():
+    if settings.CART_BACKEND == 'redis':
+        return RedisCartBackend()
+    return DatabaseCartBackend()
@@ -0,0 +1,75 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from orders.cart_backends import get_cart_backend
+from orders.views import OrderListCreateAPIView
+from Prouducts.models import Category, Product
+from user_profile.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Measure order placement time and query count for carts of several sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 50], help='Cart sizes to measure')
+        parser.add_argument('--repeat', type=int, default=20, help='Orders placed per cart size')
+
+    def handle(self, *args, **options):
+        # Everything runs inside one transaction that is rolled back at the end,
+        # so the benchmark never leaves rows behind.
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                email='benchmark@example.com', username='benchmark-orders', password='benchmark',
+            )
+            UserProfile.objects.create(user=user, address='Benchmark address')
+            category = Category.objects.create(name='Benchmark')
+            products = Product.objects.bulk_create(
+                [
+                    Product(
+                        name=f'Benchmark shoe {i}',
+                        brand='Benchmark',
+                        description='Benchmark product',
+                        price=100,
+                        category=category,
+                        stock_quantity=options['repeat'] * len(options['lines']),
+                    )
+                    for i in range(max(options['lines']))
+                ],
+                batch_size=1000,
+            )
+
+            backend = get_cart_backend()
+            for lines in options['lines']:
+                items = [
+                    {'product': product.pk, 'size': '42', 'color': 'black', 'quantity': 1}
+                    for product in products[:lines]
+                ]
+                timings, queries = [], set()
+                for _ in range(options['repeat']):
+                    backend.replace(user, items)
+                    with CaptureQueriesContext(connection) as context:
+                        start = time.perf_counter()
+                        response = self.place(user)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 201:
+                        raise RuntimeError(f'Order placement failed: {response.data}')
+                    queries.add(len(context.captured_queries))
+                self.stdout.write(
+                    f'{lines:>4} lines   median {statistics.median(timings):8.2f} ms   '
+                    f'max {max(timings):8.2f} ms   queries {", ".join(map(str, sorted(queries)))}'
+                )
+
+            transaction.set_rollback(True)
+
+    def place(self, user):
+        request = APIRequestFactory().post('/orders/orders/', {'payment_status': 'pending'}, format='json')
+        force_authenticate(request, user=user)
+        response = OrderListCreateAPIView.as_view()(request)
+        response.render()
+        return response
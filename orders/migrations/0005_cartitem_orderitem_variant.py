@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def link_variants(apps, schema_editor):
+    ProductVariant = apps.get_model('Prouducts', 'ProductVariant')
+    variants = {
+        (product_id, size, color): pk
+        for pk, product_id, size, color in ProductVariant.objects.values_list('pk', 'product_id', 'size', 'color')
+    }
+    for model_name in ('CartItem', 'OrderItem'):
+        model = apps.get_model('orders', model_name)
+        items = []
+        for item in model.objects.only('id', 'product_id', 'size', 'color').iterator(chunk_size=1000):
+            item.variant_id = (
+                variants.get((item.product_id, item.size, item.color))
+                or variants.get((item.product_id, item.size, ''))
+                or variants.get((item.product_id, '', item.color))
+            )
+            if item.variant_id:
+                items.append(item)
+        model.objects.bulk_update(items, ['variant'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0011_product_variant'),
+        ('orders', '0004_remove_order_billing_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Prouducts.productvariant'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='variant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Prouducts.productvariant'),
+        ),
+        migrations.RunPython(link_variants, migrations.RunPython.noop),
+    ]
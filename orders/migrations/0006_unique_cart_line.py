@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    CartItem = apps.get_model('orders', 'CartItem')
+    duplicates = CartItem.objects.values('cart_id', 'product_id', 'size', 'color').annotate(
+        lines=Count('pk'), first=Min('pk'), total=Sum('quantity')
+    ).filter(lines__gt=1)
+    for line in duplicates.iterator():
+        CartItem.objects.filter(pk=line['first']).update(quantity=line['total'])
+        CartItem.objects.filter(
+            cart_id=line['cart_id'], product_id=line['product_id'], size=line['size'], color=line['color'],
+        ).exclude(pk=line['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Prouducts', '0017_product_effective_price'),
+        ('orders', '0005_cartitem_orderitem_variant'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product', 'size', 'color'), name='unique_cart_line'),
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 from django.conf import settings
-from Prouducts.models import Product
+from Prouducts.models import Product, ProductVariant
 
 # Create your models here.
 
@@ -12,11 +12,18 @@ class Cart(models.Model):
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True)
     size = models.CharField(max_length=20)
     color = models.CharField(max_length=20)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        constraints = [
+            # One line per product, size and color; line operations upsert on it.
+            models.UniqueConstraint(fields=['cart', 'product', 'size', 'color'], name='unique_cart_line'),
+        ]
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -38,6 +45,7 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    variant = models.ForeignKey(ProductVariant, on_delete=models.SET_NULL, null=True, blank=True)
     size = models.CharField(max_length=20)
     color = models.CharField(max_length=20)
     quantity = models.PositiveIntegerField()
@@ -0,0 +1,113 @@
+"""
+Order placement.
+
+place_order() turns a cart into an order with a fixed number of queries
+whatever the number of lines: the cart is read from its store (see
+cart_backends.py), the products of all lines are checked with one query,
+and the writes are the stock reservation (see Prouducts.inventory), one
+Order insert, one OrderItem bulk_create and the cart clear. Only the writes
+run inside the transaction, so it stays open for a handful of statements
+instead of a round trip per line.
+
+cancel_order() is the way back: it puts the items into stock again, once
+per order.
+"""
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from Prouducts.inventory import InsufficientStock, reserve_stock, resolve_variants, restock
+from Prouducts.models import Product
+from .models import Order, OrderItem
+
+
+class OrderPlacementError(Exception):
+    """
+    The cart cannot be ordered; the message is shown to the user.
+    """
+
+
+def check_lines(lines):
+    """
+    Raise OrderPlacementError if the cart is empty or a product in it is
+    gone or unavailable.
+    """
+    if not lines:
+        raise OrderPlacementError('Cart is empty.')
+    products = {
+        product_id: (name, is_available)
+        for product_id, name, is_available in Product.objects.filter(
+            pk__in={line.product_id for line in lines}
+        ).values_list('pk', 'name', 'is_available')
+    }
+    for line in lines:
+        name, is_available = products.get(line.product_id, (line.product_id, False))
+        if not is_available:
+            raise OrderPlacementError(f'Product {name} is not available.')
+
+
+def place_order(user, backend, shipping_address, payment_status='pending'):
+    """
+    Create an order from the user's cart in `backend`, take its lines out of
+    stock and clear the cart. Returns the order with its items. Raises
+    CartUnavailable, placing nothing, when the cart store is unreachable.
+    """
+    cart = backend.get_for_order(user)
+    check_lines(cart.lines)
+    with transaction.atomic():
+        try:
+            reserve_stock((line.product_id, line.variant_id, line.quantity) for line in cart.lines)
+        except InsufficientStock as error:
+            raise OrderPlacementError(str(error)) from error
+        order = Order.objects.create(
+            user=user,
+            order_number=get_random_string(12),
+            status='pending',
+            total_amount=cart.total_amount,
+            shipping_address=shipping_address,
+            payment_status=payment_status,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line.product_id,
+                variant_id=line.variant_id,
+                size=line.size,
+                color=line.color,
+                quantity=line.quantity,
+                price_at_purchase=line.price,
+            )
+            for line in cart.lines
+        ])
+        backend.clear_ordered(user)
+    return order
+
+
+def order_stock_lines(order):
+    """
+    (product_id, variant_id, quantity) of the order's items. Items whose
+    variant was removed are matched again by size and color.
+    """
+    items = list(order.items.values_list('product_id', 'variant_id', 'size', 'color', 'quantity'))
+    variants = resolve_variants(
+        (product_id, size, color) for product_id, variant_id, size, color, _ in items if variant_id is None
+    )
+    return [
+        (product_id, variant_id or variants[(product_id, size, color)], quantity)
+        for product_id, variant_id, size, color, quantity in items
+    ]
+
+
+@transaction.atomic
+def cancel_order(order):
+    """
+    Mark the order cancelled and put its items back into stock. Returns
+    False, restocking nothing, when it was already cancelled.
+    """
+    if not Order.objects.filter(pk=order.pk).exclude(status='cancelled').update(
+        status='cancelled', updated_at=timezone.now()
+    ):
+        return False
+    restock(order_stock_lines(order))
+    order.status = 'cancelled'
+    return True
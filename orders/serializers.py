@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Cart, CartItem, Order, OrderItem, Payment
+from .models import Order, OrderItem, Payment
 from Prouducts.models import Product
 from user_profile.models import UserProfile
 class UserInfoSerializer(serializers.ModelSerializer):
@@ -8,29 +8,72 @@ class UserInfoSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'address', 'state', 'city', 'country']
         read_only_fields = ['user']
 
-class CartItemSerializer(serializers.ModelSerializer):
-    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
-    class Meta:
-        model = CartItem
-        fields = ['id', 'product', 'size', 'color', 'quantity', 'price']
+class CartItemSerializer(serializers.Serializer):
+    """
+    A CartLine from the cart backend. `id` is null for lines not yet
+    written to the database.
+    """
+    id = serializers.IntegerField(read_only=True, allow_null=True)
+    product = serializers.IntegerField(source='product_id', read_only=True)
+    variant = serializers.IntegerField(source='variant_id', read_only=True, allow_null=True)
+    size = serializers.CharField(read_only=True)
+    color = serializers.CharField(read_only=True)
+    quantity = serializers.IntegerField(read_only=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
-class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True)
-    total_amount = serializers.SerializerMethodField()
+class CartReplaceItemSerializer(serializers.Serializer):
+    """
+    One submitted line of a cart replacement. Products are looked up
+    together when the cart is written (404 for unknown ones), not one query
+    per line here.
+    """
+    product = serializers.IntegerField(min_value=1)
+    size = serializers.CharField(max_length=20, allow_blank=True)
+    color = serializers.CharField(max_length=20, allow_blank=True)
+    quantity = serializers.IntegerField(min_value=1)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
 
-    class Meta:
-        model = Cart
-        fields = ['id', 'user', 'items', 'total_amount', 'created_at', 'updated_at']
-        read_only_fields = ['user', 'total_amount', 'created_at', 'updated_at']
+class CartReplaceSerializer(serializers.Serializer):
+    items = CartReplaceItemSerializer(many=True, required=False)
+
+class CartLineUpdateSerializer(serializers.Serializer):
+    """
+    One cart line operation: set `quantity` (0 removes the line) or add
+    `delta` (negative to take away).
+    """
+    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.only('id', 'price'))
+    size = serializers.CharField(max_length=20, allow_blank=True)
+    color = serializers.CharField(max_length=20, allow_blank=True)
+    quantity = serializers.IntegerField(min_value=0, required=False)
+    delta = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        if ('quantity' in attrs) == ('delta' in attrs):
+            raise serializers.ValidationError('Provide either quantity or delta.')
+        if attrs.get('delta') == 0:
+            raise serializers.ValidationError({'delta': 'Must not be zero.'})
+        return attrs
+
+class CartSerializer(serializers.Serializer):
+    """
+    A CartState from the cart backend.
+    """
+    id = serializers.IntegerField(read_only=True)
+    user = serializers.IntegerField(source='user_id', read_only=True)
+    items = CartItemSerializer(source='lines', many=True, read_only=True)
+    total_amount = serializers.SerializerMethodField()
+    created_at = serializers.DateTimeField(read_only=True)
+    updated_at = serializers.DateTimeField(read_only=True)
 
     def get_total_amount(self, obj):
-        return sum([item.price * item.quantity for item in obj.items.all()])
+        return obj.total_amount
 
 class OrderItemSerializer(serializers.ModelSerializer):
     product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'size', 'color', 'quantity', 'price_at_purchase']
+        fields = ['id', 'product', 'variant', 'size', 'color', 'quantity', 'price_at_purchase']
+        read_only_fields = ['variant']
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from .cart_backends import flush_dirty_carts
+
+
+@shared_task
+def flush_carts():
+    return flush_dirty_carts()
@@ -1,12 +1,16 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from Prouducts.models import Product, Category
 from .models import Cart, CartItem, Order, OrderItem, Payment, Country, State, City
+import threading
 from unittest.mock import patch
+from redis.exceptions import ConnectionError as RedisConnectionError
 from user_profile.models import UserProfile
+from . import cart_backends
+from .placement import cancel_order
 
 User = get_user_model()
 
@@ -59,11 +63,102 @@ class TestOrderAppViews(TestCase):
         response = self.client.put(url, cart_data, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['items']), 1)
+        self.assertEqual(response.data['items'][0]['variant'], self.product.variants.get(size='42').id)
         self.assertEqual(float(response.data['total_amount']), 200.00)
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['items'], [])
 
+    def test_cart_replace_writes_only_the_diff_with_fixed_queries(self):
+        url = reverse('cart')
+        products = [
+            Product.objects.create(name=f"Shoe {i}", brand="Test Brand", description="Shoe.", price=50.00, category=self.category)
+            for i in range(30)
+        ]
+
+        def lines(first, last, quantity=1):
+            return {'items': [
+                {'product': product.id, 'size': '42', 'color': 'red', 'quantity': quantity}
+                for product in products[first:last]
+            ]}
+
+        # Each replacement deletes, updates and creates lines, whatever their number.
+        self.client.put(url, lines(0, 3), format='json')
+        with self.assertNumQueries(10):
+            response = self.client.put(url, lines(1, 4, quantity=2), format='json')
+        self.assertEqual(float(response.data['total_amount']), 300.00)
+        kept_line = CartItem.objects.get(product=products[3])
+
+        with self.assertNumQueries(10):
+            response = self.client.put(url, lines(3, 18, quantity=3), format='json')
+        self.assertEqual(len(response.data['items']), 15)
+        self.assertEqual(float(response.data['total_amount']), 2250.00)
+        # Kept lines are updated in place.
+        self.assertEqual(CartItem.objects.get(product=products[3]).pk, kept_line.pk)
+        self.assertEqual(CartItem.objects.count(), 15)
+
+        response = self.client.put(url, {'items': [
+            {'product': products[0].id, 'size': '42', 'color': 'red', 'quantity': 1},
+            {'product': 999999, 'size': '42', 'color': 'red', 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(CartItem.objects.count(), 15)
+
+    def test_cart_replace_validates_items(self):
+        url = reverse('cart')
+        line = {'product': self.product.id, 'size': '42', 'color': 'red', 'quantity': 1}
+        for invalid in (
+            {**line, 'product': 'abc'},
+            {**line, 'quantity': 0},
+            {**line, 'quantity': -2},
+            {key: value for key, value in line.items() if key != 'size'},
+            {key: value for key, value in line.items() if key != 'quantity'},
+        ):
+            response = self.client.put(url, {'items': [invalid]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(url, {'items': 'not a list'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CartItem.objects.exists())
+
+        # Numeric strings are accepted, and repeated lines add up as numbers.
+        response = self.client.put(url, {'items': [
+            {**line, 'product': str(self.product.id), 'quantity': '2'}, line,
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['items'][0]['quantity'], 3)
+        response = self.client.put(url, {'items': [{**line, 'product': '999999'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cart_line_operations(self):
+        url = reverse('cart-line')
+        line = {'product': self.product.id, 'size': '42', 'color': 'red'}
+        response = self.client.patch(url, {**line, 'delta': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['item']['quantity'], 1)
+        self.assertEqual(response.data['item']['variant'], self.product.variants.get(size='42').id)
+        self.assertEqual(float(response.data['total_amount']), 100.00)
+
+        other = Product.objects.create(name="Other Shoe", brand="Test Brand", description="Shoe.", price=30.00, category=self.category)
+        self.client.patch(url, {'product': other.id, 'size': '40', 'color': '', 'quantity': 2}, format='json')
+        response = self.client.patch(url, {**line, 'delta': 2}, format='json')
+        self.assertEqual(response.data['item']['quantity'], 3)
+        self.assertEqual(float(response.data['total_amount']), 360.00)
+        self.assertNotIn('items', response.data)
+
+        response = self.client.patch(url, {**line, 'quantity': 5}, format='json')
+        self.assertEqual(response.data['item']['quantity'], 5)
+        self.assertEqual(CartItem.objects.filter(product=self.product).count(), 1)
+
+        response = self.client.patch(url, {**line, 'delta': -2}, format='json')
+        self.assertEqual(response.data['item']['quantity'], 3)
+        response = self.client.patch(url, {**line, 'delta': -10}, format='json')
+        self.assertIsNone(response.data['item'])
+        self.assertEqual(float(response.data['total_amount']), 60.00)
+
+        for invalid in ({**line}, {**line, 'quantity': 1, 'delta': 1}, {**line, 'delta': 0}, {**line, 'quantity': -1}):
+            response = self.client.patch(url, invalid, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_order_creation_and_retrieval(self):
         cart_url = reverse('cart')
         self.client.put(cart_url, {
@@ -91,6 +186,93 @@ class TestOrderAppViews(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['id'], order_id)
 
+    def test_order_creation_query_count_does_not_grow_with_lines(self):
+        products = [
+            Product.objects.create(
+                name=f"Shoe {i}", brand="Test Brand", description="Shoe.", price=50.00, category=self.category,
+                stock_quantity=10,
+            )
+            for i in range(20)
+        ]
+        for count in (1, 20):
+            self.client.put(reverse('cart'), {'items': [
+                {'product': product.id, 'size': '42', 'color': 'red', 'quantity': 2} for product in products[:count]
+            ]}, format='json')
+            with self.assertNumQueries(16):
+                response = self.client.post(reverse('order-list'), {'payment_status': 'pending'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(len(response.data['items']), count)
+            self.assertEqual(float(response.data['total_amount']), 100.00 * count)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_order_placement_takes_stock_or_fails(self):
+        line = {'product': self.product.id, 'size': '42', 'color': 'red'}
+        self.client.put(reverse('cart'), {'items': [{**line, 'quantity': 4}]}, format='json')
+        response = self.client.post(reverse('order-list'), {'payment_status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.sizes, {'42': 1, '43': 3})
+        self.assertEqual(self.product.stock_quantity, 4)
+
+        self.client.put(reverse('cart'), {'items': [{**line, 'quantity': 2}]}, format='json')
+        response = self.client.post(reverse('order-list'), {'payment_status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Not enough stock', response.data['detail'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(len(self.client.get(reverse('cart')).data['items']), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.sizes, {'42': 1, '43': 3})
+
+        # A size the product does not stock is refused, not charged elsewhere.
+        self.client.put(reverse('cart'), {'items': [{**line, 'size': '44', 'quantity': 1}]}, format='json')
+        response = self.client.post(reverse('order-list'), {'payment_status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('not stocked', response.data['detail'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.sizes, {'42': 1, '43': 3})
+        self.assertEqual(self.product.stock_quantity, 4)
+
+    def test_cancel_order_restocks_items_whose_variant_was_removed(self):
+        self.client.put(reverse('cart'), {'items': [
+            {'product': self.product.id, 'size': '43', 'color': 'red', 'quantity': 2},
+        ]}, format='json')
+        order = Order.objects.get(pk=self.client.post(reverse('order-list'), format='json').data['id'])
+        # The size is dropped and listed again, which replaces its variant.
+        self.product.sizes = {"42": 5}
+        self.product.save()
+        self.product.sizes = {"42": 5, "43": 0}
+        self.product.save()
+        self.assertIsNone(order.items.get().variant_id)
+
+        self.assertTrue(cancel_order(order))
+        self.assertFalse(cancel_order(order))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.sizes, {'42': 5, '43': 2})
+
+    def test_order_detail_conditional_get(self):
+        order = Order.objects.create(
+            user=self.user, order_number='COND00000001', status='pending',
+            total_amount=100, shipping_address='123 Test St', payment_status='pending',
+        )
+        url = reverse('order-detail', args=[order.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        order.status = 'shipped'
+        order.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+        list_url = reverse('order-list')
+        etag = self.client.get(list_url)['ETag']
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
     def test_order_creation_with_empty_cart_fails(self):
         # First create an empty cart
         cart_url = reverse('cart')
@@ -197,6 +379,22 @@ class TestOrderAppViews(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['status'], 'ok')
 
+    def test_payment_webhook_does_not_reopen_cancelled_orders(self):
+        self.client.put(reverse('cart'), {'items': [
+            {'product': self.product.id, 'size': '42', 'color': 'red', 'quantity': 2},
+        ]}, format='json')
+        order = Order.objects.get(pk=self.client.post(reverse('order-list'), {}, format='json').data['id'])
+        Payment.objects.create(order=order, payment_order_id='webhook-test', paymob_payment_id='12345', status='PENDING')
+        cancel_order(order)
+
+        response = self.client.post(reverse('payment-webhook'), {'order_id': '12345', 'success': 'true'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'ignored')
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payment_status), ('cancelled', 'pending'))
+        self.assertEqual(Payment.objects.get().status, 'SUCCESS')
+        self.assertEqual(self.product.variants.get(size='42').stock, 5)
+
     def test_cart_requires_authentication(self):
         client = APIClient()  # Not authenticated
         url = reverse('cart')
@@ -267,3 +465,224 @@ class TestOrderAppViews(TestCase):
         response = self.client.post(create_url, order_data, format='json')
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert 'not available' in response.data['detail'].lower()
+
+
+class LocalRedis:
+    """
+    The subset of the Redis client the cart backend uses, in process memory.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def encode(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def hgetall(self, key):
+        with self.lock:
+            return dict(self.data.get(key, {}))
+
+    def hset(self, key, name=None, value=None, mapping=None):
+        with self.lock:
+            values = self.data.setdefault(key, {})
+            items = dict(mapping or {})
+            if name is not None:
+                items[name] = value
+            added = sum(self.encode(name) not in values for name in items)
+            values.update({self.encode(name): self.encode(value) for name, value in items.items()})
+            return added
+
+    def hsetnx(self, key, name, value):
+        with self.lock:
+            values = self.data.setdefault(key, {})
+            if self.encode(name) in values:
+                return 0
+            values[self.encode(name)] = self.encode(value)
+            return 1
+
+    def hincrby(self, key, name, amount=1):
+        with self.lock:
+            values = self.data.setdefault(key, {})
+            result = int(values.get(self.encode(name), 0)) + amount
+            values[self.encode(name)] = self.encode(result)
+            return result
+
+    def hdel(self, key, *names):
+        with self.lock:
+            values = self.data.get(key, {})
+            return sum(values.pop(self.encode(name), None) is not None for name in names)
+
+    def delete(self, *keys):
+        with self.lock:
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def sadd(self, key, *members):
+        with self.lock:
+            values = self.data.setdefault(key, set())
+            added = {self.encode(member) for member in members} - values
+            values.update(added)
+            return len(added)
+
+    def spop(self, key, count=None):
+        with self.lock:
+            values = self.data.get(key, set())
+            popped = [values.pop() for _ in range(min(count or 1, len(values)))]
+            return popped if count is not None else (popped[0] if popped else None)
+
+    def pipeline(self, transaction=True):
+        return LocalRedisPipeline(self)
+
+
+class LocalRedisPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in commands]
+
+
+class UnreachableRedis:
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise RedisConnectionError('Connection refused')
+        return fail
+
+
+@override_settings(CART_BACKEND='redis')
+class RedisCartBackendTestCase(TestCase):
+    def setUp(self):
+        self.redis = LocalRedis()
+        redis_patcher = patch.object(cart_backends, 'get_redis_connection', return_value=self.redis)
+        redis_patcher.start()
+        self.addCleanup(redis_patcher.stop)
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='cartuser@example.com', username='cartuser', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name="Sneakers")
+        self.product = Product.objects.create(
+            name="Test Shoe", brand="Test Brand", description="A test shoe.", price=100.00,
+            sizes={"42": 5}, colors={"red": 2}, category=self.category, stock_quantity=10,
+        )
+        self.other = Product.objects.create(
+            name="Other Shoe", brand="Test Brand", description="Shoe.", price=30.00, category=self.category,
+            stock_quantity=10,
+        )
+        country = Country.objects.create(name="Country", iso2="CO")
+        state = State.objects.create(name="State", country=country)
+        UserProfile.objects.create(
+            user=self.user, address="123 Test St", country=country, state=state,
+            city=City.objects.create(name="City", state=state),
+        )
+
+    def test_cart_writes_stay_in_redis_until_flushed(self):
+        line = {'product': self.product.id, 'size': '42', 'color': 'red'}
+        response = self.client.put(reverse('cart'), {'items': [{**line, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for _ in range(3):
+            response = self.client.patch(reverse('cart-line'), {**line, 'delta': 1}, format='json')
+        self.assertEqual(response.data['item']['quantity'], 4)
+        self.client.patch(reverse('cart-line'), {'product': self.other.id, 'size': '40', 'color': '', 'quantity': 2},
+                          format='json')
+
+        response = self.client.get(reverse('cart'))
+        self.assertEqual(float(response.data['total_amount']), 460.00)
+        self.assertEqual(response.data['items'][0]['variant'], self.product.variants.get(size='42').id)
+        self.assertFalse(CartItem.objects.exists())
+
+        self.assertEqual(cart_backends.flush_dirty_carts(), 1)
+        self.assertEqual(
+            set(CartItem.objects.values_list('product_id', 'quantity')), {(self.product.id, 4), (self.other.id, 2)}
+        )
+        self.assertEqual(cart_backends.flush_dirty_carts(), 0)
+
+        # A product deleted before the flush is dropped from the stored cart.
+        self.client.patch(reverse('cart-line'), {**line, 'delta': -4}, format='json')
+        self.other.delete()
+        cart_backends.flush_dirty_carts()
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_cart_missing_from_redis_is_loaded_from_the_database(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, size='42', color='red', quantity=3, price=100)
+        response = self.client.patch(
+            reverse('cart-line'), {'product': self.product.id, 'size': '42', 'color': 'red', 'delta': 1}, format='json'
+        )
+        self.assertEqual(response.data['item']['quantity'], 4)
+        self.assertEqual(response.data['total_amount'], 400)
+        self.assertEqual(self.client.get(reverse('cart')).data['id'], cart.id)
+
+    def test_order_creation_reads_and_clears_the_redis_cart(self):
+        self.client.put(reverse('cart'), {'items': [
+            {'product': self.product.id, 'size': '42', 'color': 'red', 'quantity': 2},
+            {'product': self.other.id, 'size': '40', 'color': '', 'quantity': 1},
+        ]}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('order-list'), {'payment_status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.total_amount, 230)
+        self.assertEqual(
+            set(order.items.values_list('product_id', 'quantity')), {(self.product.id, 2), (self.other.id, 1)}
+        )
+        self.assertEqual(self.client.get(reverse('cart')).data['items'], [])
+
+        cart_backends.flush_dirty_carts()
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_order_placement_during_redis_outage_places_nothing(self):
+        self.client.put(reverse('cart'), {'items': [
+            {'product': self.product.id, 'size': '42', 'color': 'red', 'quantity': 2},
+        ]}, format='json')
+        cart_backends.flush_dirty_carts()
+        self.client.patch(
+            reverse('cart-line'), {'product': self.product.id, 'size': '42', 'color': 'red', 'delta': 1}, format='json'
+        )
+
+        # The stale database copy (2 pairs) is not ordered while Redis is down.
+        with patch.object(cart_backends, 'get_redis_connection', return_value=UnreachableRedis()):
+            response = self.client.post(reverse('order-list'), {'payment_status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        # Nor is the cart when Redis fails while clearing it.
+        failing_writes = patch.object(
+            LocalRedisPipeline, 'execute', side_effect=RedisConnectionError('Connection refused')
+        )
+        with failing_writes:
+            response = self.client.post(reverse('order-list'), {'payment_status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.product.variants.get(size='42').stock, 5)
+
+        cart_backends.flush_dirty_carts()
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+        response = self.client.post(reverse('order-list'), {'payment_status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Order.objects.get().items.get().quantity, 3)
+        cart_backends.flush_dirty_carts()
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_unreachable_redis_falls_back_to_the_database(self):
+        with patch.object(cart_backends, 'get_redis_connection', return_value=UnreachableRedis()):
+            response = self.client.put(reverse('cart'), {'items': [
+                {'product': self.product.id, 'size': '42', 'color': 'red', 'quantity': 2},
+            ]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(CartItem.objects.get().quantity, 2)
+            response = self.client.patch(
+                reverse('cart-line'), {'product': self.product.id, 'size': '42', 'color': 'red', 'delta': 1},
+                format='json',
+            )
+            self.assertEqual(response.data['item']['quantity'], 3)
@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import CartView, OrderListCreateAPIView, OrderDetailAPIView, PaymentCheckoutView, PaymentWebhookView, OrderStatusView
+from .views import CartView, CartLineView, OrderListCreateAPIView, OrderDetailAPIView, PaymentCheckoutView, PaymentWebhookView, OrderStatusView
 
 urlpatterns = [
     path('cart/', CartView.as_view(), name='cart'),
+    path('cart/items/', CartLineView.as_view(), name='cart-line'),
     path('orders/', OrderListCreateAPIView.as_view(), name='order-list'),
     path('orders/<int:order_id>/', OrderDetailAPIView.as_view(), name='order-detail'),
     path('checkout/<int:order_id>/', PaymentCheckoutView.as_view(), name='payment-checkout'),
@@ -3,10 +3,13 @@ from rest_framework import generics, status, viewsets, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from .models import Cart, CartItem, Order, OrderItem, Payment
-from .serializers import CartSerializer, OrderSerializer, PaymentSerializer, UserInfoSerializer
-from Prouducts.models import Product
+from .models import Order, OrderItem, Payment
+from .cart_backends import CartUnavailable, get_cart_backend
+from .placement import OrderPlacementError, place_order
+from .serializers import CartItemSerializer, CartLineUpdateSerializer, CartReplaceSerializer, CartSerializer, OrderSerializer, PaymentSerializer, UserInfoSerializer
+from Prouducts.conditional import ConditionalGetMixin, list_validators, object_validators
 from django.db import transaction
+from django.utils import timezone
 from django.utils.crypto import get_random_string
 from django.views.generic import View
 from django.http import HttpResponse
@@ -26,10 +29,6 @@ logger = logging.getLogger(__name__)
 class CartView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_cart(self, user):
-        cart, created = Cart.objects.get_or_create(user=user)
-        return cart
-
     @swagger_auto_schema(
         operation_description="Get user's cart",
         responses={
@@ -38,12 +37,11 @@ class CartView(APIView):
         }
     )
     def get(self, request):
-        cart = self.get_cart(request.user)
-        serializer = CartSerializer(cart)
+        serializer = CartSerializer(get_cart_backend().get(request.user))
         return Response(serializer.data)
 
     @swagger_auto_schema(
-        operation_description="Update cart with new items",
+        operation_description="Replace the cart's items. Only the lines that differ are written",
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             required=['items'],
@@ -66,28 +64,16 @@ class CartView(APIView):
         ),
         responses={
             200: CartSerializer,
+            400: openapi.Response(description="Invalid items"),
             401: openapi.Response(description="Unauthorized"),
             404: openapi.Response(description="Product not found")
         }
     )
     def put(self, request):
-        cart = self.get_cart(request.user)
-        # Remove existing items
-        cart.items.all().delete()
-        items_data = request.data.get('items', [])
-        for item in items_data:
-            product = get_object_or_404(Product, pk=item['product'])
-            CartItem.objects.create(
-                cart=cart,
-                product=product,
-                size=item['size'],
-                color=item['color'],
-                quantity=item['quantity'],
-                price=item.get('price', product.price)
-            )
-        cart.refresh_from_db()
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        serializer = CartReplaceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart = get_cart_backend().replace(request.user, serializer.validated_data.get('items', []))
+        return Response(CartSerializer(cart).data)
 
     @swagger_auto_schema(
         operation_description="Clear all items from cart",
@@ -97,26 +83,61 @@ class CartView(APIView):
         }
     )
     def delete(self, request):
-        cart = self.get_cart(request.user)
-        cart.items.all().delete()
-        cart.refresh_from_db()
-        serializer = CartSerializer(cart)
+        serializer = CartSerializer(get_cart_backend().clear(request.user))
         return Response(serializer.data)
 
-class OrderListCreateAPIView(APIView):
+class CartLineView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     @swagger_auto_schema(
-        operation_description="Get user's order history",
+        operation_description="Change one cart line, identified by product, size and color: set its quantity "
+                              "(0 removes it) or add delta to it (negative to take away). Returns only that line "
+                              "and the new cart total",
+        request_body=CartLineUpdateSerializer,
+        responses={
+            200: openapi.Response(
+                description="The line after the change (null once removed) and the cart total",
+                schema=openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'item': openapi.Schema(type=openapi.TYPE_OBJECT, x_nullable=True),
+                        'total_amount': openapi.Schema(type=openapi.TYPE_NUMBER)
+                    }
+                )
+            ),
+            400: openapi.Response(description="Invalid line or quantities"),
+            401: openapi.Response(description="Unauthorized")
+        }
+    )
+    def patch(self, request):
+        serializer = CartLineUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        line, total = get_cart_backend().update_line(request.user, **serializer.validated_data)
+        return Response({
+            'item': CartItemSerializer(line).data if line else None,
+            'total_amount': total,
+        })
+
+class OrderListCreateAPIView(ConditionalGetMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_validators(self):
+        return list_validators(self.request, Order.objects.filter(user=self.request.user))
+
+    @swagger_auto_schema(
+        operation_description="Get user's order history. Supports If-None-Match / If-Modified-Since",
         responses={
             200: OrderSerializer(many=True),
+            304: openapi.Response(description="Not modified"),
             401: openapi.Response(description="Unauthorized")
         }
     )
     def get(self, request):
-        orders = Order.objects.filter(user=request.user).order_by('-created_at')
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        def respond():
+            orders = Order.objects.filter(user=request.user).order_by('-created_at')
+            serializer = OrderSerializer(orders, many=True)
+            return Response(serializer.data)
+        return self.conditional_response(request, respond)
 
     @swagger_auto_schema(
         operation_description="Create a new order from cart",
@@ -137,58 +158,51 @@ class OrderListCreateAPIView(APIView):
                     }
                 )
             ),
-            401: openapi.Response(description="Unauthorized")
+            401: openapi.Response(description="Unauthorized"),
+            503: openapi.Response(description="Cart store unavailable, nothing was ordered")
         }
     )
-    @transaction.atomic
     def post(self, request):
-        cart = get_object_or_404(Cart, user=request.user)
-        cart_items = cart.items.all()
         user_info = get_object_or_404(UserProfile, user=request.user)
-        if not cart_items:
-            return Response({'detail': 'Cart is empty.'}, status=status.HTTP_400_BAD_REQUEST)
-        total = 0
-        for item in cart_items:
-            product = item.product
-            if not product.is_available:
-                return Response({'detail': f'Product {product.name} is not available.'}, status=status.HTTP_400_BAD_REQUEST)
-            total += item.price * item.quantity
-        order = Order.objects.create(
-            user=request.user,
-            order_number=get_random_string(12),
-            status='pending',
-            total_amount=total,
-            shipping_address=user_info.address,
-            payment_status=request.data.get('payment_status', 'pending'),
-        )
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                size=item.size,
-                color=item.color,
-                quantity=item.quantity,
-                price_at_purchase=item.price
+        try:
+            order = place_order(
+                request.user, get_cart_backend(), user_info.address,
+                payment_status=request.data.get('payment_status', 'pending'),
+            )
+        except OrderPlacementError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        except CartUnavailable as error:
+            logger.warning('Order not placed: %s', error, exc_info=True)
+            return Response(
+                {'detail': 'Your cart is unavailable right now. Please try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
             )
-        cart.items.all().delete()
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-class OrderDetailAPIView(APIView):
+class OrderDetailAPIView(ConditionalGetMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_validators(self):
+        return object_validators(
+            self.request, Order.objects.filter(pk=self.kwargs['order_id'], user=self.request.user)
+        )
+
     @swagger_auto_schema(
-        operation_description="Get specific order details",
+        operation_description="Get specific order details. Supports If-None-Match / If-Modified-Since",
         responses={
             200: OrderSerializer,
+            304: openapi.Response(description="Not modified"),
             401: openapi.Response(description="Unauthorized"),
             404: openapi.Response(description="Order not found")
         }
     )
     def get(self, request, order_id):
-        order = get_object_or_404(Order, pk=order_id, user=request.user)
-        serializer = OrderSerializer(order)
-        return Response(serializer.data)
+        def respond():
+            order = get_object_or_404(Order, pk=order_id, user=request.user)
+            serializer = OrderSerializer(order)
+            return Response(serializer.data)
+        return self.conditional_response(request, respond)
 
 
     
@@ -315,7 +329,7 @@ class PaymentWebhookView(APIView):
         ),
         responses={
             200: openapi.Response(
-                description="Webhook processed successfully",
+                description="Webhook processed successfully; status is 'ignored' for cancelled orders",
                 schema=openapi.Schema(
                     type=openapi.TYPE_OBJECT,
                     properties={
@@ -355,14 +369,17 @@ class PaymentWebhookView(APIView):
                 payment.status = "SUCCESS" if success else "FAILED"
                 payment.error_messages = error_msg
                 payment.save()
-                # Update order status
-                if success:
-                    payment.order.status = 'paid'
-                    payment.order.payment_status = 'paid'
-                else:
-                    payment.order.status = 'pending'
-                    payment.order.payment_status = 'pending'
-                payment.order.save()
+                # Update order status. A cancelled order's stock has been put
+                # back, so a late or replayed webhook must not reopen it.
+                new_status = 'paid' if success else 'pending'
+                if not Order.objects.filter(pk=payment.order_id).exclude(status='cancelled').update(
+                    status=new_status, payment_status=new_status, updated_at=timezone.now()
+                ):
+                    logger.warning(
+                        f"Webhook for Paymob order {paymob_order_id} ignored: order {payment.order_id} is cancelled "
+                        f"(success={success})"
+                    )
+                    return Response({"status": "ignored"}, status=status.HTTP_200_OK)
             logger.info(f"Webhook received for Paymob order {paymob_order_id}: success={success}")
             return Response({"status": "ok"}, status=status.HTTP_200_OK)
         except Exception as e:
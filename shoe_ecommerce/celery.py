@@ -0,0 +1,28 @@
+import os
+
+from celery import Celery
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shoe_ecommerce.settings')
+
+app = Celery('shoe_ecommerce')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+
+@register()
+def check_broker(app_configs, **kwargs):
+    """
+    Tasks sent to the in-memory transport are never picked up by a worker.
+    """
+    if settings.CELERY_TASK_ALWAYS_EAGER or not settings.CELERY_BROKER_URL.startswith('memory://'):
+        return []
+    message = (
+        'No Celery broker is configured: background tasks such as image renditions '
+        'are queued in process memory and never run.'
+    )
+    hint = 'Set REDIS_URL, or CELERY_TASK_ALWAYS_EAGER=True to run tasks inside the request.'
+    if settings.PRODUCTION:
+        return [Error(message, hint=hint, id='shoe_ecommerce.E001')]
+    return [Warning(message, hint=hint, id='shoe_ecommerce.W001')]
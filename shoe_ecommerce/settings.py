@@ -88,7 +88,8 @@ WSGI_APPLICATION = 'shoe_ecommerce.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
-if config('PRODUCTION')=='True':
+PRODUCTION = config('PRODUCTION') == 'True'
+if PRODUCTION:
     if config('PRODUCTION_HOST')=='vercel':
         DATABASES = {
         'default': {
@@ -177,6 +178,56 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# Cache
+# Redis when REDIS_URL is set (production), per-process memory otherwise (dev and tests)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': REDIS_URL,
+            'OPTIONS': {
+                'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+                # A Redis outage degrades to cache misses instead of errors
+                'IGNORE_EXCEPTIONS': True,
+            },
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a cached catalog response lives; writes invalidate it earlier
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# Memory budget of each process's autocomplete index; the lowest-ranked
+# products are left out of larger catalogs
+AUTOCOMPLETE_MAX_BYTES = config('AUTOCOMPLETE_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+# Rebuild a stale autocomplete index in a background thread, serving the old
+# one meanwhile, instead of inside the request
+AUTOCOMPLETE_BACKGROUND_REFRESH = config('AUTOCOMPLETE_BACKGROUND_REFRESH', default=True, cast=bool)
+
+# Cart storage: 'redis' (flushed to the database by the beat) or 'database'
+CART_BACKEND = config('CART_BACKEND', default='redis' if REDIS_URL else 'database')
+# Seconds between writes of changed Redis carts to the database
+CART_FLUSH_INTERVAL = config('CART_FLUSH_INTERVAL', default=60, cast=int)
+
+# Celery (see Procfile worker and beat), with Redis as the broker. Without
+# REDIS_URL, set CELERY_TASK_ALWAYS_EAGER=True to run tasks inline (tests and
+# local development); otherwise a system check warns, or fails in production.
+CELERY_BROKER_URL = REDIS_URL or 'memory://'
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    'flush-carts': {
+        'task': 'orders.tasks.flush_carts',
+        'schedule': CART_FLUSH_INTERVAL,
+    },
+}
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),  # Short-lived access token